@@ -0,0 +1,255 @@
+"""
+Benchmark suite measuring how building, address lookups and parsing scale with the size of the ELF.
+
+Every case runs in a fresh interpreter, so its peak RSS isn't affected by previous cases. Each result holds the
+wall time of the measured operation (setup excluded), the peak RSS of the process before and after it, the peak
+amount of bytes allocated by Python during it (measured using tracemalloc in a second, untimed run), the amount of
+bytes copied into the output by Python and by the kernel (the `bytes_written`/`bytes_kernel_copied` counters of
+`Stats`, for cases producing an ELF) and the size of the produced ELF. Cases which fail (e.g. due to ELF format
+limits) are reported with their error.
+
+Usage:
+    python benchmarks/bench_scale.py [-o results.json] [--cases PATTERN ...] [--scale 0.1]
+    python benchmarks/bench_scale.py --compare before.json after.json
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+from simpleelf import elf_consts
+from simpleelf.elf_builder import ElfBuilder
+from simpleelf.elf_file import ElfFile
+from simpleelf.elf_structs import get_elf_structs
+from simpleelf.stats import Stats
+
+Case = namedtuple('Case', ['name', 'setup', 'run'])
+
+VARIANTS = [(elf_class, endianity) for elf_class in (elf_consts.ELFCLASS32, elf_consts.ELFCLASS64)
+            for endianity in '<>']
+SEGMENT_SIZE = 0x100
+PAYLOAD_SIZE = 1 << 30
+PAYLOAD_SEGMENTS = 4
+
+
+def make_builder(elf_class: int, endianity: str) -> ElfBuilder:
+    e = ElfBuilder(elf_class)
+    e.set_endianity(endianity)
+    e.set_machine(elf_consts.EM_ARM)
+    return e
+
+
+def generate_segments(elf_class: int, endianity: str, count: int) -> ElfBuilder:
+    """ Builder with `count` small segments, each holding a code section """
+    e = make_builder(elf_class, endianity)
+    payload = bytes(range(256)) * (SEGMENT_SIZE // 256)
+    for i in range(count):
+        address = 0x10000 + i * 0x1000
+        e.add_segment(address, payload, elf_consts.PF_R | elf_consts.PF_X)
+        e.add_code_section(address, SEGMENT_SIZE)
+    return e
+
+
+def generate_sections(elf_class: int, endianity: str, count: int) -> ElfBuilder:
+    """ Builder with a single segment and `count` named code sections inside it """
+    e = make_builder(elf_class, endianity)
+    e.add_segment(0x10000, b'\x00' * (count * 0x10), elf_consts.PF_R | elf_consts.PF_X)
+    for i in range(count):
+        e.add_code_section(0x10000 + i * 0x10, 0x10, name=f'.text.{i}')
+    return e
+
+
+def generate_payload(elf_class: int, endianity: str, size: int, directory: str) -> ElfBuilder:
+    """ Builder with `size` bytes of file-backed segments, read from a sparse file """
+    path = os.path.join(directory, 'payload.bin')
+    with open(path, 'wb') as f:
+        f.truncate(size)
+    e = make_builder(elf_class, endianity)
+    segment_size = size // PAYLOAD_SEGMENTS
+    for i in range(PAYLOAD_SEGMENTS):
+        e.add_segment_from_file(0x10000000 * (i + 1), path, offset=i * segment_size, size=segment_size)
+    return e
+
+
+def parse_construct(elf_class: int, endianity: str, raw: bytes):
+    structs = get_elf_structs(endianity)
+    return (structs.Elf32 if elf_class == elf_consts.ELFCLASS32 else structs.Elf64).parse(raw)
+
+
+def parse_lazy(raw: bytes, stats: Stats) -> int:
+    elf = ElfFile.from_buffer(raw, stats)
+    return sum(segment.p_filesz for segment in elf.segments()) + sum(1 for _ in elf.sections())
+
+
+def get_cases(scale: float, directory: str) -> dict:
+    def scaled(count: int) -> int:
+        return max(int(count * scale), 1)
+
+    cases = []
+    for label, count in (('1k', 1000), ('10k', 10000), ('100k', 100000)):
+        count = scaled(count)
+        cases.append(Case(
+            f'build-segments-{label}',
+            lambda elf_class, endianity, count=count: generate_segments(elf_class, endianity, count),
+            lambda e, stats: len(e.build(stats))))
+        cases.append(Case(
+            f'find_loaded_data-{label}',
+            lambda elf_class, endianity, count=count: generate_segments(elf_class, endianity, count),
+            lambda e, stats, count=count: sum(1 for i in range(count)
+                                              if e.find_loaded_data(0x10000 + i * 0x1000 + 8, 8))))
+        cases.append(Case(
+            f'find_loaded_data_many-{label}',
+            lambda elf_class, endianity, count=count: generate_segments(elf_class, endianity, count),
+            lambda e, stats, count=count: len(
+                e.find_loaded_data_many((0x10000 + i * 0x1000 + 8 for i in range(count)), 8))))
+        cases.append(Case(
+            f'parse-construct-segments-{label}',
+            lambda elf_class, endianity, count=count: (
+                elf_class, endianity, generate_segments(elf_class, endianity, count).build()),
+            lambda args, stats: len(parse_construct(*args).segments)))
+        cases.append(Case(
+            f'parse-lazy-segments-{label}',
+            lambda elf_class, endianity, count=count: generate_segments(elf_class, endianity, count).build(),
+            parse_lazy))
+
+    count = scaled(100000)
+    cases.append(Case(
+        'build-sections-100k',
+        lambda elf_class, endianity: generate_sections(elf_class, endianity, count),
+        lambda e, stats: len(e.build(stats))))
+    cases.append(Case(
+        'parse-lazy-sections-100k',
+        lambda elf_class, endianity: generate_sections(elf_class, endianity, count).build(),
+        parse_lazy))
+
+    size = scaled(PAYLOAD_SIZE)
+    output = os.path.join(directory, 'out.elf')
+    cases.append(Case(
+        'write_to-payload-1g',
+        lambda elf_class, endianity: generate_payload(elf_class, endianity, size, directory),
+        lambda e, stats: (e.write_to(output, stats), os.path.getsize(output))[1]))
+    return {case.name: case for case in cases}
+
+
+def peak_rss() -> int:
+    """ Peak resident set size of the current process, in bytes """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in kilobytes, except for macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_case(name: str, elf_class: int, endianity: str, scale: float) -> dict:
+    result = {'case': name, 'elf_class': elf_class, 'endianity': endianity, 'scale': scale}
+    with tempfile.TemporaryDirectory() as directory:
+        case = get_cases(scale, directory)[name]
+        try:
+            target = case.setup(elf_class, endianity)
+            result['setup_peak_rss'] = peak_rss()
+
+            stats = Stats()
+            start = time.perf_counter()
+            result['output'] = case.run(target, stats)
+            result['wall_time'] = time.perf_counter() - start
+            result['peak_rss'] = peak_rss()
+            result['bytes_written'] = stats.counters.get('bytes_written', 0)
+            result['bytes_kernel_copied'] = stats.counters.get('bytes_kernel_copied', 0)
+
+            tracemalloc.start()
+            case.run(target, Stats())
+            result['peak_alloc'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        except Exception as e:
+            result['error'] = f'{e.__class__.__name__}: {e}'
+    return result
+
+
+def run_all(patterns, scale: float, variants) -> list:
+    names = [name for name in get_cases(scale, tempfile.gettempdir())
+             if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+    results = []
+    for name in names:
+        for elf_class, endianity in variants:
+            output = subprocess.run([sys.executable, __file__, '--child', name, str(elf_class), endianity, str(scale)],
+                                    stdout=subprocess.PIPE, check=True).stdout
+            result = json.loads(output)
+            results.append(result)
+            if 'error' in result:
+                status = result['error']
+            else:
+                status = f'{result["wall_time"]:10.3f}s {result["peak_rss"] >> 20:8d}MB rss ' \
+                         f'{result["peak_alloc"] >> 20:8d}MB alloc {result["bytes_written"] >> 20:8d}MB written ' \
+                         f'{result["bytes_kernel_copied"] >> 20:8d}MB kernel copied'
+            print(f'{name:<36}{elf_class * 32:>4}{endianity:>3} {status}', file=sys.stderr)
+    return results
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'timestamp': time.time()}
+
+
+def compare(before_path: str, after_path: str) -> None:
+    def load(path):
+        with open(path) as f:
+            return {(result['case'], result['elf_class'], result['endianity']): result
+                    for result in json.load(f)['results']}
+
+    before = load(before_path)
+    after = load(after_path)
+    metrics = ('wall_time', 'peak_rss', 'peak_alloc', 'bytes_written', 'bytes_kernel_copied')
+    print(f'{"case":<36}{"bits":>5}{"":>3}{"time":>10}{"rss":>10}{"alloc":>10}{"written":>10}{"copied":>10}')
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        if 'error' in old or 'error' in new:
+            ratios = ['error' if 'error' in new else 'fixed'] * len(metrics)
+        else:
+            # results of older runs may lack the copy counters
+            ratios = [f'{new[metric] / old[metric]:.2f}x' if old.get(metric) and metric in new else '-'
+                      for metric in metrics]
+        print(f'{key[0]:<36}{key[1] * 32:>5}{key[2]:>3}' + ''.join(f'{ratio:>10}' for ratio in ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help='write the results as JSON into this file')
+    parser.add_argument('--cases', nargs='+', default=['*'], help='glob patterns of cases to run')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the amount of segments/sections/payload')
+    parser.add_argument('--variants', nargs='+', default=[f'{c * 32}{e}' for c, e in VARIANTS],
+                        help='ELF variants to run, e.g. 32< 64>')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two results files')
+    parser.add_argument('--child', nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        name, elf_class, endianity, scale = args.child
+        print(json.dumps(run_case(name, int(elf_class), endianity, float(scale))))
+        return
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    variants = [(int(variant[:2]) // 32, variant[2:]) for variant in args.variants]
+    report = {'metadata': metadata(), 'results': run_all(args.cases, args.scale, variants)}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
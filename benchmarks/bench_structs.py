@@ -0,0 +1,67 @@
+"""
+Micro-benchmark for the per-build and per-parse overhead of the ELF structs.
+
+"before" rows construct a fresh ElfStructs for every operation (as ElfBuilder used to do), "after" rows use the
+shared instances handed out by `get_elf_structs()`, its compiled variant, or the `struct` based ElfCodecs.
+
+The "before" build row builds an equivalent parsed ELF using construct's `Elf64.build()`, as `ElfBuilder.build()`
+itself now packs through ElfCodecs.
+
+Usage: python benchmarks/bench_structs.py [-n NUMBER]
+"""
+import argparse
+import timeit
+
+from simpleelf import elf_consts
+from simpleelf.elf_builder import ElfBuilder
+from simpleelf.elf_codecs import get_elf_codecs
+from simpleelf.elf_structs import ElfStructs, get_elf_structs
+
+
+def build_small_elf() -> bytes:
+    e = ElfBuilder(elf_consts.ELFCLASS64)
+    e.set_endianity('<')
+    e.set_machine(elf_consts.EM_ARM)
+    e.add_segment(0x1000, b'\x00' * 0x100, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_code_section(0x1000, 0x100, name='.text')
+    return e.build()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--number', type=int, default=2000, help='iterations per measurement')
+    args = parser.parse_args()
+
+    elf = build_small_elf()
+    ehdr = elf[:0x40]
+    phdr = elf[0x40:0x40 + 0x38]
+
+    structs = get_elf_structs('<')
+    compiled = get_elf_structs('<', compiled=True)
+    codecs = get_elf_codecs(elf_consts.ELFCLASS64, '<')
+    parsed = structs.Elf64.parse(elf)
+
+    measurements = [
+        ('ElfStructs() (before)', lambda: ElfStructs('<')),
+        ('get_elf_structs() (after)', lambda: get_elf_structs('<')),
+        ('Elf64.build (before)', lambda: ElfStructs('<').Elf64.build(parsed)),
+        ('ElfBuilder build (after)', build_small_elf),
+        ('Elf64_Ehdr.parse (before)', lambda: ElfStructs('<').Elf64_Ehdr.parse(ehdr)),
+        ('Elf64_Ehdr.parse (cached)', lambda: structs.Elf64_Ehdr.parse(ehdr)),
+        ('Elf64_Ehdr.parse (compiled)', lambda: compiled.Elf64_Ehdr.parse(ehdr)),
+        ('Elf64_Ehdr unpack (struct)', lambda: codecs.unpack_ehdr(ehdr)),
+        ('Elf64_PhdrEntry.parse (cached)', lambda: structs.Elf64_PhdrEntry.parse(phdr)),
+        ('Elf64_PhdrEntry.parse (compiled)', lambda: compiled.Elf64_PhdrEntry.parse(phdr)),
+        ('Elf64_Phdr unpack (struct)', lambda: codecs.unpack_phdr(phdr)),
+        ('Elf64.parse (before)', lambda: ElfStructs('<').Elf64.parse(elf)),
+        ('Elf64.parse (cached)', lambda: structs.Elf64.parse(elf)),
+    ]
+
+    print(f'{"measurement":<36}{"usec/op":>12}')
+    for name, func in measurements:
+        elapsed = timeit.timeit(func, number=args.number)
+        print(f'{name:<36}{elapsed / args.number * 1e6:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import asyncio
+import functools
+import os
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Optional, Union
+
+from construct import Container
+
+from simpleelf.elf_builder import ElfBuilder, iter_pieces
+from simpleelf.elf_consts import ELFCLASS32
+from simpleelf.elf_structs import get_elf_structs, identify
+from simpleelf.file_contents import CHUNK_SIZE, FileContents
+from simpleelf.stats import NULL_STATS, Stats
+
+DEFAULT_CONCURRENCY = 4
+
+_default_limiter: Optional['Limiter'] = None
+
+
+class Limiter:
+    """
+    Bounds the amount of operations running at once, and runs their blocking parts on an executor.
+
+    Each `parse_async()`, `build_async()` or `write_to_async()` call holds a slot for its whole duration, and runs at
+    most one blocking job at a time. File I/O is split into chunks, each being a separate job, so a huge operation
+    occupies a single worker and gives the others a chance to run between its chunks.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_CONCURRENCY, executor: Optional[Executor] = None):
+        """
+        :param max_concurrency: Maximal amount of operations running at once
+        :param executor: Executor running the blocking parts (defaults to a thread pool of `max_concurrency` threads)
+        """
+        self.max_concurrency = max_concurrency
+        self._executor = executor
+        # semaphores are bound to an event loop, so keep one per loop the limiter is used from
+        self._semaphores: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = \
+            weakref.WeakKeyDictionary()
+
+    async def __aenter__(self) -> 'Limiter':
+        await self._semaphore().acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._semaphore().release()
+
+    async def run(self, func: Callable, *args):
+        """
+        Run a blocking function on the executor. Doesn't acquire a slot, as it's called by operations holding one.
+
+        :param func: Function to run
+        :param args: Arguments to pass to it
+        :return: The function's return value
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix='simpleelf')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args))
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def shutdown(self) -> None:
+        """ Shut the executor down """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def get_default_limiter() -> Limiter:
+    """ Get the Limiter shared by all calls which aren't given one """
+    global _default_limiter
+    if _default_limiter is None:
+        _default_limiter = Limiter()
+    return _default_limiter
+
+
+async def parse_async(path: Union[str, os.PathLike], limiter: Optional[Limiter] = None,
+                      chunk_size: int = CHUNK_SIZE, stats: Optional[Stats] = None) -> Container:
+    """
+    Coroutine variant of parsing a file using `Elf32.parse()`/`Elf64.parse()` (chosen by the file's class)
+
+    :param path: Path to the ELF
+    :param limiter: Limiter to run under (defaults to the shared one, see `get_default_limiter()`)
+    :param chunk_size: Size of each read
+    :param stats: Stats object to fill with the timings and counters of the parse
+    :return: Parsed ELF
+    """
+    stats = NULL_STATS if stats is None else stats
+    limiter = get_default_limiter() if limiter is None else limiter
+    async with limiter:
+        f = await limiter.run(open, path, 'rb')
+        try:
+            data = bytearray()
+            while True:
+                chunk = await limiter.run(f.read, chunk_size)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            await limiter.run(f.close)
+        parsed = await limiter.run(_parse, data, stats)
+
+    stats.count('segments', len(parsed.segments))
+    stats.count('sections', len(parsed.sections))
+    stats.finish()
+    return parsed
+
+
+async def build_async(builder: ElfBuilder, stats: Optional[Stats] = None, limiter: Optional[Limiter] = None) -> bytes:
+    """
+    Coroutine variant of `ElfBuilder.build()`, see `ElfBuilder.build_async()`
+
+    :param builder: ElfBuilder to build
+    :param stats: Stats object to fill with the timings and counters of the build phases
+    :param limiter: Limiter to run under (defaults to the shared one, see `get_default_limiter()`)
+    :return: ELF data
+    """
+    limiter = get_default_limiter() if limiter is None else limiter
+    async with limiter:
+        return await limiter.run(builder.build, stats)
+
+
+async def write_to_async(builder: ElfBuilder, path: Union[str, os.PathLike], stats: Optional[Stats] = None,
+                         limiter: Optional[Limiter] = None, chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Coroutine variant of `ElfBuilder.write_to()`, see `ElfBuilder.write_to_async()`
+
+    :param builder: ElfBuilder to write
+    :param path: Path of the output file
+    :param stats: Stats object to fill with the timings and counters of the build phases
+    :param limiter: Limiter to run under (defaults to the shared one, see `get_default_limiter()`)
+    :param chunk_size: Size of each write
+    :return: None
+    """
+    stats = NULL_STATS if stats is None else stats
+    limiter = get_default_limiter() if limiter is None else limiter
+    async with limiter:
+        _, pieces = await limiter.run(builder._pack, stats)
+
+        written = 0
+        copied = 0
+        f = await limiter.run(open, path, 'wb')
+        try:
+            for data in iter_pieces(pieces, chunk_size):
+                kernel_copied = await limiter.run(_write_piece, f, data, stats)
+                copied += kernel_copied
+                written += len(data) - kernel_copied
+        finally:
+            await limiter.run(f.close)
+
+    stats.count('bytes_written', written)
+    stats.count('bytes_kernel_copied', copied)
+    stats.finish()
+
+
+def _write_piece(f: BinaryIO, data, stats: Stats) -> int:
+    """ Write a piece within the 'write' phase, so only the write itself is timed. Returns the kernel copied size """
+    with stats.phase('write'):
+        if isinstance(data, FileContents):
+            return data.write_to(f)
+        f.write(data)
+        return 0
+
+
+def _parse(data: bytearray, stats: Stats) -> Container:
+    with stats.phase('parse'):
+        identity = identify(data)
+        structs = get_elf_structs(identity.endianity)
+        return (structs.Elf32 if identity.elf_class == ELFCLASS32 else structs.Elf64).parse(data)
@@ -0,0 +1,234 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Set, Union
+
+from simpleelf import elf_consts
+from simpleelf.elf_codecs import get_counts, get_elf_codecs, uses_extended_numbering
+from simpleelf.elf_structs import IDENTIFY_SIZE, identify
+from simpleelf.exceptions import InvalidElfError
+from simpleelf.stats import NULL_STATS, Stats
+
+ElfSummary = namedtuple('ElfSummary', ['path', 'elf_class', 'endianity', 'header', 'segments', 'sections',
+                                       'section_names'])
+BatchResult = namedtuple('BatchResult', ['path', 'summary', 'error'])
+
+DEFAULT_CHUNKSIZE = 16
+
+
+def summarize(path: Union[str, os.PathLike], stats: Optional[Stats] = None) -> ElfSummary:
+    """
+    Decode an ELF's header, program headers and section headers (including the sections names).
+    Only these tables are read from the file, and they are decoded into plain namedtuples (see `ElfCodecs`), which
+    are cheap to pickle.
+
+    :param path: Path to the ELF
+    :param stats: Stats object to fill with the timings and counters of the parse
+    :return: ElfSummary
+    """
+    stats = NULL_STATS if stats is None else stats
+    path = os.fspath(path)
+    with open(path, 'rb') as f:
+        with stats.phase('header'):
+            identity = identify(f.read(IDENTIFY_SIZE))
+            codecs = get_elf_codecs(identity.elf_class, identity.endianity)
+            header = codecs.unpack_ehdr(_read(f, 0, codecs.ehdr.size))
+            section0 = None
+            if uses_extended_numbering(header):
+                section0 = codecs.unpack_shdr(_read(f, header.e_shoff, codecs.shdr.size))
+            counts = get_counts(header, section0, os.fstat(f.fileno()).st_size)
+        with stats.phase('program_headers'):
+            segments = _read_table(f, codecs.unpack_phdr, codecs.iter_phdrs, codecs.phdr.size, header.e_phoff,
+                                   counts.phnum, header.e_phentsize)
+        with stats.phase('section_headers'):
+            sections = _read_table(f, codecs.unpack_shdr, codecs.iter_shdrs, codecs.shdr.size, header.e_shoff,
+                                   counts.shnum, header.e_shentsize)
+
+        with stats.phase('section_names'):
+            shstrtab = b''
+            if counts.shstrndx != elf_consts.SHN_UNDEF and counts.shstrndx < len(sections):
+                strtab = sections[counts.shstrndx]
+                if strtab.sh_type != elf_consts.SHT_NOBITS:
+                    shstrtab = _read(f, strtab.sh_offset, strtab.sh_size)
+
+            section_names = []
+            for section in sections:
+                end = shstrtab.find(b'\x00', section.sh_name)
+                section_names.append(
+                    shstrtab[section.sh_name:end if end != -1 else len(shstrtab)].decode(errors='replace'))
+
+    stats.count('segments', len(segments))
+    stats.count('sections', len(sections))
+    stats.finish()
+    return ElfSummary(path=path, elf_class=identity.elf_class, endianity=identity.endianity, header=header,
+                      segments=segments, sections=sections, section_names=section_names)
+
+
+def parse_many(paths: Iterable[Union[str, os.PathLike]], workers: Optional[int] = None,
+               chunksize: int = DEFAULT_CHUNKSIZE,
+               journal: Optional[Union[str, os.PathLike]] = None) -> Iterator[BatchResult]:
+    """
+    Summarize many ELFs in parallel, using a pool of processes.
+    Paths are sent to the workers in chunks, and only a bounded amount of chunks is in flight, so `paths` may be a
+    lazy iterable over a huge corpus. Results are yielded as soon as each chunk is done, so they aren't ordered.
+
+    :param paths: Paths to summarize
+    :param workers: Amount of worker processes (defaults to the amount of CPUs). 1 runs in the current process
+    :param chunksize: Amount of paths sent to a worker at once
+    :param journal: Path to a journal file. Each path is recorded there once its result was consumed, and paths
+                    recorded by a previous run (which may have crashed) are skipped
+    :return: Generator of BatchResult, holding either an ElfSummary or a description of the error
+    """
+    paths = (os.fspath(path) for path in paths)
+    journal_file = None
+    if journal is not None:
+        done = _load_journal(journal)
+        paths = (path for path in paths if path not in done)
+        journal_file = open(journal, 'a')
+        if journal_file.tell() and not _ends_with_newline(journal):
+            journal_file.write('\n')
+
+    try:
+        for results in _run_chunks(_chunked(paths, chunksize), workers):
+            for result in results:
+                yield result
+                # record the result only once the consumer is done with it, so it's handled again if it crashed
+                if journal_file is not None:
+                    journal_file.write(json.dumps({'path': result.path, 'error': result.error}) + '\n')
+                    journal_file.flush()
+    finally:
+        if journal_file is not None:
+            journal_file.close()
+
+
+def summary_to_dict(summary: ElfSummary) -> dict:
+    """ Convert an ElfSummary into a JSON serializable dict """
+    header = summary.header._asdict()
+    header['e_ident'] = header['e_ident'].hex()
+    sections = []
+    for name, section in zip(summary.section_names, summary.sections):
+        section = section._asdict()
+        section['name'] = name
+        sections.append(section)
+    return {'path': summary.path, 'class': summary.elf_class, 'endianity': summary.endianity, 'header': header,
+            'segments': [segment._asdict() for segment in summary.segments], 'sections': sections}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Summarize the headers of many ELF files in parallel, printing a '
+                                                 'JSON object per file')
+    parser.add_argument('paths', nargs='+', help='files, or directories to scan recursively')
+    parser.add_argument('-j', '--workers', type=int, help='amount of worker processes (default: CPU count)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help='amount of files sent to a worker at once')
+    parser.add_argument('--journal', help='journal file for resuming an interrupted run')
+    args = parser.parse_args(argv)
+
+    for result in parse_many(_walk(args.paths), workers=args.workers, chunksize=args.chunksize,
+                             journal=args.journal):
+        if result.error is not None:
+            line = {'path': result.path, 'error': result.error}
+        else:
+            line = summary_to_dict(result.summary)
+        sys.stdout.write(json.dumps(line) + '\n')
+
+
+def _summarize_chunk(paths: List[str]) -> List[BatchResult]:
+    results = []
+    for path in paths:
+        try:
+            results.append(BatchResult(path=path, summary=summarize(path), error=None))
+        except Exception as e:
+            # a malformed file must not stop the scan, whatever it fails with
+            results.append(BatchResult(path=path, summary=None, error=f'{e.__class__.__name__}: {e}'))
+    return results
+
+
+def _run_chunks(chunks: Iterator[List[str]], workers: Optional[int]) -> Iterator[List[BatchResult]]:
+    if workers == 1:
+        yield from map(_summarize_chunk, chunks)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # keep every worker busy, without submitting the whole corpus upfront
+        max_pending = workers * 2
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(_summarize_chunk, chunk))
+            if len(pending) >= max_pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result()
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield future.result()
+
+
+def _chunked(iterable: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _load_journal(journal: Union[str, os.PathLike]) -> Set[str]:
+    done = set()
+    try:
+        with open(journal, 'r') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['path'])
+                except (ValueError, KeyError):
+                    # last line may be partial if the previous run crashed while writing it
+                    continue
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _ends_with_newline(path: Union[str, os.PathLike]) -> bool:
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _walk(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                yield os.path.join(root, name)
+
+
+def _read_table(f: BinaryIO, unpack: Callable, iter_entries: Callable, size: int, table_offset: int, count: int,
+                entry_size: int) -> list:
+    """ Read and decode a table of `count` entries, each one `entry_size` bytes after the previous one """
+    if not count:
+        return []
+    data = _read(f, table_offset, (count - 1) * entry_size + size)
+    if entry_size == size:
+        # entries are packed back to back, so decode the whole table in a single pass
+        return list(iter_entries(data, 0, count))
+    return [unpack(data, i * entry_size) for i in range(count)]
+
+
+def _read(f: BinaryIO, offset: int, size: int) -> bytes:
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) != size:
+        raise InvalidElfError(f'range 0x{offset:x}-0x{offset + size:x} is outside of the file')
+    return data
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import os
+import shutil
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Union
+
+from simpleelf.elf_builder import ElfBuilder, content_digest
+from simpleelf.file_contents import FileContents, SegmentContents
+
+DEFAULT_MAX_SIZE = 1 << 30
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+DEFAULT_MEMO_SIZE = 1024
+
+_SUFFIX = '.elf'
+
+
+class BuildCache:
+    """
+    On-disk cache of built ELFs, keyed by `ElfBuilder.fingerprint()`.
+
+    Content digests are memoised, so unchanged inputs are hashed once: FileContents by their file region and the
+    file's size, modification time and inode, and immutable buffers (bytes, or read-only memoryviews over bytes) by
+    their identity. Mutable buffers are hashed on every lookup.
+
+    Entries which weren't used for `max_age` seconds are evicted, and then the least recently used ones, until the
+    cache fits in `max_size` bytes. Using an entry updates its modification time, which also applies to outputs
+    hard-linked to it.
+    """
+
+    def __init__(self, directory: Union[str, os.PathLike], max_size: int = DEFAULT_MAX_SIZE,
+                 max_age: float = DEFAULT_MAX_AGE, memo_size: int = DEFAULT_MEMO_SIZE):
+        """
+        :param directory: Directory holding the entries (created if missing)
+        :param max_size: Maximal total size of the entries, in bytes
+        :param max_age: Maximal time an entry is kept since it was last used, in seconds
+        :param memo_size: Maximal amount of memoised content digests
+        """
+        self.directory = os.fspath(directory)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._memo_size = memo_size
+        self._digests: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} {self.directory} hits={self.hits} misses={self.misses}>'
+
+    def build(self, builder: ElfBuilder) -> bytes:
+        """
+        Same as `builder.build()`, returning the cached output when the builder's state was already built
+
+        :param builder: ElfBuilder
+        :return: ELF data
+        """
+        fingerprint = builder.fingerprint(self.content_digest)
+        entry = self._lookup(fingerprint)
+        if entry is not None:
+            with open(entry, 'rb') as f:
+                return f.read()
+
+        data = builder.build()
+        self._store(fingerprint, lambda path: _write_bytes(path, data))
+        return data
+
+    def write_to(self, builder: ElfBuilder, path: Union[str, os.PathLike], link: bool = True) -> None:
+        """
+        Same as `builder.write_to()`, taking the output from the cache when the builder's state was already built
+
+        :param builder: ElfBuilder
+        :param path: Path of the output file
+        :param link: Hard-link the output to the cache entry when possible, instead of copying it. The output must
+                     then not be modified in-place (e.g. by ElfPatcher), as that would modify the entry as well
+        :return: None
+        """
+        fingerprint = builder.fingerprint(self.content_digest)
+        entry = self._lookup(fingerprint)
+        if entry is None:
+            entry = self._store(fingerprint, builder.write_to)
+
+        temp = f'{os.fspath(path)}.{os.getpid()}.tmp'
+        try:
+            if link:
+                try:
+                    os.link(entry, temp)
+                except OSError:
+                    # e.g. the output is on another filesystem
+                    link = False
+            if not link:
+                shutil.copyfile(entry, temp)
+            os.replace(temp, path)
+        except BaseException:
+            _remove(temp)
+            raise
+
+    def content_digest(self, contents: SegmentContents) -> bytes:
+        """ Same as `simpleelf.elf_builder.content_digest()`, memoising the digests of unchanged contents """
+        key = _memo_key(contents)
+        if key is None:
+            return content_digest(contents)
+
+        memoised = self._digests.get(key)
+        if memoised is not None:
+            self._digests.move_to_end(key)
+            return memoised[1]
+
+        digest = content_digest(contents)
+        # keep a reference to the contents, so their id isn't reused while memoised
+        self._digests[key] = (contents, digest)
+        if len(self._digests) > self._memo_size:
+            self._digests.popitem(last=False)
+        return digest
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Remove expired entries, and then the least recently used ones until the cache fits in `max_size`
+
+        :param keep: Fingerprint of an entry to keep regardless
+        :return: None
+        """
+        entries = []
+        for item in os.scandir(self.directory):
+            if not item.name.endswith(_SUFFIX) or item.name == f'{keep}{_SUFFIX}':
+                continue
+            try:
+                stat = item.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, item.path))
+
+        total = sum(size for _, size, _ in entries)
+        if keep is not None and os.path.exists(self._path(keep)):
+            total += os.path.getsize(self._path(keep))
+
+        expiry = time.time() - self.max_age
+        for mtime, size, path in sorted(entries):
+            if mtime >= expiry and total <= self.max_size:
+                break
+            _remove(path)
+            total -= size
+
+    def clear(self) -> None:
+        """ Remove all entries """
+        for item in os.scandir(self.directory):
+            if item.name.endswith(_SUFFIX):
+                _remove(item.path)
+
+    def _lookup(self, fingerprint: str) -> Optional[str]:
+        entry = self._path(fingerprint)
+        try:
+            # mark the entry as recently used
+            os.utime(entry)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def _store(self, fingerprint: str, write) -> str:
+        """ Create an entry using `write(path)`, making it visible only once it's complete """
+        entry = self._path(fingerprint)
+        temp = f'{entry}.{os.getpid()}.tmp'
+        try:
+            write(temp)
+            os.replace(temp, entry)
+        except BaseException:
+            _remove(temp)
+            raise
+        self.evict(keep=fingerprint)
+        return entry
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, fingerprint + _SUFFIX)
+
+
+def _memo_key(contents: SegmentContents) -> Optional[Hashable]:
+    if isinstance(contents, FileContents):
+        try:
+            stat = os.stat(contents.path)
+        except OSError:
+            return None
+        return ('file', os.path.realpath(contents.path), contents.offset, contents.size, stat.st_size,
+                stat.st_mtime_ns, stat.st_ino, stat.st_dev)
+    if isinstance(contents, bytes) or \
+            (isinstance(contents, memoryview) and contents.readonly and isinstance(contents.obj, bytes)):
+        return ('object', id(contents))
+    return None
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,149 @@
+import io
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional
+
+from simpleelf import elf_consts
+from simpleelf.elf_codecs import get_elf_codecs
+from simpleelf.exceptions import InvalidElfError
+from simpleelf.file_contents import CHUNK_SIZE, FileContents, SegmentContents
+
+DEFAULT_LEVEL = zlib.Z_DEFAULT_COMPRESSION
+
+_ADLER_BASE = 65521
+
+
+def compress(contents: SegmentContents, level: int = DEFAULT_LEVEL, workers: Optional[int] = None,
+             chunk_size: int = CHUNK_SIZE) -> bytes:
+    """
+    Compress contents into a single zlib stream.
+    Contents bigger than `chunk_size` are split into chunks which are compressed independently on a thread pool
+    (zlib releases the GIL while compressing). Each chunk is flushed to a byte boundary, so the compressed chunks can
+    simply be concatenated, and their checksums are combined into the stream's one.
+
+    :param contents: Contents to compress (bytes, bytearray, memoryview, mmap or FileContents)
+    :param level: zlib compression level
+    :param workers: Amount of compressing threads (defaults to `ThreadPoolExecutor`'s default)
+    :param chunk_size: Size of the independently compressed chunks
+    :return: zlib stream
+    """
+    size = len(contents)
+    if size <= chunk_size:
+        return zlib.compress(_read(contents, 0, size), level)
+
+    def compress_chunk(start: int):
+        end = min(start + chunk_size, size)
+        data = _read(contents, start, end)
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if end == size else zlib.Z_SYNC_FLUSH)
+        return compressed, zlib.adler32(data), end - start
+
+    with ThreadPoolExecutor(workers) as executor:
+        chunks = list(executor.map(compress_chunk, range(0, size, chunk_size)))
+
+    checksum = 1
+    for _, chunk_checksum, length in chunks:
+        checksum = _adler32_combine(checksum, chunk_checksum, length)
+    # the zlib header only depends on the compression level
+    header = zlib.compress(b'', level)[:2]
+    return b''.join([header, *(compressed for compressed, _, _ in chunks), struct.pack('>I', checksum)])
+
+
+def compress_section(contents: SegmentContents, elf_class: int, endianity: str = '<', addralign: int = 1,
+                     level: int = DEFAULT_LEVEL, workers: Optional[int] = None) -> bytes:
+    """
+    Build the contents of a SHF_COMPRESSED section: a compression header (Chdr) followed by the zlib stream
+
+    :param contents: Uncompressed contents
+    :param elf_class: Either ELFCLASS32 or ELFCLASS64
+    :param endianity: Either '<' for LE or '>' for BE
+    :param addralign: Alignment of the uncompressed contents
+    :param level: zlib compression level
+    :param workers: Amount of compressing threads, see `compress()`
+    :return: Section contents
+    """
+    codecs = get_elf_codecs(elf_class, endianity)
+    chdr = codecs.make_chdr(ch_type=elf_consts.ELFCOMPRESS_ZLIB, ch_size=len(contents), ch_addralign=addralign)
+    return codecs.pack_chdr(chdr) + compress(contents, level, workers)
+
+
+def open_compressed(data, elf_class: int, endianity: str = '<') -> BinaryIO:
+    """
+    Open the contents of a SHF_COMPRESSED section for reading.
+    Data is decompressed on the fly, as it is read, so it's never held in memory as a whole.
+
+    :param data: Section contents, starting with the compression header
+    :param elf_class: Either ELFCLASS32 or ELFCLASS64
+    :param endianity: Either '<' for LE or '>' for BE
+    :return: Binary file object over the uncompressed contents
+    """
+    codecs = get_elf_codecs(elf_class, endianity)
+    if len(data) < codecs.chdr.size:
+        raise InvalidElfError('compressed section is too small to hold a compression header')
+    chdr = codecs.unpack_chdr(data)
+    if chdr.ch_type != elf_consts.ELFCOMPRESS_ZLIB:
+        raise InvalidElfError(f'unsupported compression type {chdr.ch_type}')
+    return io.BufferedReader(_ZlibReader(memoryview(data)[codecs.chdr.size:], chdr.ch_size), CHUNK_SIZE)
+
+
+def decompress_section(data, elf_class: int, endianity: str = '<') -> bytes:
+    """ Get the whole uncompressed contents of a SHF_COMPRESSED section, see `open_compressed()` """
+    with open_compressed(data, elf_class, endianity) as f:
+        return f.read()
+
+
+class _ZlibReader(io.RawIOBase):
+    """ Raw stream decompressing a zlib stream held in a buffer, consuming it in chunks """
+
+    def __init__(self, data: memoryview, size: int):
+        self._data = data
+        self._size = size
+        self._consumed = 0
+        self._produced = 0
+        self._decompressor = zlib.decompressobj()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast('B')
+        decompressor = self._decompressor
+        while len(view) and not decompressor.eof:
+            data = decompressor.unconsumed_tail
+            if not data:
+                data = self._data[self._consumed:self._consumed + CHUNK_SIZE]
+                if not data:
+                    raise InvalidElfError('compressed section is truncated')
+                self._consumed += len(data)
+            try:
+                decompressed = decompressor.decompress(data, len(view))
+            except zlib.error as e:
+                raise InvalidElfError('failed to decompress section') from e
+            if decompressed:
+                view[:len(decompressed)] = decompressed
+                self._produced += len(decompressed)
+                return len(decompressed)
+
+        if decompressor.eof and self._produced != self._size:
+            raise InvalidElfError(f'decompressed size 0x{self._produced:x} doesn\'t match ch_size 0x{self._size:x}')
+        return 0
+
+    def close(self) -> None:
+        self._data.release()
+        super().close()
+
+
+def _read(contents: SegmentContents, start: int, end: int):
+    if isinstance(contents, FileContents):
+        return contents.read(start, end - start)
+    return memoryview(contents).cast('B')[start:end]
+
+
+def _adler32_combine(first: int, second: int, second_size: int) -> int:
+    """ Get the Adler-32 checksum of two concatenated buffers, given the checksum of each of them """
+    first_low, first_high = first & 0xffff, first >> 16
+    second_low, second_high = second & 0xffff, second >> 16
+    low = (first_low + second_low - 1) % _ADLER_BASE
+    high = (first_high + second_high + second_size * (first_low - 1)) % _ADLER_BASE
+    return (high << 16) | low
@@ -1,14 +1,42 @@
+import hashlib
+import itertools
+import os
+import struct
+from array import array
 from collections import namedtuple
-from typing import Optional, Tuple, Union
-
-from construct import Padding
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
 
 from simpleelf import elf_consts
+from simpleelf.compression import DEFAULT_LEVEL, compress_section
+from simpleelf.elf_codecs import get_elf_codecs
 from simpleelf.elf_consts import ELFCLASS32
-from simpleelf.elf_structs import ElfStructs
+from simpleelf.elf_structs import ElfStructs, get_elf_structs
+from simpleelf.elf_symbols import Symbol
+from simpleelf.exceptions import OverlappingSegmentsError
+from simpleelf.file_contents import CHUNK_SIZE, FileContents, SegmentContents
+from simpleelf.interval_index import IntervalIndex
+from simpleelf.stats import NULL_STATS, Stats
+from simpleelf.string_table import StringTable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Segment = namedtuple('Segment', ['address', 'flags', 'contents', 'memsz'], defaults=(None,))
+Section = namedtuple('Section', ['type', 'name', 'address', 'flags', 'size', 'link', 'info', 'entsize', 'addralign',
+                                 'contents'], defaults=(0, 0, 0, 0x20, None))
+# bumped whenever the output for a given builder state changes, invalidating fingerprints
+FINGERPRINT_VERSION = 1
 
-Segment = namedtuple('Segment', ['address', 'flags', 'contents'])
-Section = namedtuple('Section', ['type', 'name', 'address', 'flags', 'size'])
+ElfLayout = namedtuple('ElfLayout', ['header', 'program_headers', 'section_headers', 'segments_contents',
+                                     'sections_contents'])
+# digests of the whole file, and of each segment's and section's bytes in it, along with the final layout
+Manifest = namedtuple('Manifest', ['size', 'digests', 'header', 'segments', 'sections'])
+ManifestEntry = namedtuple('ManifestEntry', ['offset', 'size', 'digests'])
+# memory range [start, end) where segment `second` overlaps segment `first` (indices in the order they were added)
+SegmentOverlap = namedtuple('SegmentOverlap', ['first', 'second', 'start', 'end'])
 
 
 class ElfBuilder:
@@ -16,26 +44,44 @@ class ElfBuilder:
     def __init__(self, elf_class: int = ELFCLASS32):
         self._class = elf_class
         self._segments = []
+        self._segment_filesizes: Optional[List[int]] = None
+        self._segment_offsets: Optional[List[int]] = None
+        self._shared_segments: Set[int] = set()
+        self._trim_zero_tails = False
+        self._deduplicate_segments = False
+        self._coalesce_segments = False
+        self._coalesced_segments: Optional[List[Segment]] = None
+        self._coalesced_index: Optional[IntervalIndex] = None
+        self._compression_level = DEFAULT_LEVEL
+        self._compression_workers: Optional[int] = None
+        # segments by their address, updated as they are added
+        self._segment_index = IntervalIndex([])
         self._sections = []
         self._e_type = elf_consts.ET_EXEC
         self._machine = 0
         self._entry = 0
         self._endianity = '<'
-        self._structs = ElfStructs(self._endianity)
+        self._structs: ElfStructs = get_elf_structs(self._endianity)
         if elf_class == ELFCLASS32:
             self._e_ehsize = self._structs.Elf32_Ehdr.sizeof()
             self._e_phoff = self._e_ehsize
-            self._e_phentsize = 0x20  # TODO: calculate according to the struct
-            self._e_shentsize = 0x28  # TODO: calculate according to the struct
+            self._e_phentsize = self._structs.Elf32_PhdrEntry.sizeof()
+            self._e_shentsize = self._structs.Elf32_ShdrEntry.sizeof()
         else:
             self._e_ehsize = self._structs.Elf64_Ehdr.sizeof()
             self._e_phoff = self._e_ehsize
-            self._e_phentsize = 0x38  # TODO: calculate according to the struct
-            self._e_shentsize = 0x40  # TODO: calculate according to the struct
-        self._e_phnum = 0
-        self._e_shnum = 0
-        self._e_shoff = self._e_phoff + self._e_phentsize * self._e_phnum
-        self._strtab_text = b'\x00.strtab\x00'
+            self._e_phentsize = self._structs.Elf64_PhdrEntry.sizeof()
+            self._e_shentsize = self._structs.Elf64_ShdrEntry.sizeof()
+        self._strtab = StringTable()
+        self._strtab.add('.strtab')
+        self._symbol_names = []
+        self._symbol_values = array('Q')
+        self._symbol_sizes = array('Q')
+        self._symbol_infos = array('B')
+        self._symbol_others = array('B')
+        # -1 stands for a section index which should be resolved by the symbol's value
+        self._symbol_shndxs = array('l')
+        self._unresolved_symbols = False
 
         self._add_section(self._structs.Elf_SectionType.SHT_NULL, 0, 0, 0, 0)
 
@@ -47,12 +93,66 @@ class ElfBuilder:
         :return: None
         """
         self._endianity = endianity
-        self._structs = ElfStructs(endianity)
+        self._structs = get_elf_structs(endianity)
+
+    def add_segment(self, address: int, contents: SegmentContents, flags: int, memsz: Optional[int] = None) -> None:
+        """
+        Add a PT_LOAD segment.
+        Only a reference to the contents is kept, so memoryview/mmap objects can be used to avoid copying them.
+
+        :param address: Segment's address
+        :param contents: Segment's contents (bytes, bytearray, memoryview, mmap or FileContents)
+        :param flags: Segment's flags (PF_*)
+        :param memsz: Segment's size in memory (defaults to the contents' size). Memory past the contents is
+                      zero-filled by the loader and takes no space in the file
+        :return: None
+        """
+        if memsz is not None and memsz < len(contents):
+            raise ValueError(f'memsz 0x{memsz:x} is smaller than the contents (0x{len(contents):x} bytes)')
+        self._segment_index.insert(address, address + len(contents), len(self._segments))
+        self._segments.append(Segment(address=address, flags=flags, contents=contents, memsz=memsz))
+        self._invalidate_segments()
+
+    def add_segment_from_file(self, address: int, path: Union[str, os.PathLike], offset: int = 0,
+                              size: Optional[int] = None,
+                              flags: int = elf_consts.PF_R | elf_consts.PF_W | elf_consts.PF_X,
+                              memsz: Optional[int] = None) -> None:
+        """
+        Add a PT_LOAD segment whose contents are read lazily from a file (a memory dump for example)
+
+        :param address: Segment's address
+        :param path: Path to the file holding the contents
+        :param offset: Offset of the contents within the file
+        :param size: Size of the contents (defaults to everything from the offset to the end of the file)
+        :param flags: Segment's flags (PF_*)
+        :param memsz: Segment's size in memory (defaults to the contents' size)
+        :return: None
+        """
+        self.add_segment(address, FileContents(path, offset, size), flags, memsz=memsz)
+
+    def find_segment_overlaps(self) -> List[SegmentOverlap]:
+        """
+        Find the segments overlapping in memory, sweeping over the segments sorted by their address (O(n log n)).
+        Each segment overlapping a preceding one is reported once, along with the preceding segment reaching furthest.
 
-    def add_segment(self, address: int, contents: bytes, flags: int) -> None:
-        self._e_phnum += 1
-        self._e_shoff += self._e_phentsize + len(contents)
-        self._segments.append(Segment(address=address, flags=flags, contents=contents))
+        :return: List of SegmentOverlap tuples, sorted by address
+        """
+        intervals = sorted((segment.address, segment.address + _memory_size(segment), i)
+                           for i, segment in enumerate(self._segments) if _memory_size(segment))
+        overlaps = []
+        furthest_end, furthest = None, None
+        for start, end, i in intervals:
+            if furthest is not None and start < furthest_end:
+                overlaps.append(SegmentOverlap(first=furthest, second=i, start=start, end=min(end, furthest_end)))
+            if furthest is None or end > furthest_end:
+                furthest_end, furthest = end, i
+        return overlaps
+
+    def validate_segments(self) -> None:
+        """ Raise OverlappingSegmentsError if any segments overlap in memory, see `find_segment_overlaps()` """
+        overlaps = self.find_segment_overlaps()
+        if overlaps:
+            raise OverlappingSegmentsError(overlaps)
 
     def find_loaded_data(self, address: int, size: Optional[int] = None) -> Optional[Tuple[int, bytes]]:
         """
@@ -62,28 +162,20 @@ class ElfBuilder:
         :param size: Size of data to read from that address
         :return: None of address isn't mapped or a tuple of the offset within the ELF file and the actual data
         """
-        offset = self._e_phoff
-        data = None
-
-        for segment in self._segments:
-            # skip program header
-            offset += self._e_phentsize
-
-            if (segment.address <= address) and (segment.address + len(segment.contents) >= address):
-                offset += address - segment.address
-                data = segment.contents[address - segment.address:]
-            else:
-                if data is None:
-                    # skip current segment contents
-                    offset += len(segment.contents)
+        return self._loaded_data(self._get_segment_index().find(address), address, size)
 
-        if data is None:
-            return None
-
-        if size is not None:
-            data = data[:size]
+    def find_loaded_data_many(self, addresses: Iterable[int], size: Optional[int] = None) \
+            -> List[Optional[Tuple[int, bytes]]]:
+        """
+        Batch variant of `find_loaded_data()`
 
-        return offset, data
+        :param addresses: Addresses to search for
+        :param size: Size of data to read from each address
+        :return: List of results, ordered as `addresses`
+        """
+        addresses = list(addresses)
+        found = self._get_segment_index().find_many(addresses)
+        return [self._loaded_data(interval, address, size) for interval, address in zip(found, addresses)]
 
     def add_code_section(self, address: int, size: int, writeable: bool = False,
                          name: Optional[Union[str, int]] = None) -> None:
@@ -113,6 +205,140 @@ class ElfBuilder:
         self._add_section(self._structs.Elf_SectionType.SHT_NOBITS, address, size,
                           elf_consts.SHF_ALLOC | elf_consts.SHF_WRITE, name=name)
 
+    def add_non_loaded_section(self, name: Union[str, int], contents: SegmentContents,
+                               type_: int = elf_consts.SHT_PROGBITS, flags: int = 0, addralign: int = 1,
+                               compress: bool = False) -> None:
+        """
+        Add a section whose contents reside only in the ELF file and aren't loaded into memory (debug info, logs...)
+
+        :param name: Section's name (either a string name, or an offset from .strtab)
+        :param contents: Section's contents (bytes, bytearray, memoryview, mmap or FileContents)
+        :param type_: Section's type (SHT_*)
+        :param flags: Section's flags (SHF_*, without SHF_ALLOC)
+        :param addralign: Section's alignment
+        :param compress: Store the contents compressed (SHF_COMPRESSED), see `set_compression()`
+        :return: None
+        """
+        if flags & elf_consts.SHF_ALLOC:
+            raise ValueError('non-loaded sections cannot be SHF_ALLOC')
+        if isinstance(name, str):
+            self._strtab.add(name)
+        if compress:
+            flags |= elf_consts.SHF_COMPRESSED
+        self._sections.append(Section(type=type_, name=name, address=0, flags=flags, size=len(contents),
+                                      addralign=addralign, contents=contents))
+        self._reserve_symtab_shndx()
+
+    def add_symbols(self, names: Union[Sequence[Union[str, bytes]], Iterable[Symbol]],
+                    values: Optional[Sequence[int]] = None, sizes: Optional[Sequence[int]] = None,
+                    infos: Optional[Sequence[int]] = None, others: Optional[Sequence[int]] = None,
+                    shndxs: Optional[Sequence[Optional[int]]] = None) -> None:
+        """
+        Add symbols into the symbol table (.symtab) in bulk.
+        Symbols can be given either as an iterable of `Symbol` tuples, or as parallel sequences (lists, arrays...) of
+        names, values and optionally sizes, infos, others and section indices. The names are stored in .strtab along
+        with the section names.
+
+        :param names: Symbols names, or an iterable of `Symbol` tuples when no other argument is given
+        :param values: Symbols values (addresses)
+        :param sizes: Symbols sizes (defaults to 0)
+        :param infos: Symbols st_info, see `symbol_info()` (defaults to a global symbol of no specific type)
+        :param others: Symbols st_other (defaults to STV_DEFAULT)
+        :param shndxs: Index of the section each symbol is relative to. A None index (the default) is resolved during
+                       build to the allocated section containing the symbol's value, or SHN_ABS if there is none
+        :return: None
+        """
+        if values is None:
+            symbols = [Symbol(*symbol) for symbol in names]
+            if not symbols:
+                return
+            names, values, sizes, infos, others, shndxs = zip(*symbols)
+
+        names = list(names)
+        count = len(names)
+        for column in (values, sizes, infos, others, shndxs):
+            if column is not None and len(column) != count:
+                raise ValueError('all symbol columns must be of the same length')
+
+        if not self._symbol_names:
+            self._strtab.add('.symtab')
+        add = self._strtab.add
+        for name in names:
+            add(name)
+
+        self._symbol_names += names
+        self._symbol_values.extend(values)
+        self._symbol_sizes.extend(itertools.repeat(0, count) if sizes is None else sizes)
+        self._symbol_infos.extend(itertools.repeat(Symbol._field_defaults['info'], count) if infos is None else infos)
+        self._symbol_others.extend(itertools.repeat(elf_consts.STV_DEFAULT, count) if others is None else others)
+        self._symbol_shndxs.extend(itertools.repeat(-1, count) if shndxs is None else
+                                   (-1 if shndx is None else shndx for shndx in shndxs))
+        if shndxs is None or None in shndxs:
+            self._unresolved_symbols = True
+        if shndxs is not None and any(shndx is not None and shndx > 0xffff for shndx in shndxs):
+            self._strtab.add('.symtab_shndx')
+        self._reserve_symtab_shndx()
+
+    def set_strtab_suffix_sharing(self, enabled: bool) -> None:
+        """
+        Set whether section names which are a suffix of another name (e.g. `.text` of `.init.text`) reuse its tail
+        in the string table, instead of being stored again
+
+        :param enabled: True to enable suffix sharing
+        :return: None
+        """
+        self._strtab.suffix_sharing = enabled
+
+    def set_coalesce_segments(self, enabled: bool) -> None:
+        """
+        Set whether segments which are contiguous in memory and have equal flags are merged into a single PT_LOAD
+        (e.g. a dump added page by page). Segments are then emitted sorted by their address.
+        Contents are merged without copying them when they are adjacent regions of the same file, or adjacent in
+        memory (slices of the same buffer, detected using numpy if available); otherwise they are concatenated.
+
+        :param enabled: True to enable coalescing
+        :return: None
+        """
+        self._coalesce_segments = enabled
+        self._invalidate_segments()
+
+    def set_trim_zero_tails(self, enabled: bool) -> None:
+        """
+        Set whether trailing zeros of the segments contents are left out of the file, moving them into the
+        zero-filled part of the segment (p_memsz > p_filesz) instead.
+        Contents still covered by a SHT_PROGBITS section are always kept in the file.
+
+        :param enabled: True to enable trimming
+        :return: None
+        """
+        self._trim_zero_tails = enabled
+        self._invalidate_segments()
+
+    def set_deduplicate_segments(self, enabled: bool) -> None:
+        """
+        Set whether segments with identical contents share them in the file, pointing their p_offset at the same
+        bytes. Contents which are a slice of another segment's contents (a memoryview over the same object, or a
+        region of the same file) point into it as well.
+        Buffers are compared by a digest of their contents, while FileContents are compared by their file region.
+
+        :param enabled: True to enable deduplication
+        :return: None
+        """
+        self._deduplicate_segments = enabled
+        self._invalidate_segments()
+
+    def set_compression(self, level: int = DEFAULT_LEVEL, workers: Optional[int] = None) -> None:
+        """
+        Set how SHF_COMPRESSED sections are compressed (using zlib). Big sections are compressed in chunks on a
+        thread pool.
+
+        :param level: zlib compression level
+        :param workers: Amount of compressing threads (defaults to `ThreadPoolExecutor`'s default)
+        :return: None
+        """
+        self._compression_level = level
+        self._compression_workers = workers
+
     def set_machine(self, machine: int) -> None:
         """ Set machine type """
         self._machine = machine
@@ -124,110 +350,279 @@ class ElfBuilder:
     def set_type(self, e_type: int) -> None:
         self._e_type = e_type
 
-    def build(self) -> bytes:
-        structs = self._structs
+    def build(self, stats: Optional[Stats] = None) -> bytes:
+        """
+        Build the ELF
 
-        # append strtab as the last section
-        self._add_string_section()
+        :param stats: Stats object to fill with the timings and counters of the build phases
+        :return: The ELF's raw bytes
+        """
+        with BytesIO() as f:
+            self._write(f, NULL_STATS if stats is None else stats)
+            return f.getvalue()
 
-        if self._endianity == '<':
-            e_ident_data = elf_consts.ELFDATA2LSB
-        else:
-            e_ident_data = elf_consts.ELFDATA2MSB
-
-        elf = {
-            'header': {
-                'e_ident': {
-                    'magic': elf_consts.ELFMAG,
-                    'class': self._class,
-                    'data': e_ident_data,
-                    'osabi': elf_consts.ELFOSABI_NONE,
-                    'pad': Padding(8),
-                },
-                'e_type': self._e_type,
-                'e_machine': self._machine,
-                'e_version': elf_consts.EV_CURRENT,
-                'e_entry': self._entry,
-                'e_phoff': self._e_phoff,
-                'e_shoff': self._e_shoff + len(self._strtab_text),
-                'e_flags': 0,
-                'e_ehsize': self._e_ehsize,
-                'e_phentsize': self._e_phentsize,
-                'e_phnum': self._e_phnum,
-                'e_shentsize': self._e_shentsize,
-                'e_shnum': self._e_shnum,
-                'e_shstrndx': self._e_shnum - 1,
-            },
-            'segments': [],
-            'sections': [],
-        }
+    def build_with_manifest(self, digests: Sequence[str], stats: Optional[Stats] = None) -> Tuple[bytes, Manifest]:
+        """
+        Build the ELF, digesting it while it is emitted
+
+        :param digests: Names of hashlib algorithms to compute (e.g. `['sha256']`)
+        :param stats: Stats object to fill with the timings and counters of the build phases
+        :return: The ELF's raw bytes and its Manifest
+        """
+        with BytesIO() as f:
+            manifest = self._write(f, NULL_STATS if stats is None else stats, digests)
+            return f.getvalue(), manifest
+
+    def write_to(self, file: Union[str, os.PathLike, BinaryIO], stats: Optional[Stats] = None,
+                 digests: Optional[Sequence[str]] = None) -> Optional[Manifest]:
+        """
+        Write the ELF into a file.
+        The layout is computed first, so each segment's contents can be streamed directly into the file without
+        materializing the whole image in memory.
 
-        # add segments
-        segment_data_offset = self._e_phoff + self._e_phnum * self._e_phentsize
+        When given hash algorithms, the whole file, each segment (p_offset/p_filesz) and each section
+        (sh_offset/sh_size) are digested as the bytes are written, so the output doesn't have to be read again.
+        File-backed contents are then streamed through the process instead of being copied by the kernel.
 
+        :param file: Either a path or a binary file object opened for writing
+        :param stats: Stats object to fill with the timings and counters of the build phases
+        :param digests: Names of hashlib algorithms to compute (e.g. `['sha256']`)
+        :return: The Manifest if digests were requested, None otherwise
+        """
+        stats = NULL_STATS if stats is None else stats
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, 'wb') as f:
+                return self._write(f, stats, digests)
+        return self._write(file, stats, digests)
+
+    async def build_async(self, stats: Optional[Stats] = None, limiter=None) -> bytes:
+        """
+        Coroutine variant of `build()`, building on the limiter's executor so the event loop isn't blocked
+
+        :param stats: Stats object to fill with the timings and counters of the build phases
+        :param limiter: `simpleelf.aio.Limiter` to run under (defaults to the shared one)
+        :return: The ELF's raw bytes
+        """
+        from simpleelf.aio import build_async
+        return await build_async(self, stats, limiter)
+
+    async def write_to_async(self, path: Union[str, os.PathLike], stats: Optional[Stats] = None, limiter=None,
+                             chunk_size: int = CHUNK_SIZE) -> None:
+        """
+        Coroutine variant of `write_to()`. The layout is computed on the limiter's executor, and data (including
+        file-backed contents) is written in chunks of up to `chunk_size` bytes, each being a separate job.
+
+        :param path: Path of the output file
+        :param stats: Stats object to fill with the timings and counters of the build phases
+        :param limiter: `simpleelf.aio.Limiter` to run under (defaults to the shared one)
+        :param chunk_size: Size of each write
+        :return: None
+        """
+        from simpleelf.aio import write_to_async
+        await write_to_async(self, path, stats, limiter, chunk_size)
+
+    def fingerprint(self, digest: Optional[Callable[[SegmentContents], bytes]] = None) -> str:
+        """
+        Get a stable digest of everything the built ELF depends on: its header fields, layout options, segments,
+        sections and symbols. Contents are represented by their digest.
+
+        :param digest: Function digesting contents (defaults to `content_digest()`)
+        :return: Hex digest
+        """
+        digest = content_digest if digest is None else digest
+        fingerprint = hashlib.sha256()
+
+        def update(*values) -> None:
+            fingerprint.update(repr(values).encode())
+
+        update(FINGERPRINT_VERSION, self._class, self._endianity, int(self._machine), self._entry, int(self._e_type),
+               self._trim_zero_tails, self._deduplicate_segments, self._coalesce_segments, self._compression_level,
+               self._strtab.suffix_sharing, list(self._strtab))
         for segment in self._segments:
-            elf['segments'].append({
-                'p_type': self._structs.Elf_SegmentType.PT_LOAD,
-                'p_offset': segment_data_offset,
-                'p_vaddr': segment.address,
-                'p_paddr': segment.address,
-                'p_filesz': len(segment.contents),
-                'p_memsz': len(segment.contents),
-                'p_flags': segment.flags,
-                'p_align': 0x20,
-                'data': segment.contents
-            })
-            segment_data_offset += len(segment.contents)
-
-        end_of_segments_offset = segment_data_offset
-
-        # add sections
+            update(segment.address, segment.flags, segment.memsz, len(segment.contents))
+            fingerprint.update(digest(segment.contents))
         for section in self._sections:
-            if section.name is None:
-                sh_name = elf_consts.SHN_UNDEF
-            else:
-                if type(section.name) is int:
+            update(int(section.type), section.name, section.address, section.flags, section.size, section.link,
+                   section.info, section.entsize, section.addralign, section.contents is not None)
+            if section.contents is not None:
+                fingerprint.update(digest(section.contents))
+        update(self._symbol_names)
+        for column in (self._symbol_values, self._symbol_sizes, self._symbol_infos, self._symbol_others,
+                       self._symbol_shndxs):
+            fingerprint.update(column.tobytes())
+        return fingerprint.hexdigest()
+
+    def _write(self, f: BinaryIO, stats: Stats, digests: Optional[Sequence[str]] = None) -> Optional[Manifest]:
+        layout, pieces = self._pack(stats)
+
+        writer = None
+        if digests:
+            ranges = [(phdr.p_offset, phdr.p_filesz) for phdr in layout.program_headers]
+            ranges += [(shdr.sh_offset, 0 if shdr.sh_type == elf_consts.SHT_NOBITS else shdr.sh_size)
+                       for shdr in layout.section_headers]
+            writer = _DigestWriter(f, digests, ranges)
+        out = f if writer is None else writer
+
+        written = 0
+        copied = 0
+        with stats.phase('write'):
+            position = 0
+            for data in iter_pieces(pieces):
+                if isinstance(data, FileContents):
+                    if writer is None:
+                        kernel_copied = data.write_to(f)
+                    else:
+                        kernel_copied = 0
+                        for chunk in data.iter_chunks():
+                            writer.write(chunk)
+                    copied += kernel_copied
+                    written += len(data) - kernel_copied
+                else:
+                    out.write(data)
+                    written += len(data)
+                position += len(data)
+
+        stats.count('bytes_written', written)
+        stats.count('bytes_kernel_copied', copied)
+        stats.finish()
+
+        if writer is None:
+            return None
+        entries = writer.entries()
+        segments_count = len(layout.program_headers)
+        return Manifest(size=position, digests=writer.digests(), header=layout.header,
+                        segments=entries[:segments_count], sections=entries[segments_count:])
+
+    def _pack(self, stats: Stats = NULL_STATS) -> Tuple[ElfLayout, List[Tuple[int, SegmentContents]]]:
+        """ Lay out and pack the ELF, getting the layout and its pieces as (file offset, data) tuples sorted by offset """
+        codecs = get_elf_codecs(self._class, self._endianity)
+        with stats.phase('layout'):
+            layout = self._layout(stats)
+
+        with stats.phase('pack'):
+            pieces = [(0, codecs.pack_ehdr(layout.header)),
+                      (layout.header.e_phoff, b''.join(codecs.pack_phdr(phdr) for phdr in layout.program_headers)),
+                      (layout.header.e_shoff, b''.join(codecs.pack_shdr(shdr) for shdr in layout.section_headers))]
+            pieces += layout.segments_contents
+            pieces += layout.sections_contents
+            pieces.sort(key=lambda piece: piece[0])
+        return layout, pieces
+
+    def _layout(self, stats: Stats = NULL_STATS) -> ElfLayout:
+        """ Compute the offsets of everything in the ELF file """
+        codecs = get_elf_codecs(self._class, self._endianity)
+
+        sections = list(self._sections)
+
+        # the symbol table and the string table are always appended as the last sections
+        if self._symbol_names:
+            with stats.phase('symtab'):
+                symtab, first_non_local, symtab_shndx = self._build_symtab(stats)
+            symtab_index = len(sections)
+            sections.append(Section(type=self._structs.Elf_SectionType.SHT_SYMTAB, name='.symtab', address=0,
+                                    flags=0, size=len(symtab), link=symtab_index + (1 if symtab_shndx is None else 2),
+                                    info=first_non_local, entsize=codecs.sym.size,
+                                    addralign=4 if self._class == ELFCLASS32 else 8, contents=symtab))
+            if symtab_shndx is not None:
+                # section indices which don't fit in st_shndx are held in a parallel table, whose name was already
+                # added by `_reserve_symtab_shndx()`
+                sections.append(Section(type=self._structs.Elf_SectionType.SHT_SYMTAB_SHNDX, name='.symtab_shndx',
+                                        address=0, flags=0, size=len(symtab_shndx), link=symtab_index, entsize=4,
+                                        addralign=4, contents=symtab_shndx))
+
+        with stats.phase('strtab'):
+            strtab = bytes(self._strtab)
+        sections.append(Section(type=self._structs.Elf_SectionType.SHT_STRTAB, name='.strtab', address=0, flags=0,
+                                size=len(strtab), addralign=1, contents=strtab))
+        shstrndx = len(sections) - 1
+
+        compressed = [i for i, section in enumerate(sections)
+                      if section.flags & elf_consts.SHF_COMPRESSED and section.contents is not None]
+        if compressed:
+            with stats.phase('compress'):
+                for i in compressed:
+                    sections[i] = self._compress_section(sections[i])
+
+        with stats.phase('program_headers'):
+            program_headers = []
+            segments_contents = []
+            segments = self._get_segments()
+            end_of_segments_offset = self._e_phoff + len(segments) * self._e_phentsize
+            filesizes = self._get_segment_filesizes()
+            offsets = self._get_segment_offsets()
+            for i, (segment, offset, filesz) in enumerate(zip(segments, offsets, filesizes)):
+                memsz = len(segment.contents) if segment.memsz is None else segment.memsz
+                program_headers.append(codecs.Phdr(
+                    p_type=elf_consts.PT_LOAD, p_offset=offset, p_vaddr=segment.address, p_paddr=segment.address,
+                    p_filesz=filesz, p_memsz=memsz, p_flags=segment.flags, p_align=0x20))
+                if i not in self._shared_segments:
+                    # contents shared with another segment are written only once
+                    segments_contents.append((offset, _truncate(segment.contents, filesz)))
+                    end_of_segments_offset += filesz
+
+        # every non-loaded data, which resides only in ELF, is appended after the segments
+
+        lookups = 0
+        with stats.phase('section_headers'):
+            section_headers = []
+            sections_contents = []
+            for section in sections:
+                if section.name is None:
+                    sh_name = elf_consts.SHN_UNDEF
+                elif type(section.name) is int:
                     sh_name = section.name
                 else:
-                    sh_name = self._strtab_text.find(section.name.encode() + b'\x00')
+                    sh_name = self._strtab.offset(section.name)
 
-            if section.type == self._structs.Elf_SectionType.SHT_PROGBITS:
-                size = section.size
-                offset, contents = self.find_loaded_data(section.address, size)
-            else:
-                # every non-loaded data into memory, which resides only in ELF
-                # will be pointed by `end_of_segments_offset`.
-                # we can append data there
-                offset = end_of_segments_offset
-
-                if section.type == self._structs.Elf_SectionType.SHT_STRTAB:
-                    # the string table is object-globalized
-                    contents = self._strtab_text
-                    size = len(contents)
+                if section.type == self._structs.Elf_SectionType.SHT_NULL:
+                    offset = 0
+                    size = 0
+                elif section.contents is not None:
+                    # data which resides only in the ELF file (such as the string table)
+                    offset = _align(end_of_segments_offset, section.addralign)
+                    size = len(section.contents)
+                    sections_contents.append((offset, section.contents))
+                    end_of_segments_offset = offset + size
+                elif section.type == self._structs.Elf_SectionType.SHT_PROGBITS:
+                    size = section.size
+                    offset = self._find_loaded_offset(section.address)
+                    lookups += 1
                 else:
-                    # .bss section for example, where place in memory is just
-                    # allocated with no specific data
-                    contents = b''
+                    # .bss section for example, where place in memory is just allocated with no specific data
+                    offset = end_of_segments_offset
                     size = section.size
 
-                if section.type != self._structs.Elf_SectionType.SHT_NOBITS:
-                    end_of_segments_offset += size
-
-            elf['sections'].append({
-                'sh_name': sh_name,
-                'sh_type': section.type,
-                'sh_flags': section.flags,
-                'sh_addr': section.address,
-                'sh_offset': offset,
-                'sh_size': size,
-                'sh_link': 0,
-                'sh_info': 0,
-                'sh_addralign': 0x20,
-                'sh_entsize': 0,
-                'data': contents
-            })
-
-        return structs.Elf32.build(elf) if self._class == ELFCLASS32 else structs.Elf64.build(elf)
+                section_headers.append(codecs.Shdr(
+                    sh_name=sh_name, sh_type=int(section.type), sh_flags=section.flags, sh_addr=section.address,
+                    sh_offset=offset, sh_size=size, sh_link=section.link, sh_info=section.info,
+                    sh_addralign=section.addralign, sh_entsize=section.entsize))
+
+        stats.count('segments', len(program_headers))
+        stats.count('sections', len(section_headers))
+        stats.count('address_lookups', lookups)
+
+        # counts which don't fit in the ELF header are held in section header 0 (extended numbering)
+        e_phnum = len(program_headers)
+        e_shnum = len(section_headers)
+        e_shstrndx = shstrndx
+        if e_phnum >= elf_consts.PN_XNUM:
+            section_headers[0] = section_headers[0]._replace(sh_info=e_phnum)
+            e_phnum = elf_consts.PN_XNUM
+        if e_shnum >= elf_consts.SHN_LORESERVE:
+            section_headers[0] = section_headers[0]._replace(sh_size=e_shnum)
+            e_shnum = 0
+        if e_shstrndx >= elf_consts.SHN_LORESERVE:
+            section_headers[0] = section_headers[0]._replace(sh_link=e_shstrndx)
+            e_shstrndx = elf_consts.SHN_XINDEX
+
+        header = codecs.Ehdr(
+            e_ident=codecs.make_ident(), e_type=int(self._e_type), e_machine=int(self._machine),
+            e_version=elf_consts.EV_CURRENT, e_entry=self._entry, e_phoff=self._e_phoff,
+            e_shoff=end_of_segments_offset, e_flags=0, e_ehsize=self._e_ehsize, e_phentsize=self._e_phentsize,
+            e_phnum=e_phnum, e_shentsize=self._e_shentsize, e_shnum=e_shnum, e_shstrndx=e_shstrndx)
+
+        return ElfLayout(header=header, program_headers=program_headers, section_headers=section_headers,
+                         segments_contents=segments_contents, sections_contents=sections_contents)
 
     def _add_section(self, type_, address: int, size: int, flags: int, name: Optional[Union[str, int]] = None) -> None:
         """
@@ -242,13 +637,18 @@ class ElfBuilder:
         """
         if name is not None:
             if isinstance(name, str):
-                self._strtab_text += name.encode() + b'\x00'
+                self._strtab.add(name)
 
         # create segment for the section if necessary
         if type_ in (self._structs.Elf_SectionType.SHT_PROGBITS,):
-            if self.find_loaded_data(address) is None:
+            if self._segment_index.find(address) is None:
                 raise Exception(
                     "section of type SHT_PROGBITS not inside any segment")
+            if self._trim_zero_tails:
+                # the section may cover a zero tail which would otherwise be trimmed. the file sizes are recomputed
+                # only when the segments are laid out
+                self._segment_filesizes = None
+                self._segment_offsets = None
 
         section = Section(
             name=name,
@@ -257,9 +657,416 @@ class ElfBuilder:
             size=size,
             flags=flags)
 
-        self._e_shnum += 1
         self._sections.append(section)
+        self._reserve_symtab_shndx()
+
+    def _reserve_symtab_shndx(self) -> None:
+        """
+        Add the name of the SHT_SYMTAB_SHNDX section once symbols may be resolved to a section index in the reserved
+        range. It must be in .strtab before building, as the symbol names offsets are fixed once the symbol table is
+        packed (and adding it later would change the builder's state, so its fingerprint, on each build)
+        """
+        if self._unresolved_symbols and len(self._sections) > elf_consts.SHN_LORESERVE:
+            self._strtab.add('.symtab_shndx')
+
+    def _compress_section(self, section: Section) -> Section:
+        """ Replace the contents of a section with their compressed form, preceded by a compression header """
+        contents = compress_section(section.contents, self._class, self._endianity, section.addralign,
+                                    self._compression_level, self._compression_workers)
+        return section._replace(size=len(contents), addralign=4 if self._class == ELFCLASS32 else 8,
+                                contents=contents)
+
+    def _build_symtab(self, stats: Stats = NULL_STATS) -> Tuple[bytes, int, Optional[bytes]]:
+        """
+        Pack the symbol table
+
+        :return: A tuple of the symbol table's contents, the index of its first non-local symbol and the contents of
+                 its SHT_SYMTAB_SHNDX table (None if all section indices fit in st_shndx)
+        """
+        codecs = get_elf_codecs(self._class, self._endianity)
+        columns = {
+            'st_name': list(map(self._strtab.offset, self._symbol_names)),
+            'st_value': self._symbol_values,
+            'st_size': self._symbol_sizes,
+            'st_info': self._symbol_infos,
+            'st_other': self._symbol_others,
+            'st_shndx': self._symbol_shndxs,
+        }
+
+        if -1 in self._symbol_shndxs:
+            index = IntervalIndex((section.address, section.address + section.size, i)
+                                  for i, section in enumerate(self._sections)
+                                  if section.flags & elf_consts.SHF_ALLOC and section.size)
+            resolved = [None if shndx != -1 or found is None else found[2]
+                        for shndx, found in zip(self._symbol_shndxs, index.find_many(self._symbol_values))]
+            columns['st_shndx'] = [
+                shndx if shndx != -1 else (elf_consts.SHN_ABS if found is None else found)
+                for shndx, found in zip(self._symbol_shndxs, resolved)]
+            stats.count('address_lookups', len(self._symbol_values))
+        else:
+            resolved = itertools.repeat(None)
+
+        # resolved indices in the reserved range and indices wider than 16 bits are replaced with SHN_XINDEX
+        extended = [shndx if shndx > 0xffff or (found is not None and found >= elf_consts.SHN_LORESERVE) else 0
+                    for shndx, found in zip(columns['st_shndx'], resolved)]
+        if any(extended):
+            columns['st_shndx'] = [elf_consts.SHN_XINDEX if real else shndx
+                                   for shndx, real in zip(columns['st_shndx'], extended)]
+            columns['xindex'] = extended
+
+        # local symbols must precede all others, and sh_info holds the index of the first non-local one
+        local = [info >> 4 == elf_consts.STB_LOCAL for info in self._symbol_infos]
+        local_count = local.count(True)
+        if True in local[local_count:]:
+            order = sorted(range(len(local)), key=lambda i: not local[i])
+            columns = {field: [column[i] for i in order] for field, column in columns.items()}
+
+        stats.count('symbols', len(self._symbol_names))
+        null_symbol = b'\x00' * codecs.sym.size
+        symbols = itertools.starmap(codecs.sym.pack, zip(*(columns[field] for field in codecs.Sym._fields)))
+        symtab_shndx = None
+        if 'xindex' in columns:
+            symtab_shndx = struct.pack(f'{self._endianity}{len(columns["xindex"]) + 1}I', 0, *columns['xindex'])
+        return null_symbol + b''.join(symbols), local_count + 1, symtab_shndx
+
+    def _invalidate_segments(self) -> None:
+        self._coalesced_segments = None
+        self._coalesced_index = None
+        self._segment_filesizes = None
+        self._segment_offsets = None
+
+    def _get_segments(self) -> List[Segment]:
+        """ Get the segments to lay out, coalescing them if enabled """
+        if not self._coalesce_segments:
+            return self._segments
+        if self._coalesced_segments is None:
+            self._coalesced_segments = _coalesce(self._segments)
+        return self._coalesced_segments
+
+    def _get_segment_filesizes(self) -> List[int]:
+        """ Get the amount of bytes each segment occupies in the file (p_filesz) """
+        if self._segment_filesizes is not None:
+            return self._segment_filesizes
+
+        if not self._trim_zero_tails:
+            self._segment_filesizes = [len(segment.contents) for segment in self._get_segments()]
+            return self._segment_filesizes
+
+        filesizes = [_nonzero_size(segment.contents) for segment in self._get_segments()]
+
+        # keep the contents of SHT_PROGBITS sections in the file, as their sh_offset points there
+        index = self._get_segment_index()
+        for section in self._sections:
+            if section.type != self._structs.Elf_SectionType.SHT_PROGBITS or section.contents is not None:
+                continue
+            found = index.find(section.address)
+            if found is not None:
+                start, end, i = found
+                filesizes[i] = max(filesizes[i], min(section.address + section.size, end) - start)
+
+        self._segment_filesizes = filesizes
+        return filesizes
+
+    def _get_segment_offsets(self) -> List[int]:
+        """
+        Get the file offset of each segment's contents, recalculating them if segments were added.
+        Only called when laying out the segments or looking up loaded data, as deduplication digests all contents.
+        """
+        if self._segment_offsets is not None:
+            return self._segment_offsets
+
+        filesizes = self._get_segment_filesizes()
+        if self._deduplicate_segments:
+            shared = _find_shared_contents([_truncate(segment.contents, filesz)
+                                            for segment, filesz in zip(self._get_segments(), filesizes)])
+        else:
+            shared = [None] * len(filesizes)
+
+        offsets = []
+        offset = self._e_phoff + len(filesizes) * self._e_phentsize
+        for filesz, owner in zip(filesizes, shared):
+            offsets.append(offset)
+            if owner is None:
+                offset += filesz
+        for i, owner in enumerate(shared):
+            if owner is not None:
+                index, delta = owner
+                offsets[i] = offsets[index] + delta
+
+        self._shared_segments = {i for i, owner in enumerate(shared) if owner is not None}
+        self._segment_offsets = offsets
+        return offsets
+
+    def _get_segment_index(self) -> IntervalIndex:
+        """
+        Get an index of the segments to lay out by their address, each carrying its index in `_get_segments()`.
+        Without coalescing, this is the index maintained as segments are added.
+        """
+        if not self._coalesce_segments:
+            return self._segment_index
+        if self._coalesced_index is None:
+            self._coalesced_index = IntervalIndex((segment.address, segment.address + len(segment.contents), i)
+                                                  for i, segment in enumerate(self._get_segments()))
+        return self._coalesced_index
+
+    def _find_loaded_offset(self, address: int) -> Optional[int]:
+        """ Get the file offset of the data loaded at a given address, without reading the data itself """
+        interval = self._get_segment_index().find(address)
+        if interval is None:
+            return None
+        start, _, i = interval
+        return self._get_segment_offsets()[i] + address - start
+
+    def _loaded_data(self, interval, address: int, size: Optional[int]) -> Optional[Tuple[int, bytes]]:
+        if interval is None:
+            return None
+
+        start, _, i = interval
+        segment = self._get_segments()[i]
+        delta = address - start
+        offset = self._get_segment_offsets()[i] + delta
+        if size is None:
+            return offset, segment.contents[delta:]
+        return offset, segment.contents[delta:delta + size]
+
+
+class _DigestWriter:
+    """
+    Writes into a file while digesting the written bytes, both as a whole and within a set of (offset, size) ranges,
+    which may overlap (e.g. sections inside segments)
+    """
+
+    def __init__(self, f: BinaryIO, algorithms: Sequence[str], ranges: Sequence[Tuple[int, int]]):
+        self._f = f
+        self._algorithms = list(algorithms)
+        self._digests = [hashlib.new(algorithm) for algorithm in self._algorithms]
+        self._ranges = [(offset, offset + size, [hashlib.new(algorithm) for algorithm in self._algorithms])
+                        for offset, size in ranges]
+        # ranges sorted by their start, and the ranges the written data currently goes through
+        self._pending = sorted((r for r in self._ranges if r[1] > r[0]), key=lambda r: r[0], reverse=True)
+        self._active = []
+        self._position = 0
+
+    def write(self, data) -> None:
+        self._f.write(data)
+        with memoryview(data) as raw, raw.cast('B') as view:
+            for digest in self._digests:
+                digest.update(view)
+
+            start = self._position
+            end = start + len(view)
+            while self._pending and self._pending[-1][0] < end:
+                self._active.append(self._pending.pop())
+            for range_start, range_end, digests in self._active:
+                low = max(range_start, start) - start
+                high = min(range_end, end) - start
+                if low < high:
+                    for digest in digests:
+                        digest.update(view[low:high])
+            self._active = [r for r in self._active if r[1] > end]
+            self._position = end
+
+    def digests(self) -> Dict[str, str]:
+        """ Get the digests of the whole written data """
+        return self._hexdigests(self._digests)
+
+    def entries(self) -> List[ManifestEntry]:
+        """ Get the digests of each range, in the order they were given """
+        return [ManifestEntry(offset=start, size=end - start, digests=self._hexdigests(digests))
+                for start, end, digests in self._ranges]
+
+    def _hexdigests(self, digests) -> Dict[str, str]:
+        return {algorithm: digest.hexdigest() for algorithm, digest in zip(self._algorithms, digests)}
+
+
+def symbol_info(bind: int, type_: int) -> int:
+    """
+    Build a symbol's st_info
+
+    :param bind: Symbol's binding (STB_*)
+    :param type_: Symbol's type (STT_*)
+    :return: st_info value
+    """
+    return (bind << 4) | (type_ & 0xf)
+
+
+def content_digest(contents: SegmentContents) -> bytes:
+    """ Get the SHA-256 digest of contents, hashing them in chunks """
+    digest = hashlib.sha256()
+    if isinstance(contents, FileContents):
+        for chunk in contents.iter_chunks():
+            digest.update(chunk)
+    else:
+        view = memoryview(contents).cast('B')
+        for start in range(0, len(view), CHUNK_SIZE):
+            digest.update(view[start:start + CHUNK_SIZE])
+    return digest.digest()
+
+
+def _nonzero_size(contents: SegmentContents) -> int:
+    """ Get the size of the contents without their trailing zeros, scanning them backwards in chunks """
+    end = len(contents)
+    while end > 0:
+        start = max(end - CHUNK_SIZE, 0)
+        chunk = bytes(contents[start:end]).rstrip(b'\x00')
+        if chunk:
+            return start + len(chunk)
+        end = start
+    return 0
+
+
+def _memory_size(segment: Segment) -> int:
+    return len(segment.contents) if segment.memsz is None else segment.memsz
+
+
+def _coalesce(segments: Sequence[Segment]) -> List[Segment]:
+    """ Merge segments which are contiguous in memory and have equal flags, sorting them by address """
+    runs = []
+    for segment in sorted(segments, key=lambda segment: segment.address):
+        if runs:
+            last = runs[-1][-1]
+            # a zero-filled tail would have to be materialized in the file, so only a run's last segment may have one
+            if last.flags == segment.flags and _memory_size(last) == len(last.contents) and \
+                    last.address + len(last.contents) == segment.address:
+                runs[-1].append(segment)
+                continue
+        runs.append([segment])
+
+    coalesced = []
+    for run in runs:
+        if len(run) == 1:
+            coalesced.append(run[0])
+            continue
+        contents = _concatenate([segment.contents for segment in run])
+        last = run[-1]
+        memsz = None if last.memsz is None else last.address - run[0].address + last.memsz
+        coalesced.append(Segment(address=run[0].address, flags=run[0].flags, contents=contents, memsz=memsz))
+    return coalesced
+
+
+def _concatenate(parts: Sequence[SegmentContents]) -> SegmentContents:
+    """ Concatenate contents, avoiding a copy if they are adjacent regions of a file or adjacent in memory """
+    parts = [part for part in parts if len(part)]
+    size = sum(len(part) for part in parts)
+    if not parts:
+        return b''
+
+    if all(isinstance(part, FileContents) for part in parts):
+        first = parts[0]
+        if all(part.path == first.path for part in parts) and \
+                all(a.offset + a.size == b.offset for a, b in zip(parts, parts[1:])):
+            return FileContents(first.path, first.offset, size)
+
+    if np is not None and not any(isinstance(part, FileContents) for part in parts):
+        views = [memoryview(part).cast('B') for part in parts]
+        root = views[0].obj
+        addresses = [_buffer_address(view) for view in views]
+        if all(view.obj is root for view in views) and \
+                all(address + len(view) == next_address
+                    for address, view, next_address in zip(addresses, views, addresses[1:])):
+            base = memoryview(root).cast('B')
+            start = addresses[0] - _buffer_address(base)
+            if 0 <= start <= len(base) - size:
+                return base[start:start + size]
+
+    return b''.join(bytes(part) if isinstance(part, FileContents) else part for part in parts)
+
+
+def _buffer_address(view: memoryview) -> int:
+    """ Get the memory address of a buffer's first byte """
+    return np.frombuffer(view, dtype=np.uint8).__array_interface__['data'][0]
+
+
+def _find_shared_contents(contents: Sequence[SegmentContents]) -> List[Optional[Tuple[int, int]]]:
+    """
+    Find the contents whose bytes are already held by other contents (identical ones, or a bigger one containing them)
+
+    :param contents: Contents of each segment
+    :return: For each contents, None if it must be written, or the index of the contents holding its bytes and its
+             offset within them
+    """
+    shared = [None] * len(contents)
+    digests = {}
+    # contents which are written, grouped by the object (or file) they reside in, along with their offset in it
+    owners = {}
+    # visit bigger contents first, so slices are found within the contents containing them
+    for i in sorted(range(len(contents)), key=lambda i: -len(contents[i])):
+        data = contents[i]
+        size = len(data)
+        if not size:
+            continue
+
+        if isinstance(data, FileContents):
+            key = (os.path.realpath(data.path),)
+            for index, start in owners.get(key, []):
+                if start <= data.offset and data.offset + size <= start + len(contents[index]):
+                    shared[i] = (index, data.offset - start)
+                    break
+            else:
+                owners.setdefault(key, []).append((i, data.offset))
+            continue
+
+        view = memoryview(data)
+        digest = (size, hashlib.blake2b(view).digest())
+        if digest in digests:
+            shared[i] = (digests[digest], 0)
+            continue
+        digests[digest] = i
+
+        root = view.obj
+        if not hasattr(root, 'find'):
+            continue
+        candidates = owners.setdefault(id(root), [])
+        for index, start in candidates:
+            # search only within the bytes of the bigger contents
+            found = root.find(view, start, start + len(contents[index]))
+            if found != -1:
+                shared[i] = (index, found - start)
+                break
+        else:
+            candidates.append((i, 0 if root is data else root.find(view)))
+    return shared
+
+
+def iter_pieces(pieces: Iterable[Tuple[int, SegmentContents]],
+                chunk_size: Optional[int] = None) -> Iterator[SegmentContents]:
+    """
+    Iterate the data to write for pieces sorted by their file offset (see `ElfBuilder._pack()`), including the zero
+    padding between them
+
+    :param pieces: (file offset, data) tuples
+    :param chunk_size: If given, split the data into parts of up to `chunk_size` bytes (regions of the same file for
+                       FileContents), so each write is bounded
+    :return: Iterator of bytes-like objects and FileContents, to be written one after the other
+    """
+    position = 0
+    for offset, data in pieces:
+        if offset > position:
+            yield b'\x00' * (offset - position)
+            position = offset
+        size = len(data)
+        if chunk_size is None or size <= chunk_size:
+            yield data
+        elif isinstance(data, FileContents):
+            for start in range(0, size, chunk_size):
+                yield FileContents(data.path, data.offset + start, min(chunk_size, size - start))
+        else:
+            view = memoryview(data).cast('B')
+            for start in range(0, size, chunk_size):
+                yield view[start:start + chunk_size]
+        position += size
+
+
+def _truncate(contents: SegmentContents, size: int) -> SegmentContents:
+    """ Get the first `size` bytes of the contents, without copying them """
+    if size == len(contents):
+        return contents
+    if isinstance(contents, FileContents):
+        return FileContents(contents.path, contents.offset, size)
+    return memoryview(contents)[:size]
+
 
-    def _add_string_section(self) -> None:
-        """ Add string section (.strtab) """
-        self._add_section(self._structs.Elf_SectionType.SHT_STRTAB, 0, len(self._strtab_text), 1, elf_consts.SHF_ALLOC)
+def _align(offset: int, alignment: int) -> int:
+    if alignment <= 1:
+        return offset
+    return (offset + alignment - 1) // alignment * alignment
@@ -0,0 +1,158 @@
+import functools
+import struct
+from collections import namedtuple
+from typing import Iterator, Optional
+
+from simpleelf import elf_consts
+from simpleelf.exceptions import InvalidElfError
+
+EHDR_FIELDS = ['e_ident', 'e_type', 'e_machine', 'e_version', 'e_entry', 'e_phoff', 'e_shoff', 'e_flags', 'e_ehsize',
+               'e_phentsize', 'e_phnum', 'e_shentsize', 'e_shnum', 'e_shstrndx']
+SHDR_FIELDS = ['sh_name', 'sh_type', 'sh_flags', 'sh_addr', 'sh_offset', 'sh_size', 'sh_link', 'sh_info',
+               'sh_addralign', 'sh_entsize']
+
+# real amounts of program/section headers and index of the section names table, see `get_counts()`
+ElfCounts = namedtuple('ElfCounts', ['phnum', 'shnum', 'shstrndx'])
+
+Elf32_Ehdr = namedtuple('Elf32_Ehdr', EHDR_FIELDS)
+Elf64_Ehdr = namedtuple('Elf64_Ehdr', EHDR_FIELDS)
+Elf32_Phdr = namedtuple('Elf32_Phdr', ['p_type', 'p_offset', 'p_vaddr', 'p_paddr', 'p_filesz', 'p_memsz', 'p_flags',
+                                       'p_align'])
+Elf64_Phdr = namedtuple('Elf64_Phdr', ['p_type', 'p_flags', 'p_offset', 'p_vaddr', 'p_paddr', 'p_filesz', 'p_memsz',
+                                       'p_align'])
+Elf32_Shdr = namedtuple('Elf32_Shdr', SHDR_FIELDS)
+Elf64_Shdr = namedtuple('Elf64_Shdr', SHDR_FIELDS)
+Elf32_Sym = namedtuple('Elf32_Sym', ['st_name', 'st_value', 'st_size', 'st_info', 'st_other', 'st_shndx'])
+Elf64_Sym = namedtuple('Elf64_Sym', ['st_name', 'st_info', 'st_other', 'st_shndx', 'st_value', 'st_size'])
+Elf32_Chdr = namedtuple('Elf32_Chdr', ['ch_type', 'ch_size', 'ch_addralign'])
+Elf64_Chdr = namedtuple('Elf64_Chdr', ['ch_type', 'ch_reserved', 'ch_size', 'ch_addralign'])
+
+# formats without the byte-order prefix. field order matches the namedtuples above
+_FORMATS = {
+    elf_consts.ELFCLASS32: (Elf32_Ehdr, '16sHHIIIIIHHHHHH', Elf32_Phdr, 'IIIIIIII', Elf32_Shdr, 'IIIIIIIIII',
+                            Elf32_Sym, 'IIIBBH', Elf32_Chdr, 'III'),
+    elf_consts.ELFCLASS64: (Elf64_Ehdr, '16sHHIQQQIHHHHHH', Elf64_Phdr, 'IIQQQQQQ', Elf64_Shdr, 'IIQQQQIIQQ',
+                            Elf64_Sym, 'IBBHQQ', Elf64_Chdr, 'IIQQ'),
+}
+
+
+class ElfCodecs:
+    """
+    Fast codecs for the fixed-size ELF records, using plain `struct` instead of construct.
+
+    Records are represented as namedtuples holding raw integers (enums aren't decoded), which makes them suitable
+    for hot paths such as decoding large program/section header tables.
+    """
+
+    def __init__(self, elf_class: int, endianity: str = '<'):
+        self.elf_class = elf_class
+        self.endianity = endianity
+        self.Ehdr, ehdr_format, self.Phdr, phdr_format, self.Shdr, shdr_format, self.Sym, sym_format, self.Chdr, \
+            chdr_format = _FORMATS[elf_class]
+        self.ehdr = struct.Struct(endianity + ehdr_format)
+        self.phdr = struct.Struct(endianity + phdr_format)
+        self.shdr = struct.Struct(endianity + shdr_format)
+        self.sym = struct.Struct(endianity + sym_format)
+        self.chdr = struct.Struct(endianity + chdr_format)
+
+    def make_ident(self, osabi: int = elf_consts.ELFOSABI_NONE) -> bytes:
+        """ Build the e_ident field matching this codec's class and endianity """
+        data = elf_consts.ELFDATA2LSB if self.endianity == '<' else elf_consts.ELFDATA2MSB
+        return elf_consts.ELFMAG + bytes([self.elf_class, data, elf_consts.EV_CURRENT, osabi]) + b'\x00' * 8
+
+    def make_chdr(self, ch_type: int, ch_size: int, ch_addralign: int):
+        """ Build a compression header, filling the fields which only exist in this class (ch_reserved) """
+        if self.elf_class == elf_consts.ELFCLASS32:
+            return self.Chdr(ch_type=ch_type, ch_size=ch_size, ch_addralign=ch_addralign)
+        return self.Chdr(ch_type=ch_type, ch_reserved=0, ch_size=ch_size, ch_addralign=ch_addralign)
+
+    def unpack_counts(self, buf, ehdr) -> ElfCounts:
+        """ Get the real counts of an ELF held in a buffer, reading section header 0 if needed (see `get_counts()`) """
+        section0 = None
+        if uses_extended_numbering(ehdr) and ehdr.e_shoff + self.shdr.size <= len(buf):
+            section0 = self.unpack_shdr(buf, ehdr.e_shoff)
+        return get_counts(ehdr, section0, len(buf))
+
+    def unpack_ehdr(self, buf, offset: int = 0):
+        return self.Ehdr._make(self.ehdr.unpack_from(buf, offset))
+
+    def unpack_phdr(self, buf, offset: int = 0):
+        return self.Phdr._make(self.phdr.unpack_from(buf, offset))
+
+    def unpack_shdr(self, buf, offset: int = 0):
+        return self.Shdr._make(self.shdr.unpack_from(buf, offset))
+
+    def iter_phdrs(self, buf, offset: int, count: int) -> Iterator:
+        """ Decode `count` consecutive program headers starting at `offset` """
+        return map(self.Phdr._make, self.phdr.iter_unpack(memoryview(buf)[offset:offset + count * self.phdr.size]))
+
+    def iter_shdrs(self, buf, offset: int, count: int) -> Iterator:
+        """ Decode `count` consecutive section headers starting at `offset` """
+        return map(self.Shdr._make, self.shdr.iter_unpack(memoryview(buf)[offset:offset + count * self.shdr.size]))
+
+    def iter_syms(self, buf) -> Iterator:
+        """ Decode a whole symbol table """
+        return map(self.Sym._make, self.sym.iter_unpack(buf))
+
+    def unpack_chdr(self, buf, offset: int = 0):
+        return self.Chdr._make(self.chdr.unpack_from(buf, offset))
+
+    def pack_ehdr(self, ehdr) -> bytes:
+        return self.ehdr.pack(*ehdr)
+
+    def pack_phdr(self, phdr) -> bytes:
+        return self.phdr.pack(*phdr)
+
+    def pack_shdr(self, shdr) -> bytes:
+        return self.shdr.pack(*shdr)
+
+    def pack_sym(self, sym) -> bytes:
+        return self.sym.pack(*sym)
+
+    def pack_chdr(self, chdr) -> bytes:
+        return self.chdr.pack(*chdr)
+
+
+def uses_extended_numbering(ehdr) -> bool:
+    """ Check whether an ELF header holds some of its counts in section header 0, as they don't fit in 16 bits """
+    return ehdr.e_phnum == elf_consts.PN_XNUM or ehdr.e_shstrndx == elf_consts.SHN_XINDEX or \
+        (ehdr.e_shnum == 0 and ehdr.e_shoff != 0)
+
+
+def get_counts(ehdr, section0=None, size: Optional[int] = None) -> ElfCounts:
+    """
+    Get the real amounts of program and section headers and the index of the section names table, following the
+    extended numbering convention: e_phnum of PN_XNUM, e_shnum of 0 and e_shstrndx of SHN_XINDEX mean the values are
+    held in the sh_info, sh_size and sh_link fields of section header 0
+
+    :param ehdr: ELF header (either an Ehdr namedtuple or a parsed Container)
+    :param section0: Section header 0, which is only needed if `uses_extended_numbering(ehdr)`
+    :param size: Size of the file. If given, counts taken from section header 0 are checked against it, as they
+                 aren't limited to 16 bits
+    :return: ElfCounts
+    """
+    if section0 is None:
+        return ElfCounts(phnum=ehdr.e_phnum, shnum=ehdr.e_shnum, shstrndx=ehdr.e_shstrndx)
+    counts = ElfCounts(phnum=section0.sh_info if ehdr.e_phnum == elf_consts.PN_XNUM else ehdr.e_phnum,
+                       shnum=section0.sh_size if ehdr.e_shnum == 0 else ehdr.e_shnum,
+                       shstrndx=section0.sh_link if ehdr.e_shstrndx == elf_consts.SHN_XINDEX else ehdr.e_shstrndx)
+    if size is not None:
+        for offset, count, entry_size in ((ehdr.e_phoff, counts.phnum, ehdr.e_phentsize),
+                                          (ehdr.e_shoff, counts.shnum, ehdr.e_shentsize)):
+            # each entry takes at least a byte, even if the entry size is bogus
+            end = offset + count * max(entry_size, 1)
+            if end > size:
+                raise InvalidElfError(f'range 0x{offset:x}-0x{end:x} is outside of the file')
+    return counts
+
+
+@functools.lru_cache(maxsize=None)
+def get_elf_codecs(elf_class: int, endianity: str = '<') -> ElfCodecs:
+    """
+    Get a shared ElfCodecs instance
+
+    :param elf_class: Either ELFCLASS32 or ELFCLASS64
+    :param endianity: Either '<' for LE or '>' for BE
+    :return: ElfCodecs
+    """
+    return ElfCodecs(elf_class, endianity)
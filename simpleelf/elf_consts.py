@@ -8,6 +8,7 @@ PF_X = 0x1
 SHF_WRITE = 0x1
 SHF_ALLOC = 0x2
 SHF_EXECINSTR = 0x4
+SHF_COMPRESSED = 0x800
 SHF_RELA_LIVEPATCH = 0x00100000
 SHF_RO_AFTER_INIT = 0x00200000
 SHF_MASKPROC = 0xf0000000
@@ -47,6 +48,9 @@ EV_NONE = 0
 EV_CURRENT = 1
 EV_NUM = 2
 
+ELFCOMPRESS_ZLIB = 1
+ELFCOMPRESS_ZSTD = 2
+
 ELFOSABI_NONE = 0
 ELFOSABI_LINUX = 3
 
@@ -57,8 +61,33 @@ SHN_HIPROC = 0xff1f
 SHN_LIVEPATCH = 0xff20
 SHN_ABS = 0xfff1
 SHN_COMMON = 0xfff2
+SHN_XINDEX = 0xffff  # the real index is held elsewhere (section header 0, SHT_SYMTAB_SHNDX)
 SHN_HIRESERVE = 0xffff
 
+# e_phnum value meaning the real amount of program headers is held in the sh_info of section header 0
+PN_XNUM = 0xffff
+
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+STB_LOPROC = 13
+STB_HIPROC = 15
+
+STT_NOTYPE = 0
+STT_OBJECT = 1
+STT_FUNC = 2
+STT_SECTION = 3
+STT_FILE = 4
+STT_COMMON = 5
+STT_TLS = 6
+STT_LOPROC = 13
+STT_HIPROC = 15
+
+STV_DEFAULT = 0
+STV_INTERNAL = 1
+STV_HIDDEN = 2
+STV_PROTECTED = 3
+
 SHT_NULL = 0
 SHT_PROGBITS = 1
 SHT_SYMTAB = 2
@@ -72,6 +101,7 @@ SHT_REL = 9
 SHT_SHLIB = 10
 SHT_DYNSYM = 11
 SHT_NUM = 12
+SHT_SYMTAB_SHNDX = 18
 SHT_LOPROC = 0x70000000
 SHT_HIPROC = 0x7fffffff
 SHT_LOUSER = 0x80000000
@@ -0,0 +1,366 @@
+import io
+import mmap
+import os
+from typing import BinaryIO, Callable, Iterator, List, Optional, Union
+
+from construct import Container
+
+from simpleelf import elf_consts
+from simpleelf.compression import open_compressed
+from simpleelf.elf_codecs import get_counts, get_elf_codecs, uses_extended_numbering
+from simpleelf.elf_structs import ElfStructs, get_elf_structs
+from simpleelf.elf_symbols import SymbolIndex
+from simpleelf.elf_tables import as_records, decode_table
+from simpleelf.exceptions import InvalidElfError
+from simpleelf.stats import NULL_STATS, Stats
+
+
+class ElfFile:
+    """
+    Lazy, zero-copy ELF reader.
+
+    The file is mapped into memory and only the tables being accessed are decoded. Segment and section
+    contents are returned as memoryview slices over the mapping, so no payload is copied unless the
+    caller does so explicitly (e.g. by calling `bytes()` on it).
+
+    Program and section header entries are decoded into plain namedtuples (see `ElfCodecs`). Construct Containers
+    are only built on request, using `segment_container()`/`section_container()`.
+
+    Memoryviews returned by this object must be released before calling `close()`.
+
+    When given a Stats object, the time spent mapping and decoding the file, and the amount of decoded entries are
+    recorded into it, and it is finished when the file is closed.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike], stats: Optional[Stats] = None):
+        stats = NULL_STATS if stats is None else stats
+        with stats.phase('map'):
+            self._file = open(path, 'rb')
+            try:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError) as e:
+                # empty files cannot be mapped
+                self._file.close()
+                raise InvalidElfError(f'failed to map {path}') from e
+        view = memoryview(self._mmap)
+        try:
+            self._init(view, stats)
+        except BaseException:
+            view.release()
+            self._mmap.close()
+            self._file.close()
+            raise
+
+    @classmethod
+    def from_buffer(cls, buffer, stats: Optional[Stats] = None) -> 'ElfFile':
+        """
+        Create a reader over an in-memory buffer (bytes, bytearray, memoryview, mmap...)
+
+        :param buffer: Any object supporting the buffer protocol
+        :param stats: Stats object to fill with the timings and counters of the parse
+        :return: ElfFile
+        """
+        elf = cls.__new__(cls)
+        elf._file = None
+        elf._mmap = None
+        elf._init(memoryview(buffer).cast('B'), NULL_STATS if stats is None else stats)
+        return elf
+
+    def _init(self, view: memoryview, stats: Stats) -> None:
+        self._view = view
+        self._stats = stats
+
+        if len(view) < elf_consts.EI_NIDENT or view[:4] != elf_consts.ELFMAG:
+            raise InvalidElfError('bad ELF magic')
+
+        self._class = view[4]
+        if self._class not in (elf_consts.ELFCLASS32, elf_consts.ELFCLASS64):
+            raise InvalidElfError(f'unsupported ELF class: {self._class}')
+
+        data = view[5]
+        if data == elf_consts.ELFDATA2LSB:
+            self._endianity = '<'
+        elif data == elf_consts.ELFDATA2MSB:
+            self._endianity = '>'
+        else:
+            raise InvalidElfError(f'unsupported ELF data encoding: {data}')
+
+        self._structs = get_elf_structs(self._endianity)
+        self._codecs = get_elf_codecs(self._class, self._endianity)
+        if self._class == elf_consts.ELFCLASS32:
+            ehdr_struct = self._structs.Elf32_Ehdr
+            self._phdr_struct = self._structs.Elf32_PhdrEntry
+            self._shdr_struct = self._structs.Elf32_ShdrEntry
+        else:
+            ehdr_struct = self._structs.Elf64_Ehdr
+            self._phdr_struct = self._structs.Elf64_PhdrEntry
+            self._shdr_struct = self._structs.Elf64_ShdrEntry
+
+        with stats.phase('header'):
+            self._header = ehdr_struct.parse(self._slice(0, ehdr_struct.sizeof()))
+            section0 = None
+            if uses_extended_numbering(self._header):
+                section0 = self._unpack_entry(self._codecs.unpack_shdr, self._codecs.shdr.size, self._header.e_shoff,
+                                              self._header.e_shentsize, 0)
+            self._counts = get_counts(self._header, section0, len(self._view))
+        self._segments: List[Optional[tuple]] = [None] * self._counts.phnum
+        self._sections: List[Optional[tuple]] = [None] * self._counts.shnum
+        self._shstrtab: Optional[bytes] = None
+        self._symbol_index: Optional[SymbolIndex] = None
+
+    def close(self) -> None:
+        """ Release the underlying mapping """
+        if self._view is None:
+            return
+        self._view.release()
+        self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+        self._stats.finish()
+
+    def __enter__(self) -> 'ElfFile':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return (f'<{self.__class__.__name__} class={self._class} endianity={self._endianity!r} '
+                f'segments={self.segment_count} sections={self.section_count}>')
+
+    @property
+    def elf_class(self) -> int:
+        return self._class
+
+    @property
+    def endianity(self) -> str:
+        return self._endianity
+
+    @property
+    def structs(self) -> ElfStructs:
+        return self._structs
+
+    @property
+    def header(self) -> Container:
+        return self._header
+
+    @property
+    def segment_count(self) -> int:
+        return len(self._segments)
+
+    @property
+    def section_count(self) -> int:
+        return len(self._sections)
+
+    def segment(self, index: int):
+        """
+        Get a program header entry, decoding it on first access
+
+        :param index: Program header index
+        :return: Phdr namedtuple (see `ElfCodecs`), without the segment's data
+        """
+        entry = self._segments[index]
+        if entry is None:
+            with self._stats.phase('program_headers'):
+                entry = self._unpack_entry(self._codecs.unpack_phdr, self._codecs.phdr.size, self._header.e_phoff,
+                                           self._header.e_phentsize, index)
+            self._stats.count('segments')
+            self._segments[index] = entry
+        return entry
+
+    def section(self, index: int):
+        """
+        Get a section header entry, decoding it on first access
+
+        :param index: Section header index
+        :return: Shdr namedtuple (see `ElfCodecs`), without the section's data
+        """
+        entry = self._sections[index]
+        if entry is None:
+            with self._stats.phase('section_headers'):
+                entry = self._unpack_entry(self._codecs.unpack_shdr, self._codecs.shdr.size, self._header.e_shoff,
+                                           self._header.e_shentsize, index)
+            self._stats.count('sections')
+            self._sections[index] = entry
+        return entry
+
+    def segments(self) -> Iterator:
+        """ Iterate over all program header entries, decoding the whole table at once """
+        with self._stats.phase('program_headers'):
+            decoded = self._unpack_table(self._segments, self._codecs.unpack_phdr, self._codecs.iter_phdrs,
+                                         self._codecs.phdr.size, self._header.e_phoff, self._header.e_phentsize)
+        self._stats.count('segments', decoded)
+        return iter(self._segments)
+
+    def sections(self) -> Iterator:
+        """ Iterate over all section header entries, decoding the whole table at once """
+        with self._stats.phase('section_headers'):
+            decoded = self._unpack_table(self._sections, self._codecs.unpack_shdr, self._codecs.iter_shdrs,
+                                         self._codecs.shdr.size, self._header.e_shoff, self._header.e_shentsize)
+        self._stats.count('sections', decoded)
+        return iter(self._sections)
+
+    def segment_container(self, index: int) -> Container:
+        """
+        Parse a program header entry using construct, for callers needing a Container (e.g. for decoded enums)
+
+        :param index: Program header index
+        :return: Parsed program header (without its data)
+        """
+        return self._parse_entry(self._phdr_struct, self._header.e_phoff, self._header.e_phentsize, index)
+
+    def section_container(self, index: int) -> Container:
+        """
+        Parse a section header entry using construct, for callers needing a Container (e.g. for decoded enums)
+
+        :param index: Section header index
+        :return: Parsed section header (without its data)
+        """
+        return self._parse_entry(self._shdr_struct, self._header.e_shoff, self._header.e_shentsize, index)
+
+    def segment_data(self, index: int) -> memoryview:
+        """
+        Get the file contents of a segment
+
+        :param index: Program header index
+        :return: A memoryview over the segment's p_filesz bytes
+        """
+        segment = self.segment(index)
+        return self._slice(segment.p_offset, segment.p_filesz)
+
+    def section_data(self, index: int) -> memoryview:
+        """
+        Get the file contents of a section
+
+        :param index: Section header index
+        :return: A memoryview over the section's bytes (empty for SHT_NOBITS)
+        """
+        section = self.section(index)
+        if section.sh_type == elf_consts.SHT_NOBITS:
+            return self._view[0:0]
+        return self._slice(section.sh_offset, section.sh_size)
+
+    def open_section(self, index: int) -> BinaryIO:
+        """
+        Open the contents of a section for reading.
+        SHF_COMPRESSED sections are decompressed on the fly as they are read, so a section which is never read is
+        never decompressed. The returned object must be closed before calling `close()`.
+
+        :param index: Section header index
+        :return: Binary file object over the (uncompressed) contents
+        """
+        section = self.section(index)
+        data = self.section_data(index)
+        if section.sh_flags & elf_consts.SHF_COMPRESSED:
+            return open_compressed(data, self._class, self._endianity)
+        return io.BufferedReader(_MemoryReader(data))
+
+    def section_name(self, index: int) -> str:
+        """
+        Resolve a section's name using the section header string table
+
+        :param index: Section header index
+        :return: Section name (empty string if the ELF has no string table)
+        """
+        if self._shstrtab is None:
+            shstrndx = self._counts.shstrndx
+            if shstrndx == elf_consts.SHN_UNDEF or shstrndx >= self.section_count:
+                self._shstrtab = b''
+            else:
+                # section names tables are small, so keep a private copy for fast lookups
+                self._shstrtab = bytes(self.section_data(shstrndx))
+
+        offset = self.section(index).sh_name
+        end = self._shstrtab.find(b'\x00', offset)
+        if end == -1:
+            end = len(self._shstrtab)
+        return self._shstrtab[offset:end].decode()
+
+    def find_section(self, name: str) -> Optional[int]:
+        """
+        Find a section by its name
+
+        :param name: Section name
+        :return: The section's index or None if not found
+        """
+        for i in range(self.section_count):
+            if self.section_name(i) == name:
+                return i
+        return None
+
+    def to_numpy(self, table: str = 'segments'):
+        """
+        Decode the program or section header table into a numpy structured array, with one field per header field
+
+        :param table: Either 'segments' or 'sections'
+        :return: numpy structured array, see `simpleelf.elf_tables.table_dtype()`
+        """
+        header = self._header
+        if table == 'segments':
+            location = (header.e_phoff, self._counts.phnum, header.e_phentsize)
+        else:
+            location = (header.e_shoff, self._counts.shnum, header.e_shentsize)
+        return decode_table(self._view, self._class, self._endianity, table, *location)
+
+    def to_records(self, table: str = 'segments'):
+        """ Same as `to_numpy()`, returned as a numpy record array """
+        return as_records(self.to_numpy(table))
+
+    def symbol_index(self) -> SymbolIndex:
+        """ Get an index of the symbols of all SHT_SYMTAB/SHT_DYNSYM sections, building it only on first use """
+        if self._symbol_index is None:
+            with self._stats.phase('symbols'):
+                self._symbol_index = SymbolIndex.from_elf_file(self)
+        return self._symbol_index
+
+    def _parse_entry(self, struct, table_offset: int, entry_size: int, index: int) -> Container:
+        return struct.parse(self._slice(table_offset + index * entry_size, struct.sizeof()))
+
+    def _unpack_entry(self, unpack: Callable, size: int, table_offset: int, entry_size: int, index: int):
+        return unpack(self._slice(table_offset + index * entry_size, size))
+
+    def _unpack_table(self, entries: list, unpack: Callable, iter_entries: Callable, size: int, table_offset: int,
+                      entry_size: int) -> int:
+        """ Decode all the entries of a table which weren't decoded yet, returning their amount """
+        missing = entries.count(None)
+        if not missing:
+            return 0
+        if entry_size == size:
+            # entries are packed back to back, so decode the whole table in a single pass
+            view = self._slice(table_offset, len(entries) * size)
+            entries[:] = [entry if entry is not None else decoded
+                          for entry, decoded in zip(entries, iter_entries(view, 0, len(entries)))]
+        else:
+            for i, entry in enumerate(entries):
+                if entry is None:
+                    entries[i] = self._unpack_entry(unpack, size, table_offset, entry_size, i)
+        return missing
+
+    def _slice(self, offset: int, size: int) -> memoryview:
+        if offset < 0 or size < 0 or offset + size > len(self._view):
+            raise InvalidElfError(f'range 0x{offset:x}-0x{offset + size:x} is outside of the file')
+        return self._view[offset:offset + size]
+
+
+class _MemoryReader(io.RawIOBase):
+    """ Raw stream over a memoryview, copying data only into the buffers it is read into """
+
+    def __init__(self, data: memoryview):
+        self._data = data
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast('B')
+        count = min(len(view), len(self._data) - self._position)
+        view[:count] = self._data[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def close(self) -> None:
+        self._data.release()
+        super().close()
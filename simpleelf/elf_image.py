@@ -0,0 +1,188 @@
+import struct
+from collections import OrderedDict, namedtuple
+from typing import Iterable, Tuple
+
+from construct import Container
+
+from simpleelf import elf_consts
+from simpleelf.elf_file import ElfFile
+from simpleelf.file_contents import SegmentContents
+from simpleelf.interval_index import IntervalIndex
+
+PAGE_SIZE = 0x1000
+CACHE_SIZE = 256
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class ElfImage:
+    """
+    Virtual memory view of an ELF's PT_LOAD segments.
+
+    Addresses are resolved using an IntervalIndex over the segments, so each lookup is O(log n), and reads may cross
+    segment boundaries. The part of a segment past its p_filesz reads as zeros. Data is fetched in pages which are
+    kept in a bounded LRU cache, so repeated reads around the same addresses don't touch the underlying contents again.
+    """
+
+    def __init__(self, segments: Iterable[Tuple[int, int, SegmentContents]], endianity: str = '<',
+                 page_size: int = PAGE_SIZE, cache_size: int = CACHE_SIZE):
+        """
+        :param segments: Iterable of (address, memory size, contents) tuples. Contents can be any object supporting
+                         `len()` and slicing (bytes, memoryview, FileContents...), holding the first bytes of the
+                         segment
+        :param endianity: Either '<' for LE or '>' for BE, used by the `read_u*()` methods
+        :param page_size: Size of the cached pages
+        :param cache_size: Maximal amount of cached pages
+        """
+        self._segments = []
+        intervals = []
+        for address, memsz, contents in segments:
+            if not memsz:
+                continue
+            intervals.append((address, address + memsz, len(self._segments)))
+            self._segments.append((address, memsz, contents))
+        self._index = IntervalIndex(intervals)
+
+        self.endianity = endianity
+        self._u16 = struct.Struct(endianity + 'H')
+        self._u32 = struct.Struct(endianity + 'I')
+        self._u64 = struct.Struct(endianity + 'Q')
+
+        self._page_size = page_size
+        self._cache_size = cache_size
+        self._pages: 'OrderedDict[Tuple[int, int], bytes]' = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def from_elf_file(cls, elf: ElfFile, **kwargs) -> 'ElfImage':
+        """
+        Create a view over the segments of an ElfFile. Data is copied out of the file only when a page is loaded,
+        so the ElfFile can still be closed while the image is alive (but not read from afterwards).
+
+        :param elf: ElfFile
+        :param kwargs: See `ElfImage()`
+        :return: ElfImage
+        """
+        segments = []
+        for i, segment in enumerate(elf.segments()):
+            if int(segment.p_type) == elf_consts.PT_LOAD:
+                segments.append((segment.p_vaddr, segment.p_memsz, _ElfFileSegment(elf, i, segment.p_filesz)))
+        return cls(segments, elf.endianity, **kwargs)
+
+    @classmethod
+    def from_parsed(cls, elf: Container, **kwargs) -> 'ElfImage':
+        """
+        Create a view over the segments of an `Elf32/Elf64.parse()` result
+
+        :param elf: Parsed ELF
+        :param kwargs: See `ElfImage()`
+        :return: ElfImage
+        """
+        endianity = '<' if int(elf.header.e_ident.data) == elf_consts.ELFDATA2LSB else '>'
+        segments = [(segment.p_vaddr, segment.p_memsz, segment.data) for segment in elf.segments
+                    if int(segment.p_type) == elf_consts.PT_LOAD]
+        return cls(segments, endianity, **kwargs)
+
+    def is_mapped(self, address: int) -> bool:
+        return self._index.find(address) is not None
+
+    def read(self, address: int, size: int) -> bytes:
+        """
+        Read memory
+
+        :param address: Virtual address to read from
+        :param size: Amount of bytes to read
+        :return: Read data
+        """
+        buffer = bytearray(size)
+        self.readinto(address, buffer)
+        return bytes(buffer)
+
+    def readinto(self, address: int, buffer) -> int:
+        """
+        Read memory into a pre-allocated buffer
+
+        :param address: Virtual address to read from
+        :param buffer: Writable buffer (bytearray, memoryview...), filled entirely
+        :return: Amount of bytes read
+        """
+        view = memoryview(buffer).cast('B')
+        size = len(view)
+        position = 0
+        while position < size:
+            current = address + position
+            found = self._index.find(current)
+            if found is None:
+                raise ValueError(f'address 0x{current:x} is not mapped')
+            start, end, index = found
+
+            # copy as much as possible from this segment before looking up the next one
+            delta = current - start
+            available = min(size - position, end - current)
+            while available:
+                page_number, page_offset = divmod(delta, self._page_size)
+                page = self._page(index, page_number)
+                count = min(available, len(page) - page_offset)
+                view[position:position + count] = page[page_offset:page_offset + count]
+                position += count
+                delta += count
+                available -= count
+        return size
+
+    def read_u16(self, address: int) -> int:
+        return self._u16.unpack(self.read(address, 2))[0]
+
+    def read_u32(self, address: int) -> int:
+        return self._u32.unpack(self.read(address, 4))[0]
+
+    def read_u64(self, address: int) -> int:
+        return self._u64.unpack(self.read(address, 8))[0]
+
+    def cache_info(self) -> CacheInfo:
+        """ Get the page cache statistics, similar to `functools.lru_cache` """
+        return CacheInfo(hits=self._hits, misses=self._misses, maxsize=self._cache_size, currsize=len(self._pages))
+
+    def cache_clear(self) -> None:
+        self._pages.clear()
+        self._hits = 0
+        self._misses = 0
+
+    def _page(self, index: int, page_number: int) -> bytes:
+        """ Get a page of a segment, relative to the segment's start, loading it on cache miss """
+        key = (index, page_number)
+        page = self._pages.get(key)
+        if page is not None:
+            self._hits += 1
+            self._pages.move_to_end(key)
+            return page
+
+        self._misses += 1
+        _, memsz, contents = self._segments[index]
+        offset = page_number * self._page_size
+        size = min(self._page_size, memsz - offset)
+        page = bytes(contents[offset:min(offset + size, len(contents))])
+        if len(page) < size:
+            # past p_filesz, memory is zero-filled
+            page += b'\x00' * (size - len(page))
+
+        self._pages[key] = page
+        if len(self._pages) > self._cache_size:
+            self._pages.popitem(last=False)
+        return page
+
+
+class _ElfFileSegment:
+    """ Contents of an ElfFile segment, copied out of the file on each access """
+
+    def __init__(self, elf: ElfFile, index: int, size: int):
+        self._elf = elf
+        self._index = index
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, item: slice) -> bytes:
+        with self._elf.segment_data(self._index) as view:
+            return bytes(view[item])
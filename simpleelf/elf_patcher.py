@@ -0,0 +1,284 @@
+import mmap
+import os
+from typing import Optional, Tuple, Union
+
+from simpleelf import elf_consts
+from simpleelf.elf_codecs import ElfCounts, get_elf_codecs
+from simpleelf.elf_structs import IDENTIFY_SIZE, identify
+from simpleelf.exceptions import InvalidElfError
+from simpleelf.interval_index import IntervalIndex
+
+
+class ElfPatcher:
+    """
+    In-place ELF editor.
+
+    The file is mapped for writing and header/table entries are located by their offset, so changing a field only
+    rewrites its entry, and patching data only touches the patched bytes, regardless of the file's size.
+
+    Edits which don't fit in the file's current layout (growing a segment or a section) append the new contents at
+    the end of the file and repoint the entry to them, leaving the rest of the file untouched.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self._file = open(path, 'r+b')
+        try:
+            identity = identify(self._file.read(IDENTIFY_SIZE))
+            self._codecs = get_elf_codecs(identity.elf_class, identity.endianity)
+            self._map()
+        except BaseException:
+            self._file.close()
+            raise
+        self._segment_index: Optional[IntervalIndex] = None
+
+    def close(self) -> None:
+        """ Flush all changes and release the mapping """
+        if self._mmap is None:
+            return
+        self._mmap.flush()
+        self._mmap.close()
+        self._mmap = None
+        self._file.close()
+
+    def flush(self) -> None:
+        """ Flush all changes into the file """
+        self._mmap.flush()
+
+    def __enter__(self) -> 'ElfPatcher':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return (f'<{self.__class__.__name__} class={self.elf_class} endianity={self.endianity!r} '
+                f'segments={self.segment_count} sections={self.section_count}>')
+
+    @property
+    def elf_class(self) -> int:
+        return self._codecs.elf_class
+
+    @property
+    def endianity(self) -> str:
+        return self._codecs.endianity
+
+    @property
+    def header(self):
+        return self._codecs.unpack_ehdr(self._mmap)
+
+    @property
+    def counts(self) -> ElfCounts:
+        """ Real amounts of program and section headers, following the extended numbering convention """
+        return self._codecs.unpack_counts(self._mmap, self.header)
+
+    @property
+    def segment_count(self) -> int:
+        return self.counts.phnum
+
+    @property
+    def section_count(self) -> int:
+        return self.counts.shnum
+
+    def segment(self, index: int):
+        """
+        Get a program header entry
+
+        :param index: Program header index
+        :return: Phdr namedtuple (see `ElfCodecs`)
+        """
+        return self._codecs.unpack_phdr(self._mmap, self._phdr_offset(index))
+
+    def section(self, index: int):
+        """
+        Get a section header entry
+
+        :param index: Section header index
+        :return: Shdr namedtuple (see `ElfCodecs`)
+        """
+        return self._codecs.unpack_shdr(self._mmap, self._shdr_offset(index))
+
+    def set_header(self, **fields) -> None:
+        """
+        Rewrite fields of the ELF header
+
+        :param fields: Fields to change, e.g. `e_entry=0x1000`
+        :return: None
+        """
+        self._codecs.ehdr.pack_into(self._mmap, 0, *self.header._replace(**fields))
+        self._segment_index = None
+
+    def set_entry(self, entry: int) -> None:
+        """ Set entrypoint address """
+        self.set_header(e_entry=entry)
+
+    def set_segment(self, index: int, **fields) -> None:
+        """
+        Rewrite fields of a program header entry
+
+        :param index: Program header index
+        :param fields: Fields to change, e.g. `p_flags=PF_R | PF_X`
+        :return: None
+        """
+        offset = self._phdr_offset(index)
+        self._codecs.phdr.pack_into(self._mmap, offset, *self._codecs.unpack_phdr(self._mmap, offset)._replace(**fields))
+        self._segment_index = None
+
+    def set_section(self, index: int, **fields) -> None:
+        """
+        Rewrite fields of a section header entry
+
+        :param index: Section header index
+        :param fields: Fields to change, e.g. `sh_addr=0x1000`
+        :return: None
+        """
+        offset = self._shdr_offset(index)
+        self._codecs.shdr.pack_into(self._mmap, offset, *self._codecs.unpack_shdr(self._mmap, offset)._replace(**fields))
+
+    def find_offset(self, address: int) -> Optional[int]:
+        """
+        Get the file offset of the data loaded at a given address
+
+        :param address: Virtual address
+        :return: The file offset or None if the address isn't backed by the file
+        """
+        found = self._get_segment_index().find(address)
+        if found is None:
+            return None
+        start, end, index = found
+        segment = self.segment(index)
+        if address - start >= segment.p_filesz:
+            return None
+        return segment.p_offset + address - start
+
+    def read(self, address: int, size: int) -> bytes:
+        """
+        Read the data loaded at a given address
+
+        :param address: Virtual address
+        :param size: Amount of bytes to read
+        :return: Read data (zeros for the part of a segment past its p_filesz)
+        """
+        index, delta = self._locate(address, size)
+        segment = self.segment(index)
+        data = self._mmap[segment.p_offset + delta:segment.p_offset + min(delta + size, segment.p_filesz)]
+        return data + b'\x00' * (size - len(data))
+
+    def write(self, address: int, data: bytes) -> None:
+        """
+        Patch the data loaded at a given address.
+        The data must be contained in a single PT_LOAD segment. Patching past the segment's p_filesz (into its
+        zero-filled part) grows it in the file, see `replace_segment_data()`.
+
+        :param address: Virtual address
+        :param data: Data to write
+        :return: None
+        """
+        index, delta = self._locate(address, len(data))
+        segment = self.segment(index)
+        if delta + len(data) <= segment.p_filesz:
+            offset = segment.p_offset + delta
+            self._mmap[offset:offset + len(data)] = data
+            return
+
+        contents = bytearray(self._mmap[segment.p_offset:segment.p_offset + segment.p_filesz])
+        contents += b'\x00' * (delta - len(contents))
+        contents[delta:delta + len(data)] = data
+        self.replace_segment_data(index, contents)
+
+    def replace_segment_data(self, index: int, data: bytes) -> None:
+        """
+        Replace the file contents of a segment, updating p_filesz (and p_memsz when the segment grows).
+        Sections located inside the segment's contents follow them if they have to be moved.
+
+        :param index: Program header index
+        :param data: New contents
+        :return: None
+        """
+        segment = self.segment(index)
+        offset = segment.p_offset
+        if len(data) > segment.p_filesz:
+            # keep p_offset congruent to p_vaddr modulo p_align, as required for loadable segments
+            offset = self._append(data, segment.p_vaddr % segment.p_align if segment.p_align > 1 else 0,
+                                  max(segment.p_align, 1))
+            for i in range(self.section_count):
+                section = self.section(i)
+                if section.sh_type not in (elf_consts.SHT_NULL, elf_consts.SHT_NOBITS) and \
+                        segment.p_offset <= section.sh_offset < segment.p_offset + segment.p_filesz:
+                    self.set_section(i, sh_offset=section.sh_offset - segment.p_offset + offset)
+        else:
+            self._mmap[offset:offset + len(data)] = data
+
+        self.set_segment(index, p_offset=offset, p_filesz=len(data), p_memsz=max(segment.p_memsz, len(data)))
+
+    def replace_section_data(self, index: int, data: bytes) -> None:
+        """
+        Replace the contents of a section which isn't part of any segment (e.g. `.comment` or `.symtab`),
+        updating its sh_size.
+
+        :param index: Section header index
+        :param data: New contents
+        :return: None
+        """
+        section = self.section(index)
+        if section.sh_type == elf_consts.SHT_NOBITS:
+            raise ValueError('SHT_NOBITS sections have no contents')
+        offset = section.sh_offset
+        if len(data) > section.sh_size:
+            offset = self._append(data, 0, max(section.sh_addralign, 1))
+        else:
+            self._mmap[offset:offset + len(data)] = data
+        self.set_section(index, sh_offset=offset, sh_size=len(data))
+
+    def _locate(self, address: int, size: int) -> Tuple[int, int]:
+        """ Find the segment containing [address, address + size), returning its index and the address' delta """
+        found = self._get_segment_index().find(address)
+        if found is None or address + size > found[1]:
+            raise ValueError(f'range 0x{address:x}-0x{address + size:x} is not contained in a PT_LOAD segment')
+        start, _, index = found
+        return index, address - start
+
+    def _append(self, data: bytes, congruence: int, alignment: int) -> int:
+        """ Append data at the end of the file, at an offset equal to `congruence` modulo `alignment` """
+        size = len(self._mmap)
+        offset = size + (congruence - size) % alignment
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.seek(size)
+        self._file.write(b'\x00' * (offset - size))
+        self._file.write(data)
+        self._file.flush()
+        self._map()
+        return offset
+
+    def _map(self) -> None:
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE)
+        except (ValueError, OSError) as e:
+            raise InvalidElfError(f'failed to map {self._file.name}') from e
+
+    def _phdr_offset(self, index: int) -> int:
+        header = self.header
+        count = self._codecs.unpack_counts(self._mmap, header).phnum
+        return self._entry_offset(index, count, header.e_phoff, header.e_phentsize, self._codecs.phdr.size)
+
+    def _shdr_offset(self, index: int) -> int:
+        header = self.header
+        count = self._codecs.unpack_counts(self._mmap, header).shnum
+        return self._entry_offset(index, count, header.e_shoff, header.e_shentsize, self._codecs.shdr.size)
+
+    def _entry_offset(self, index: int, count: int, table_offset: int, entry_size: int, size: int) -> int:
+        if not 0 <= index < count:
+            raise IndexError(f'index {index} is out of range')
+        offset = table_offset + index * entry_size
+        if offset + size > len(self._mmap):
+            raise InvalidElfError(f'range 0x{offset:x}-0x{offset + size:x} is outside of the file')
+        return offset
+
+    def _get_segment_index(self) -> IntervalIndex:
+        """ Get an index of the PT_LOAD segments by their address, rebuilding it if the program headers changed """
+        if self._segment_index is None:
+            segments = (self.segment(i) for i in range(self.segment_count))
+            self._segment_index = IntervalIndex(
+                (segment.p_vaddr, segment.p_vaddr + segment.p_memsz, i) for i, segment in enumerate(segments)
+                if segment.p_type == elf_consts.PT_LOAD and segment.p_memsz)
+        return self._segment_index
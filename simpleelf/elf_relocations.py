@@ -0,0 +1,182 @@
+import sys
+from array import array
+from collections import namedtuple
+from typing import Iterable, Iterator, Optional, Tuple
+
+from simpleelf import elf_consts
+from simpleelf.exceptions import InvalidElfError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Relocation = namedtuple('Relocation', ['offset', 'type', 'symbol', 'addend'])
+
+RELOCATION_TABLE_TYPES = (elf_consts.SHT_REL, elf_consts.SHT_RELA)
+
+# (word size, array typecode of unsigned/signed words, r_info symbol shift) per class
+_LAYOUTS = {
+    elf_consts.ELFCLASS32: (4, 'I', 'i', 8),
+    elf_consts.ELFCLASS64: (8, 'Q', 'q', 32),
+}
+
+
+class Relocations:
+    """
+    Decoded relocation table (SHT_REL or SHT_RELA).
+
+    Entries are kept as columns: numpy arrays when numpy is installed, `array.array`s otherwise. Whole tables are
+    decoded at once (using a structured dtype over the raw data, or by reinterpreting it as an array of words), so
+    decoding doesn't involve a Python call per entry. `types` and `symbols` hold the two halves of each r_info.
+    """
+
+    def __init__(self, offsets, infos, addends, elf_class: int):
+        """
+        :param offsets: r_offset column
+        :param infos: r_info column
+        :param addends: r_addend column, or None for SHT_REL tables
+        :param elf_class: Either ELFCLASS32 or ELFCLASS64
+        """
+        self.offsets = offsets
+        self.infos = infos
+        self.addends = addends
+        self.elf_class = elf_class
+        self._types = None
+        self._symbols = None
+
+    @classmethod
+    def decode(cls, data: bytes, elf_class: int, endianity: str = '<', rela: bool = True) -> 'Relocations':
+        """
+        Decode a whole relocation table
+
+        :param data: Table contents
+        :param elf_class: Either ELFCLASS32 or ELFCLASS64
+        :param endianity: Either '<' for LE or '>' for BE
+        :param rela: True for SHT_RELA tables (with addends), False for SHT_REL tables
+        :return: Relocations
+        """
+        word_size, unsigned, signed, _ = _LAYOUTS[elf_class]
+        fields = 3 if rela else 2
+        entry_size = word_size * fields
+        if len(data) % entry_size:
+            raise InvalidElfError(f'relocation table size 0x{len(data):x} is not a multiple of 0x{entry_size:x}')
+
+        if np is not None:
+            fields_dtype = [('r_offset', f'{endianity}u{word_size}'), ('r_info', f'{endianity}u{word_size}')]
+            if rela:
+                fields_dtype.append(('r_addend', f'{endianity}i{word_size}'))
+            table = np.frombuffer(data, dtype=np.dtype(fields_dtype))
+            # convert into the native byte order, so later computations don't have to swap each time
+            addends = table['r_addend'].astype(np.int64) if rela else None
+            return cls(table['r_offset'].astype(np.uint64), table['r_info'].astype(np.uint64), addends, elf_class)
+
+        words = array(unsigned)
+        words.frombytes(data)
+        if (endianity == '<') != (sys.byteorder == 'little'):
+            words.byteswap()
+        addends = array(signed, words[2::3].tobytes()) if rela else None
+        return cls(words[0::fields], words[1::fields], addends, elf_class)
+
+    @classmethod
+    def from_section(cls, elf, index: int) -> 'Relocations':
+        """
+        Decode the relocation table of an ElfFile's section
+
+        :param elf: ElfFile
+        :param index: Index of a SHT_REL/SHT_RELA section
+        :return: Relocations
+        """
+        section_type = int(elf.section(index).sh_type)
+        if section_type not in RELOCATION_TABLE_TYPES:
+            raise ValueError(f'section {index} is not a relocation table')
+        with elf.section_data(index) as view:
+            data = bytes(view)
+        return cls.decode(data, elf.elf_class, elf.endianity, rela=section_type == elf_consts.SHT_RELA)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, index: int) -> Relocation:
+        return Relocation(offset=int(self.offsets[index]), type=int(self.types[index]),
+                          symbol=int(self.symbols[index]),
+                          addend=None if self.addends is None else int(self.addends[index]))
+
+    def __iter__(self) -> Iterator[Relocation]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def types(self):
+        """ Relocation type of each entry (ELF32_R_TYPE/ELF64_R_TYPE of r_info) """
+        if self._types is None:
+            self._split_infos()
+        return self._types
+
+    @property
+    def symbols(self):
+        """ Symbol table index of each entry (ELF32_R_SYM/ELF64_R_SYM of r_info) """
+        if self._symbols is None:
+            self._split_infos()
+        return self._symbols
+
+    def filter(self, types: Optional[Iterable[int]] = None, symbols: Optional[Iterable[int]] = None) -> 'Relocations':
+        """
+        Select the entries matching the given relocation types and/or symbol indices
+
+        :param types: Relocation types to keep (None keeps all)
+        :param symbols: Symbol indices to keep (None keeps all)
+        :return: Relocations holding only the matching entries
+        """
+        if np is not None and isinstance(self.offsets, np.ndarray):
+            mask = np.ones(len(self), dtype=bool)
+            if types is not None:
+                mask &= np.isin(self.types, np.fromiter(types, dtype=np.uint64))
+            if symbols is not None:
+                mask &= np.isin(self.symbols, np.fromiter(symbols, dtype=np.uint64))
+            return Relocations(self.offsets[mask], self.infos[mask],
+                               None if self.addends is None else self.addends[mask], self.elf_class)
+
+        types = None if types is None else set(types)
+        symbols = None if symbols is None else set(symbols)
+        selected = [i for i, (type_, symbol) in enumerate(zip(self.types, self.symbols))
+                    if (types is None or type_ in types) and (symbols is None or symbol in symbols)]
+        offsets = array(self.offsets.typecode, (self.offsets[i] for i in selected))
+        infos = array(self.infos.typecode, (self.infos[i] for i in selected))
+        addends = None if self.addends is None else array(self.addends.typecode, (self.addends[i] for i in selected))
+        return Relocations(offsets, infos, addends, self.elf_class)
+
+    def _split_infos(self) -> None:
+        _, unsigned, _, shift = _LAYOUTS[self.elf_class]
+        mask = (1 << shift) - 1
+        if np is not None and isinstance(self.infos, np.ndarray):
+            self._types = self.infos & np.uint64(mask)
+            self._symbols = self.infos >> np.uint64(shift)
+        else:
+            self._types = array(unsigned, (info & mask for info in self.infos))
+            self._symbols = array(unsigned, (info >> shift for info in self.infos))
+
+
+def iter_relocations(elf) -> Iterator[Tuple[int, Relocations]]:
+    """
+    Decode all relocation tables of an ElfFile
+
+    :param elf: ElfFile
+    :return: Generator of (section index, Relocations) tuples
+    """
+    for i, section in enumerate(elf.sections()):
+        if int(section.sh_type) in RELOCATION_TABLE_TYPES:
+            yield i, Relocations.from_section(elf, i)
+
+
+def relocation_info(symbol: int, type_: int, elf_class: int) -> int:
+    """
+    Build a relocation's r_info
+
+    :param symbol: Symbol table index
+    :param type_: Relocation type (machine specific)
+    :param elf_class: Either ELFCLASS32 or ELFCLASS64
+    :return: r_info value
+    """
+    shift = _LAYOUTS[elf_class][3]
+    return (symbol << shift) | (type_ & ((1 << shift) - 1))
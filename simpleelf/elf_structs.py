@@ -1,11 +1,41 @@
-from construct import Array, Bytes, Const, Default, Enum, Hex, If, Int8ub, Int8ul, Int16ub, Int16ul, Int32ub, Int32ul, \
-    Int64ub, Int64ul, Padding, Pointer, Struct, this
+import functools
+import os
+import struct
+from collections import namedtuple
+from io import BytesIO
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple, Union
+
+from construct import Array, Bytes, Computed, Const, ConstructError, Container, Default, Enum, Hex, If, Int8ub, Int8ul, \
+    Int16ub, Int16ul, Int32ub, Int32ul, Int64ub, Int64ul, Padding, Pointer, Struct, this
 
 from simpleelf import elf_consts
+from simpleelf.elf_codecs import get_counts, uses_extended_numbering
+from simpleelf.exceptions import InvalidElfError
+from simpleelf.stats import NULL_STATS, Stats
+
+ElfIdentity = namedtuple('ElfIdentity', ['elf_class', 'endianity', 'machine', 'type', 'entry'])
+
+# enough to hold the e_ident, e_type, e_machine, e_version and e_entry fields of both Elf32_Ehdr and Elf64_Ehdr
+IDENTIFY_SIZE = 64
+
+# e_type, e_machine, e_version, e_entry
+_IDENTIFY_STRUCTS = {
+    (elf_consts.ELFCLASS32, elf_consts.ELFDATA2LSB): struct.Struct('<HHII'),
+    (elf_consts.ELFCLASS32, elf_consts.ELFDATA2MSB): struct.Struct('>HHII'),
+    (elf_consts.ELFCLASS64, elf_consts.ELFDATA2LSB): struct.Struct('<HHIQ'),
+    (elf_consts.ELFCLASS64, elf_consts.ELFDATA2MSB): struct.Struct('>HHIQ'),
+}
+
+
+# fixed-size records which construct is able to compile. structs pointing at their payloads are left out since
+# their conditions compare against enum strings, which construct's compiler doesn't quote. the enums themselves are
+# left out as well, since compiling them loses the attribute access to their members
+COMPILABLE_STRUCTS = ('Elf32_Ehdr', 'Elf64_Ehdr', 'Elf32_PhdrEntry', 'Elf64_PhdrEntry', 'Elf32_ShdrEntry',
+                      'Elf64_ShdrEntry', 'Elf32_Sym', 'Elf64_Sym')
 
 
 class ElfStructs:
-    def __init__(self, endianity='<'):
+    def __init__(self, endianity='<', compiled=False):
         if endianity == '<':
             Int8u = Int8ul
             Int16u = Int16ul
@@ -303,13 +333,14 @@ class ElfStructs:
                                     SHT_SHLIB=elf_consts.SHT_SHLIB,
                                     SHT_DYNSYM=elf_consts.SHT_DYNSYM,
                                     SHT_NUM=elf_consts.SHT_NUM,
+                                    SHT_SYMTAB_SHNDX=elf_consts.SHT_SYMTAB_SHNDX,
                                     SHT_LOPROC=elf_consts.SHT_LOPROC,
                                     SHT_HIPROC=elf_consts.SHT_HIPROC,
                                     SHT_LOUSER=elf_consts.SHT_LOUSER,
                                     SHT_HIUSER=elf_consts.SHT_HIUSER,
                                     )
 
-        self.Elf32_Phdr = Struct(
+        elf32_phdr_fields = (
             'p_type' / self.Elf_SegmentType,
             'p_offset' / Hex(Elf32_Off),
             'p_vaddr' / Hex(Elf32_Addr),
@@ -318,11 +349,9 @@ class ElfStructs:
             'p_memsz' / Hex(Elf32_Word),
             'p_flags' / Hex(Elf32_Word),
             'p_align' / Hex(Elf32_Word),
-            'data' / If(this.p_type == self.Elf_SegmentType.PT_LOAD,
-                        Pointer(this.p_offset, Bytes(this.p_filesz)))
         )
 
-        self.Elf64_Phdr = Struct(
+        elf64_phdr_fields = (
             'p_type' / self.Elf_SegmentType,
             'p_flags' / Hex(Elf64_Word),
             'p_offset' / Hex(Elf64_Off),
@@ -331,10 +360,18 @@ class ElfStructs:
             'p_filesz' / Hex(Elf64_Xword),
             'p_memsz' / Hex(Elf64_Xword),
             'p_align' / Hex(Elf64_Xword),
-            'data' / If(this.p_type == self.Elf_SegmentType.PT_LOAD,
-                        Pointer(this.p_offset, Bytes(this.p_filesz)))
         )
 
+        segment_data = 'data' / If(this.p_type == self.Elf_SegmentType.PT_LOAD,
+                                   Pointer(this.p_offset, Bytes(this.p_filesz)))
+
+        # table entries without their payload, for readers which fetch the data on demand
+        self.Elf32_PhdrEntry = Struct(*elf32_phdr_fields)
+        self.Elf64_PhdrEntry = Struct(*elf64_phdr_fields)
+
+        self.Elf32_Phdr = Struct(*elf32_phdr_fields, segment_data)
+        self.Elf64_Phdr = Struct(*elf64_phdr_fields, segment_data)
+
         self.Elf32_Ehdr = Struct(
             'e_ident' / Struct(
                 'magic' / Const(elf_consts.ELFMAG),
@@ -387,7 +424,7 @@ class ElfStructs:
             'e_shstrndx' / Hex(Int16u),
         )
 
-        self.Elf32_Shdr = Struct(
+        elf32_shdr_fields = (
             'sh_name' / self.Elf_SectionIndex,
             'sh_type' / self.Elf_SectionType,
             'sh_flags' / Hex(Int32u),
@@ -398,11 +435,9 @@ class ElfStructs:
             'sh_info' / Hex(Int32u),
             'sh_addralign' / Hex(Int32u),
             'sh_entsize' / Hex(Int32u),
-            'data' / If(this.sh_type != self.Elf_SectionType.SHT_NOBITS,
-                        Pointer(this.sh_offset, Bytes(this.sh_size)))
         )
 
-        self.Elf64_Shdr = Struct(
+        elf64_shdr_fields = (
             'sh_name' / self.Elf_SectionIndex,
             'sh_type' / self.Elf_SectionType,
             'sh_flags' / Hex(Elf64_Xword),
@@ -413,22 +448,235 @@ class ElfStructs:
             'sh_info' / Hex(Elf64_Word),
             'sh_addralign' / Hex(Elf64_Xword),
             'sh_entsize' / Hex(Elf64_Xword),
-            'data' / If(this.sh_type != self.Elf_SectionType.SHT_NOBITS,
-                        Pointer(this.sh_offset, Bytes(this.sh_size)))
+        )
+
+        section_data = 'data' / If(this.sh_type != self.Elf_SectionType.SHT_NOBITS,
+                                   Pointer(this.sh_offset, Bytes(this.sh_size)))
+
+        self.Elf32_ShdrEntry = Struct(*elf32_shdr_fields)
+        self.Elf64_ShdrEntry = Struct(*elf64_shdr_fields)
+
+        self.Elf32_Shdr = Struct(*elf32_shdr_fields, section_data)
+        self.Elf64_Shdr = Struct(*elf64_shdr_fields, section_data)
+
+        self.Elf32_Sym = Struct(
+            'st_name' / Hex(Elf32_Word),
+            'st_value' / Hex(Elf32_Addr),
+            'st_size' / Hex(Elf32_Word),
+            'st_info' / Hex(Int8u),
+            'st_other' / Hex(Int8u),
+            'st_shndx' / Hex(Int16u),
+        )
+
+        self.Elf64_Sym = Struct(
+            'st_name' / Hex(Elf64_Word),
+            'st_info' / Hex(Int8u),
+            'st_other' / Hex(Int8u),
+            'st_shndx' / Hex(Int16u),
+            'st_value' / Hex(Elf64_Addr),
+            'st_size' / Hex(Elf64_Xword),
+        )
+
+        self.Elf_CompressionType = Enum(Hex(Int32u),
+                                        ELFCOMPRESS_ZLIB=elf_consts.ELFCOMPRESS_ZLIB,
+                                        ELFCOMPRESS_ZSTD=elf_consts.ELFCOMPRESS_ZSTD,
+                                        )
+
+        # header at the start of the contents of SHF_COMPRESSED sections
+        self.Elf32_Chdr = Struct(
+            'ch_type' / self.Elf_CompressionType,
+            'ch_size' / Hex(Elf32_Word),
+            'ch_addralign' / Hex(Elf32_Word),
+        )
+
+        self.Elf64_Chdr = Struct(
+            'ch_type' / self.Elf_CompressionType,
+            'ch_reserved' / Hex(Elf64_Word),
+            'ch_size' / Hex(Elf64_Xword),
+            'ch_addralign' / Hex(Elf64_Xword),
         )
 
         self.Elf32 = Struct(
             'header' / self.Elf32_Ehdr,
+            '_section0' / Default(If(lambda this: uses_extended_numbering(this.header),
+                                     Pointer(this.header.e_shoff, self.Elf32_ShdrEntry)), _build_section0),
+            '_counts' / Computed(lambda this: get_counts(this.header, this._section0)),
             'segments' / Pointer(this.header.e_phoff,
-                                 Array(this.header.e_phnum, self.Elf32_Phdr)),
+                                 Array(lambda this: this._counts.phnum, self.Elf32_Phdr)),
             'sections' / Pointer(this.header.e_shoff,
-                                 Array(this.header.e_shnum, self.Elf32_Shdr)),
+                                 Array(lambda this: this._counts.shnum, self.Elf32_Shdr)),
         )
 
         self.Elf64 = Struct(
             'header' / self.Elf64_Ehdr,
+            '_section0' / Default(If(lambda this: uses_extended_numbering(this.header),
+                                     Pointer(this.header.e_shoff, self.Elf64_ShdrEntry)), _build_section0),
+            '_counts' / Computed(lambda this: get_counts(this.header, this._section0)),
+            'segments' / Pointer(this.header.e_phoff,
+                                 Array(lambda this: this._counts.phnum, self.Elf64_Phdr)),
+            'sections' / Pointer(this.header.e_shoff,
+                                 Array(lambda this: this._counts.shnum, self.Elf64_Shdr)),
+        )
+
+        # descriptor-only variants, which don't read the segments and sections payloads
+        self.Elf32Headers = Struct(
+            'header' / self.Elf32_Ehdr,
+            '_section0' / Default(If(lambda this: uses_extended_numbering(this.header),
+                                     Pointer(this.header.e_shoff, self.Elf32_ShdrEntry)), _build_section0),
+            '_counts' / Computed(lambda this: get_counts(this.header, this._section0)),
+            'segments' / Pointer(this.header.e_phoff,
+                                 Array(lambda this: this._counts.phnum, self.Elf32_PhdrEntry)),
+            'sections' / Pointer(this.header.e_shoff,
+                                 Array(lambda this: this._counts.shnum, self.Elf32_ShdrEntry)),
+        )
+
+        self.Elf64Headers = Struct(
+            'header' / self.Elf64_Ehdr,
+            '_section0' / Default(If(lambda this: uses_extended_numbering(this.header),
+                                     Pointer(this.header.e_shoff, self.Elf64_ShdrEntry)), _build_section0),
+            '_counts' / Computed(lambda this: get_counts(this.header, this._section0)),
             'segments' / Pointer(this.header.e_phoff,
-                                 Array(this.header.e_phnum, self.Elf64_Phdr)),
+                                 Array(lambda this: this._counts.phnum, self.Elf64_PhdrEntry)),
             'sections' / Pointer(this.header.e_shoff,
-                                 Array(this.header.e_shnum, self.Elf64_Shdr)),
+                                 Array(lambda this: this._counts.shnum, self.Elf64_ShdrEntry)),
         )
+
+        if compiled:
+            for name in COMPILABLE_STRUCTS:
+                setattr(self, name, getattr(self, name).compile())
+
+
+@functools.lru_cache(maxsize=None)
+def get_elf_structs(endianity: str = '<', compiled: bool = False) -> ElfStructs:
+    """
+    Get a shared ElfStructs instance, creating it only on first use
+
+    :param endianity: Either '<' for LE or '>' for BE
+    :param compiled: Use construct's compiled parsers/builders where possible
+    :return: ElfStructs
+    """
+    return ElfStructs(endianity, compiled=compiled)
+
+
+def identify(elf: Union[str, os.PathLike, bytes, bytearray, memoryview]) -> ElfIdentity:
+    """
+    Quickly identify an ELF by decoding only the start of its header
+
+    :param elf: Either a path or a buffer holding (at least) the start of the ELF
+    :return: ElfIdentity
+    """
+    if isinstance(elf, (bytes, bytearray, memoryview)):
+        return _identify_buffer(elf, len(elf))
+
+    with open(elf, 'rb') as f:
+        buf = f.read(IDENTIFY_SIZE)
+    return _identify_buffer(buf, len(buf))
+
+
+def identify_many(paths: Iterable[Union[str, os.PathLike]]) -> Iterator[Tuple[Union[str, os.PathLike],
+                                                                              Optional[ElfIdentity]]]:
+    """
+    Identify many files, reusing a single read buffer
+
+    :param paths: Paths to identify
+    :return: Generator of (path, ElfIdentity or None if the file isn't an ELF or can't be read)
+    """
+    buf = bytearray(IDENTIFY_SIZE)
+    for path in paths:
+        try:
+            with open(path, 'rb', buffering=0) as f:
+                size = f.readinto(buf)
+        except OSError:
+            # e.g. a directory or a file without read permissions, which mustn't stop the rest of the batch
+            yield path, None
+            continue
+        try:
+            yield path, _identify_buffer(buf, size)
+        except InvalidElfError:
+            yield path, None
+
+
+def parse_headers(elf: Union[BinaryIO, bytes, bytearray, memoryview], stats: Optional[Stats] = None) -> Container:
+    """
+    Parse the ELF header and the program/section header tables, without reading the segments and sections payloads.
+    Each section is given a `name` resolved using the section header string table. Payloads can later be read for
+    specific entries using `read_entry_data()`.
+
+    :param elf: Either a binary file object supporting seek (the file is never read as a whole), or a buffer
+    :param stats: Stats object to fill with the timings and counters of the parse
+    :return: Container with `header`, `segments` and `sections`, as parsed by `Elf32Headers/Elf64Headers`
+    """
+    stats = NULL_STATS if stats is None else stats
+    stream = elf if hasattr(elf, 'read') else BytesIO(elf)
+    with stats.phase('parse'):
+        stream.seek(0)
+        identity = identify(stream.read(IDENTIFY_SIZE))
+        structs = get_elf_structs(identity.endianity)
+        headers_struct = structs.Elf32Headers if identity.elf_class == elf_consts.ELFCLASS32 else structs.Elf64Headers
+
+        stream.seek(0)
+        try:
+            headers = headers_struct.parse_stream(stream)
+        except ConstructError as e:
+            raise InvalidElfError(f'failed to parse the ELF headers: {e}') from e
+
+    with stats.phase('section_names'):
+        shstrtab = b''
+        shstrndx = headers._counts.shstrndx
+        if shstrndx != elf_consts.SHN_UNDEF and shstrndx < len(headers.sections):
+            shstrtab = read_entry_data(stream, headers.sections[shstrndx])
+        for section in headers.sections:
+            offset = int(section.sh_name)
+            end = shstrtab.find(b'\x00', offset)
+            section.name = shstrtab[offset:end if end != -1 else len(shstrtab)].decode(errors='replace')
+
+    stats.count('segments', len(headers.segments))
+    stats.count('sections', len(headers.sections))
+    stats.finish()
+    return headers
+
+
+def read_entry_data(stream: BinaryIO, entry: Container) -> bytes:
+    """
+    Read the payload of a single program or section header entry
+
+    :param stream: Binary file object supporting seek
+    :param entry: Program or section header entry, e.g. from `parse_headers()`
+    :return: The entry's data (empty for SHT_NOBITS sections)
+    """
+    if 'p_offset' in entry:
+        offset, size = entry.p_offset, entry.p_filesz
+    elif int(entry.sh_type) == elf_consts.SHT_NOBITS:
+        return b''
+    else:
+        offset, size = entry.sh_offset, entry.sh_size
+
+    stream.seek(offset)
+    data = stream.read(size)
+    if len(data) != size:
+        raise InvalidElfError(f'range 0x{offset:x}-0x{offset + size:x} is outside of the file')
+    return data
+
+
+def _build_section0(this) -> Optional[Container]:
+    """ Section header 0 to build when not given explicitly, which is the first entry of the section header table """
+    if not uses_extended_numbering(this.header):
+        return None
+    return this.sections[0]
+
+
+def _identify_buffer(buf, size: int) -> ElfIdentity:
+    if size < elf_consts.EI_NIDENT or buf[:4] != elf_consts.ELFMAG:
+        raise InvalidElfError('bad ELF magic')
+
+    elf_class = buf[4]
+    data = buf[5]
+    fields = _IDENTIFY_STRUCTS.get((elf_class, data))
+    if fields is None:
+        raise InvalidElfError(f'unsupported ELF class/data: {elf_class}/{data}')
+    if size < elf_consts.EI_NIDENT + fields.size:
+        raise InvalidElfError('truncated ELF header')
+
+    e_type, e_machine, _, e_entry = fields.unpack_from(buf, elf_consts.EI_NIDENT)
+    return ElfIdentity(elf_class=elf_class, endianity='<' if data == elf_consts.ELFDATA2LSB else '>',
+                       machine=e_machine, type=e_type, entry=e_entry)
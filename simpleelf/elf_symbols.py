@@ -0,0 +1,197 @@
+import itertools
+from bisect import bisect_right
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from construct import Container
+
+from simpleelf import elf_consts
+from simpleelf.elf_codecs import get_elf_codecs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Symbol = namedtuple('Symbol', ['name', 'value', 'size', 'info', 'other', 'shndx'],
+                    defaults=(0, (elf_consts.STB_GLOBAL << 4) | elf_consts.STT_NOTYPE, elf_consts.STV_DEFAULT, None))
+
+SYMBOL_TABLE_TYPES = (elf_consts.SHT_SYMTAB, elf_consts.SHT_DYNSYM)
+
+# symbols which don't describe code or data at their address
+_NON_ADDRESS_TYPES = (elf_consts.STT_SECTION, elf_consts.STT_FILE)
+
+# below this amount of addresses, the overhead of converting them into a numpy array isn't worth it
+_VECTORIZE_THRESHOLD = 64
+
+
+class SymbolIndex:
+    """
+    Address and name index over the symbols of an ELF.
+
+    Symbols with a size are kept sorted by address, along with a running maximum of their ends, so the symbol
+    containing an address is found using bisect even when symbols overlap. Zero-sized symbols (labels) are kept in a
+    second sorted list and only match addresses for which they are the closest preceding symbol.
+    """
+
+    def __init__(self, symbols: Iterable[Symbol]):
+        sized = []
+        labels = []
+        self._names: Dict[str, Symbol] = {}
+
+        for symbol in symbols:
+            if symbol.name:
+                existing = self._names.get(symbol.name)
+                # prefer global symbols over local ones sharing the same name
+                if existing is None or (existing.info >> 4 == elf_consts.STB_LOCAL and
+                                        symbol.info >> 4 != elf_consts.STB_LOCAL):
+                    self._names[symbol.name] = symbol
+
+            if symbol.shndx == elf_consts.SHN_UNDEF or symbol.info & 0xf in _NON_ADDRESS_TYPES:
+                continue
+            if symbol.size:
+                sized.append(symbol)
+            else:
+                labels.append(symbol)
+
+        # symbols sharing the same start are ordered from the biggest, so lookups find the innermost one first
+        sized.sort(key=lambda symbol: (symbol.value, -symbol.size))
+        labels.sort(key=lambda symbol: symbol.value)
+        self._symbols = sized
+        self._starts = [symbol.value for symbol in sized]
+        self._ends = [symbol.value + symbol.size for symbol in sized]
+        self._max_ends = list(itertools.accumulate(self._ends, max))
+        self._labels = labels
+        self._label_values = [symbol.value for symbol in labels]
+
+        self._np_starts = None
+        self._np_ends = None
+
+    @classmethod
+    def from_elf_file(cls, elf) -> 'SymbolIndex':
+        """
+        Create an index of the symbols of all SHT_SYMTAB/SHT_DYNSYM sections of an ElfFile
+
+        :param elf: ElfFile
+        :return: SymbolIndex
+        """
+        tables = []
+        for i, section in enumerate(elf.sections()):
+            if int(section.sh_type) in SYMBOL_TABLE_TYPES:
+                tables.append((elf.section_data(i), elf.section_data(section.sh_link)))
+        return cls(iter_symbols(tables, elf.elf_class, elf.endianity))
+
+    @classmethod
+    def from_parsed(cls, elf: Container) -> 'SymbolIndex':
+        """
+        Create an index of the symbols of all SHT_SYMTAB/SHT_DYNSYM sections of an `Elf32/Elf64.parse()` result
+
+        :param elf: Parsed ELF
+        :return: SymbolIndex
+        """
+        ident = elf.header.e_ident
+        endianity = '<' if int(ident.data) == elf_consts.ELFDATA2LSB else '>'
+        tables = [(section.data, elf.sections[section.sh_link].data) for section in elf.sections
+                  if int(section.sh_type) in SYMBOL_TABLE_TYPES]
+        return cls(iter_symbols(tables, int(ident['class']), endianity))
+
+    def __len__(self) -> int:
+        return len(self._symbols) + len(self._labels)
+
+    def lookup(self, name: str) -> Optional[Symbol]:
+        """
+        Find a symbol by its name
+
+        :param name: Symbol name
+        :return: Symbol or None if not found
+        """
+        return self._names.get(name)
+
+    def symbolize(self, address: int) -> Optional[Tuple[Symbol, int]]:
+        """
+        Find the symbol an address belongs to
+
+        :param address: Address to symbolize
+        :return: None if no symbol matches, or a tuple of the symbol and the address' offset from its start
+        """
+        i = bisect_right(self._starts, address) - 1
+        nearest = i
+        while i >= 0 and self._max_ends[i] > address:
+            if self._ends[i] > address:
+                return self._symbols[i], address - self._starts[i]
+            i -= 1
+
+        j = bisect_right(self._label_values, address) - 1
+        if j < 0 or (nearest >= 0 and self._starts[nearest] > self._label_values[j]):
+            # either there is no label before the address, or a sized symbol ending before the address is closer
+            return None
+        return self._labels[j], address - self._label_values[j]
+
+    def symbolize_many(self, addresses: Iterable[int]) -> List[Optional[Tuple[Symbol, int]]]:
+        """
+        Symbolize many addresses at once.
+        When numpy is available, the lookup of the sized symbols is vectorized and only the misses are looked up one
+        by one.
+
+        :param addresses: Addresses to symbolize
+        :return: List of results, ordered as `addresses`. See `symbolize()`
+        """
+        addresses = list(addresses)
+        if np is None or len(addresses) < _VECTORIZE_THRESHOLD or not self._symbols:
+            return [self.symbolize(address) for address in addresses]
+
+        if self._np_starts is None:
+            self._np_starts = np.array(self._starts, dtype=np.uint64)
+            self._np_ends = np.array(self._ends, dtype=np.uint64)
+
+        values = np.array(addresses, dtype=np.uint64)
+        indices = np.searchsorted(self._np_starts, values, side='right').astype(np.int64) - 1
+        hits = (indices >= 0) & (self._np_ends[np.maximum(indices, 0)] > values)
+
+        results = []
+        for address, index, hit in zip(addresses, indices.tolist(), hits.tolist()):
+            if hit:
+                results.append((self._symbols[index], address - self._starts[index]))
+            else:
+                # overlapping symbols and labels are handled by the scalar lookup
+                results.append(self.symbolize(address))
+        return results
+
+
+def iter_symbols(tables: Iterable[Tuple[bytes, bytes]], elf_class: int, endianity: str) -> Iterable[Symbol]:
+    """
+    Decode symbol tables
+
+    :param tables: Iterable of (symbol table contents, linked string table contents) tuples
+    :param elf_class: Either ELFCLASS32 or ELFCLASS64
+    :param endianity: Either '<' for LE or '>' for BE
+    :return: Generator of the decoded symbols, skipping the null symbol of each table
+    """
+    codecs = get_elf_codecs(elf_class, endianity)
+    for symtab, strtab in tables:
+        strtab = bytes(strtab)
+        size = len(symtab) - len(symtab) % codecs.sym.size
+        syms = codecs.iter_syms(memoryview(symtab)[:size])
+        next(syms, None)
+        for sym in syms:
+            end = strtab.find(b'\x00', sym.st_name)
+            name = strtab[sym.st_name:end if end != -1 else len(strtab)].decode(errors='replace')
+            yield Symbol(name=name, value=sym.st_value, size=sym.st_size, info=sym.st_info, other=sym.st_other,
+                         shndx=sym.st_shndx)
+
+
+def get_symbol_index(elf) -> SymbolIndex:
+    """
+    Get the symbol index of an ELF, building it only on first use
+
+    :param elf: Either an ElfFile or an `Elf32/Elf64.parse()` result
+    :return: SymbolIndex
+    """
+    if isinstance(elf, Container):
+        # cached under a private key, which construct ignores when building or printing
+        index = elf.get('_symbol_index')
+        if index is None:
+            index = SymbolIndex.from_parsed(elf)
+            elf['_symbol_index'] = index
+        return index
+    return elf.symbol_index()
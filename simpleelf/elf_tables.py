@@ -0,0 +1,104 @@
+import re
+import struct
+from typing import Optional
+
+from simpleelf.elf_codecs import get_elf_codecs
+from simpleelf.elf_structs import IDENTIFY_SIZE, identify
+from simpleelf.exceptions import InvalidElfError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TABLES = ('segments', 'sections')
+
+_NUMPY_FORMATS = {'B': 'u1', 'H': 'u2', 'I': 'u4', 'Q': 'u8', 's': 'S'}
+
+
+def table_dtype(elf_class: int, endianity: str, table: str, entry_size: Optional[int] = None):
+    """
+    Get a numpy structured dtype describing a program/section header table entry, with one field per header field.
+    The byte order is part of the dtype, so decoding doesn't require swapping.
+
+    :param elf_class: Either ELFCLASS32 or ELFCLASS64
+    :param endianity: Either '<' for LE or '>' for BE
+    :param table: Either 'segments' or 'sections'
+    :param entry_size: Size of each entry (e_phentsize/e_shentsize), if bigger than the standard one
+    :return: numpy.dtype
+    """
+    _require_numpy()
+    codecs = get_elf_codecs(elf_class, endianity)
+    if table == 'segments':
+        record, codec = codecs.Phdr, codecs.phdr
+    elif table == 'sections':
+        record, codec = codecs.Shdr, codecs.shdr
+    else:
+        raise ValueError(f'table must be one of {TABLES}')
+
+    formats = []
+    offsets = []
+    offset = 0
+    for count, code in re.findall(r'(\d*)([a-zA-Z])', codec.format[1:]):
+        size = struct.calcsize(count + code)
+        formats.append(f'{endianity}{_NUMPY_FORMATS[code]}{size if code == "s" else ""}')
+        offsets.append(offset)
+        offset += size
+    return np.dtype({'names': list(record._fields), 'formats': formats, 'offsets': offsets,
+                     'itemsize': max(entry_size or codec.size, codec.size)})
+
+
+def decode_table(buffer, elf_class: int, endianity: str, table: str, offset: int, count: int,
+                 entry_size: Optional[int] = None):
+    """
+    Decode a program/section header table into a structured array, in a single vectorized operation
+
+    :param buffer: Buffer holding the ELF
+    :param elf_class: Either ELFCLASS32 or ELFCLASS64
+    :param endianity: Either '<' for LE or '>' for BE
+    :param table: Either 'segments' or 'sections'
+    :param offset: Offset of the table (e_phoff/e_shoff)
+    :param count: Amount of entries (e_phnum/e_shnum)
+    :param entry_size: Size of each entry (e_phentsize/e_shentsize)
+    :return: numpy structured array, owning a copy of the table
+    """
+    dtype = table_dtype(elf_class, endianity, table, entry_size)
+    size = count * dtype.itemsize
+    if offset + size > len(buffer):
+        raise InvalidElfError(f'range 0x{offset:x}-0x{offset + size:x} is outside of the file')
+    # copy, so the result doesn't keep the (possibly memory mapped) buffer exported
+    return np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).copy()
+
+
+def to_numpy(buffer, table: str = 'segments'):
+    """
+    Decode the program or section header table of an ELF held in a buffer
+
+    :param buffer: Buffer holding the ELF (bytes, mmap, memoryview...)
+    :param table: Either 'segments' or 'sections'
+    :return: numpy structured array, see `table_dtype()`
+    """
+    identity = identify(memoryview(buffer)[:IDENTIFY_SIZE])
+    codecs = get_elf_codecs(identity.elf_class, identity.endianity)
+    header = codecs.unpack_ehdr(buffer)
+    counts = codecs.unpack_counts(buffer, header)
+    if table == 'segments':
+        location = (header.e_phoff, counts.phnum, header.e_phentsize)
+    else:
+        location = (header.e_shoff, counts.shnum, header.e_shentsize)
+    return decode_table(buffer, identity.elf_class, identity.endianity, table, *location)
+
+
+def to_records(buffer, table: str = 'segments'):
+    """ Same as `to_numpy()`, returned as a numpy record array (fields are also accessible as attributes) """
+    return as_records(to_numpy(buffer, table))
+
+
+def as_records(table):
+    """ View a structured array as a numpy record array, without copying it """
+    return table.view(np.recarray)
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError('numpy is required for decoding tables into arrays')
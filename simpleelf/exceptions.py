@@ -0,0 +1,19 @@
+class SimpleElfError(Exception):
+    """ Base class for all simpleelf errors """
+    pass
+
+
+class InvalidElfError(SimpleElfError):
+    """ The given buffer isn't a well-formed ELF """
+    pass
+
+
+class OverlappingSegmentsError(SimpleElfError):
+    """ Segments added to an ElfBuilder overlap in memory """
+
+    def __init__(self, overlaps):
+        self.overlaps = overlaps
+        described = ', '.join(f'{overlap.first} and {overlap.second} at 0x{overlap.start:x}-0x{overlap.end:x}'
+                              for overlap in overlaps[:8])
+        more = f' (and {len(overlaps) - 8} more)' if len(overlaps) > 8 else ''
+        super().__init__(f'overlapping segments: {described}{more}')
@@ -0,0 +1,129 @@
+import mmap
+import os
+from typing import BinaryIO, Iterator, Optional, Union
+
+CHUNK_SIZE = 1 << 20
+
+
+class FileContents:
+    """
+    Contents backed by a region of a file.
+
+    Only the path and the region are kept; the data is read when it is actually needed. Supports `len()` and
+    indexing/slicing like a bytes object, so it can be used anywhere segment contents are expected.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike], offset: int = 0, size: Optional[int] = None):
+        self.path = os.fspath(path)
+        self.offset = offset
+
+        file_size = os.path.getsize(self.path)
+        if size is None:
+            size = file_size - offset
+        if offset < 0 or size < 0 or offset + size > file_size:
+            raise ValueError(f'region 0x{offset:x}+0x{size:x} is outside of {self.path} (size 0x{file_size:x})')
+        self.size = size
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} {self.path} offset=0x{self.offset:x} size=0x{self.size:x}>'
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[int, bytes]:
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.size)
+            data = self.read(start, max(stop - start, 0))
+            return data if step == 1 else data[::step]
+
+        if item < 0:
+            item += self.size
+        if not 0 <= item < self.size:
+            raise IndexError('index out of range')
+        return self.read(item, 1)[0]
+
+    def __bytes__(self) -> bytes:
+        return self.read(0, self.size)
+
+    def read(self, offset: int, size: int) -> bytes:
+        """
+        Read data from the backing file
+
+        :param offset: Offset relative to the start of the region
+        :param size: Amount of bytes to read, truncated to the end of the region
+        :return: Read data
+        """
+        size = max(min(size, self.size - offset), 0)
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset + offset)
+            return f.read(size)
+
+    def iter_chunks(self, start: int = 0, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """ Iterate the contents from a given offset, in chunks of up to `chunk_size` bytes """
+        remaining = self.size - start
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset + start)
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise EOFError(f'{self.path} was truncated')
+                remaining -= len(chunk)
+                yield chunk
+
+    def write_to(self, f: BinaryIO) -> int:
+        """
+        Copy the contents into a file object at its current position.
+        When writing into a real file, the copy is done by the kernel (copy_file_range/sendfile) when possible.
+
+        :param f: Binary file object opened for writing
+        :return: Amount of bytes copied by the kernel, the rest was copied by reading and writing it
+        """
+        copied = self._kernel_copy(f) if self.size else 0
+        for chunk in self.iter_chunks(copied):
+            f.write(chunk)
+        return copied
+
+    def _kernel_copy(self, f: BinaryIO) -> int:
+        """ Try copying the contents using the kernel, returning the amount of bytes copied """
+        try:
+            fd = f.fileno()
+        except (AttributeError, OSError, ValueError):
+            # BytesIO and friends aren't backed by a file descriptor
+            return 0
+        if not f.seekable():
+            return 0
+
+        # flush buffered data, so it gets to the file before the data being copied
+        f.flush()
+        position = f.tell()
+
+        copied = 0
+        with open(self.path, 'rb') as src:
+            for copy in (_copy_file_range, _sendfile):
+                try:
+                    while copied < self.size:
+                        count = copy(src.fileno(), fd, self.offset + copied, position + copied, self.size - copied)
+                        if count == 0:
+                            break
+                        copied += count
+                    break
+                except (AttributeError, OSError):
+                    # not supported by the platform, or between these two files
+                    continue
+
+        # the copy was done behind the file object's back, so move it to the end of the copied data
+        f.seek(position + copied)
+        return copied
+
+
+def _copy_file_range(src: int, dst: int, src_offset: int, dst_offset: int, count: int) -> int:
+    return os.copy_file_range(src, dst, count, src_offset, dst_offset)
+
+
+def _sendfile(src: int, dst: int, src_offset: int, dst_offset: int, count: int) -> int:
+    # sendfile writes at the destination's current position
+    os.lseek(dst, dst_offset, os.SEEK_SET)
+    return os.sendfile(dst, src, src_offset, count)
+
+
+SegmentContents = Union[bytes, bytearray, memoryview, mmap.mmap, FileContents]
@@ -0,0 +1,75 @@
+import itertools
+from bisect import bisect_right
+from typing import Any, Iterable, List, Optional, Tuple
+
+Interval = Tuple[int, int, Any]
+
+
+class IntervalIndex:
+    """
+    Index of half-open [start, end) intervals, each carrying an arbitrary value.
+
+    Point lookups are O(log n) using bisect over the sorted starts. Overlapping intervals are supported: a running
+    maximum of the ends is kept so a lookup only walks back over intervals which may still contain the address.
+    """
+
+    def __init__(self, intervals: Iterable[Interval]):
+        # sort is stable, so intervals sharing the same start keep their insertion order
+        intervals = sorted(intervals, key=lambda interval: interval[0])
+        self._starts = [interval[0] for interval in intervals]
+        self._ends = [interval[1] for interval in intervals]
+        self._values = [interval[2] for interval in intervals]
+        self._max_ends = list(itertools.accumulate(self._ends, max))
+
+    def insert(self, start: int, end: int, value: Any) -> None:
+        """
+        Add an interval, keeping the index sorted. Appending in address order is O(1) (amortized), otherwise the
+        intervals following the new one are shifted
+
+        :param start: Interval's start
+        :param end: Interval's end (exclusive)
+        :param value: Value carried by the interval
+        :return: None
+        """
+        # insert after intervals sharing the same start, as the constructor's stable sort does
+        i = bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+        self._values.insert(i, value)
+        self._max_ends.insert(i, max(end, self._max_ends[i - 1]) if i else end)
+        # the running maximum is non-decreasing, so stop at the first entry which already covers the new end
+        for j in range(i + 1, len(self._max_ends)):
+            if self._max_ends[j] >= end:
+                break
+            self._max_ends[j] = end
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __iter__(self):
+        return zip(self._starts, self._ends, self._values)
+
+    def find(self, address: int) -> Optional[Interval]:
+        """
+        Find the interval containing a given address
+
+        :param address: Address to look for
+        :return: None if no interval contains the address, or a (start, end, value) tuple of the containing
+                 interval with the highest start
+        """
+        i = bisect_right(self._starts, address) - 1
+        while i >= 0 and self._max_ends[i] > address:
+            if self._ends[i] > address:
+                return self._starts[i], self._ends[i], self._values[i]
+            i -= 1
+        return None
+
+    def find_many(self, addresses: Iterable[int]) -> List[Optional[Interval]]:
+        """
+        Find the intervals containing each of the given addresses
+
+        :param addresses: Addresses to look for
+        :return: List of results, ordered as `addresses`. See `find()`
+        """
+        find = self.find
+        return [find(address) for address in addresses]
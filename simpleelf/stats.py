@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Optional
+
+
+class Stats:
+    """
+    Per-phase timings and counters of a build or a parse.
+
+    Pass an instance to an instrumented entry point (e.g. `ElfBuilder.build(stats=...)`) to have it filled. Timings
+    of a phase entered several times are accumulated. Once the operation is done, `callback` (if given) is called
+    with the instance, e.g. for feeding the numbers into a metrics pipeline.
+    """
+
+    def __init__(self, callback: Optional[Callable[['Stats'], None]] = None):
+        self.callback = callback
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} timings={self.timings} counters={self.counters}>'
+
+    @contextmanager
+    def phase(self, name: str):
+        """ Time the code running within the context as phase `name` """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """ Add `amount` to counter `name` """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def finish(self) -> None:
+        """ Report the collected numbers to the callback """
+        if self.callback is not None:
+            self.callback(self)
+
+    def as_dict(self) -> dict:
+        return {'timings': dict(self.timings), 'counters': dict(self.counters)}
+
+
+class _NullStats:
+    """ Stand-in used when instrumentation is disabled, so instrumented code doesn't have to check for it """
+
+    _context = nullcontext()
+
+    def phase(self, name: str):
+        return self._context
+
+    def count(self, name: str, amount: int = 1) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+
+NULL_STATS = _NullStats()
@@ -0,0 +1,114 @@
+from typing import Dict, Iterator, List, Optional, Union
+
+
+class StringTable:
+    """
+    ELF string table (SHT_STRTAB) builder.
+
+    Strings are deduplicated using a dict index, so adding and looking up a string is O(1). When suffix sharing is
+    enabled, a string which is a suffix of another one (e.g. `.text` of `.init.text`) reuses its tail instead of being
+    stored again. Since that depends on all of the strings, offsets are then assigned once the table is needed, by
+    sorting the strings by their reversed value.
+    """
+
+    def __init__(self, suffix_sharing: bool = False):
+        self._suffix_sharing = suffix_sharing
+        self._offsets: Dict[bytes, Optional[int]] = {b'': 0}
+        self._chunks: List[bytes] = [b'\x00']
+        self._size = 1
+        self._data: Optional[bytes] = None
+        self._dirty = False
+
+    @property
+    def suffix_sharing(self) -> bool:
+        return self._suffix_sharing
+
+    @suffix_sharing.setter
+    def suffix_sharing(self, value: bool) -> None:
+        if value != self._suffix_sharing:
+            self._suffix_sharing = value
+            self._dirty = True
+
+    def __contains__(self, string: Union[str, bytes]) -> bool:
+        return _encode(string) in self._offsets
+
+    def __iter__(self) -> Iterator[bytes]:
+        """ Iterate the strings, in the order they were added """
+        return (string for string in self._offsets if string)
+
+    def __len__(self) -> int:
+        self._finalize()
+        return self._size
+
+    def __bytes__(self) -> bytes:
+        self._finalize()
+        if self._data is None:
+            self._data = b''.join(self._chunks)
+        return self._data
+
+    def add(self, string: Union[str, bytes]) -> None:
+        """
+        Add a string to the table (no-op if it is already there)
+
+        :param string: String to add
+        :return: None
+        """
+        string = _encode(string)
+        if string in self._offsets:
+            return
+
+        self._data = None
+        if self._suffix_sharing or self._dirty:
+            self._offsets[string] = None
+            self._dirty = True
+            return
+
+        self._offsets[string] = self._size
+        self._chunks.append(string + b'\x00')
+        self._size += len(string) + 1
+
+    def offset(self, string: Union[str, bytes]) -> int:
+        """
+        Get the offset of a previously added string
+
+        :param string: String to look for
+        :return: The string's offset within the table
+        """
+        string = _encode(string)
+        offset = self._offsets[string]
+        if offset is None or self._dirty:
+            self._finalize()
+            offset = self._offsets[string]
+        return offset
+
+    def _finalize(self) -> None:
+        """ Assign the final offsets of all strings """
+        if not self._dirty:
+            return
+
+        strings = [string for string in self._offsets if string]
+        if self._suffix_sharing:
+            # in reversed order, all strings ending with a given string precede it, and the one right before it
+            # either stores it as its tail or shares the tail of the last stored string, which then ends with it too
+            strings.sort(key=lambda string: string[::-1], reverse=True)
+
+        self._chunks = [b'\x00']
+        self._size = 1
+        previous = b''
+        previous_end = 0
+        for string in strings:
+            if self._suffix_sharing and previous.endswith(string):
+                self._offsets[string] = previous_end - len(string)
+                continue
+            self._offsets[string] = self._size
+            self._chunks.append(string + b'\x00')
+            self._size += len(string) + 1
+            previous = string
+            previous_end = self._size - 1
+
+        self._data = None
+        self._dirty = False
+
+
+def _encode(string: Union[str, bytes]) -> bytes:
+    return string.encode() if isinstance(string, str) else string
@@ -0,0 +1,55 @@
+from simpleelf import elf_consts
+from simpleelf.elf_builder import ElfBuilder
+from simpleelf.elf_codecs import get_elf_codecs
+from simpleelf.elf_consts import ELFCLASS32
+from simpleelf.elf_structs import identify
+
+TEXT_ADDRESS = 0x1234
+TEXT_BUFFER = b'cybercyberbitimbitimCODECODE'
+DATA_ADDRESS = 0x88771122
+DATA_BUFFER = b'data in 0x88771122'
+BSS_ADDRESS = 0x5678
+BSS_SIZE = 0x200
+
+
+def make_builder(elf_class: int = ELFCLASS32, endianity: str = '<') -> ElfBuilder:
+    """ Get a builder of a small ELF: a code segment holding .text, a data segment and a .bss section """
+    e = ElfBuilder(elf_class)
+    e.set_endianity(endianity)
+    e.set_machine(elf_consts.EM_ARM)
+    e.add_segment(TEXT_ADDRESS, TEXT_BUFFER, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment(DATA_ADDRESS, DATA_BUFFER, elf_consts.PF_R | elf_consts.PF_W)
+    e.add_code_section(TEXT_ADDRESS + TEXT_BUFFER.find(b'CODE'), 8, name='.text')
+    e.add_empty_data_section(BSS_ADDRESS, BSS_SIZE, name='.bss')
+    e.set_entry(TEXT_ADDRESS)
+    return e
+
+
+def build_elf(elf_class: int = ELFCLASS32, endianity: str = '<') -> bytes:
+    """ Build the ELF of `make_builder()` """
+    return make_builder(elf_class, endianity).build()
+
+
+def to_extended_numbering(elf_raw: bytes) -> bytes:
+    """ Move e_phnum, e_shnum and e_shstrndx of an ELF into section header 0, as done when they don't fit in 16 bits """
+    return _patch_counts(elf_raw, lambda header: dict(e_phnum=elf_consts.PN_XNUM, e_shnum=0,
+                                                      e_shstrndx=elf_consts.SHN_XINDEX),
+                         lambda header: dict(sh_info=header.e_phnum, sh_size=header.e_shnum,
+                                             sh_link=header.e_shstrndx))
+
+
+def make_malformed(elf_raw: bytes) -> bytes:
+    """ Use extended numbering in an ELF, with a section count which can't fit in the file """
+    return _patch_counts(elf_raw, lambda header: dict(e_shnum=0), lambda header: dict(sh_size=1 << 62))
+
+
+def _patch_counts(elf_raw: bytes, header_fields, section0_fields) -> bytes:
+    identity = identify(elf_raw)
+    codecs = get_elf_codecs(identity.elf_class, identity.endianity)
+    elf_raw = bytearray(elf_raw)
+    header = codecs.unpack_ehdr(elf_raw)
+    section0 = codecs.unpack_shdr(elf_raw, header.e_shoff)
+    elf_raw[:codecs.ehdr.size] = codecs.pack_ehdr(header._replace(**header_fields(header)))
+    elf_raw[header.e_shoff:header.e_shoff + codecs.shdr.size] = \
+        codecs.pack_shdr(section0._replace(**section0_fields(header)))
+    return bytes(elf_raw)
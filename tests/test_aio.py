@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+from simpleelf import elf_consts
+from simpleelf.aio import Limiter, _write_piece, parse_async
+from simpleelf.elf_builder import ElfBuilder
+from simpleelf.elf_consts import ELFCLASS64
+from simpleelf.elf_structs import ElfStructs
+from simpleelf.file_contents import FileContents
+from simpleelf.stats import Stats
+
+
+def make_builder(tmp_path) -> ElfBuilder:
+    payload = tmp_path / 'payload.bin'
+    payload.write_bytes(b'P' * 0x3000)
+
+    e = ElfBuilder(ELFCLASS64)
+    e.add_segment(0x1000, b'CODE' * 0x400, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment_from_file(0x8000, payload)
+    e.add_code_section(0x1000, 0x100, name='.text')
+    e.add_symbols(['main', 'payload'], [0x1000, 0x8000])
+    return e
+
+
+def test_build_async(tmp_path):
+    e = make_builder(tmp_path)
+    elf_raw = e.build()
+    limiter = Limiter(max_concurrency=2)
+
+    async def main():
+        stats = Stats()
+        results = await asyncio.gather(e.build_async(limiter=limiter),
+                                       e.write_to_async(tmp_path / 'test.elf', stats=stats, limiter=limiter,
+                                                        chunk_size=0x100))
+        parsed = await parse_async(tmp_path / 'test.elf', limiter=limiter, chunk_size=0x100)
+        return results[0], stats, parsed
+
+    built, stats, parsed = asyncio.run(main())
+    limiter.shutdown()
+
+    assert built == elf_raw
+    assert (tmp_path / 'test.elf').read_bytes() == elf_raw
+    assert stats.counters['bytes_written'] + stats.counters['bytes_kernel_copied'] == len(elf_raw)
+    assert {'layout', 'pack', 'write'} <= set(stats.timings)
+    assert parsed == ElfStructs().Elf64.parse(elf_raw)
+
+
+def test_write_to_async_chunks(tmp_path):
+    class RecordingLimiter(Limiter):
+        async def run(self, func, *args):
+            jobs.append((func, args))
+            return await super().run(func, *args)
+
+    jobs = []
+    e = make_builder(tmp_path)
+    limiter = RecordingLimiter()
+    asyncio.run(e.write_to_async(tmp_path / 'test.elf', limiter=limiter, chunk_size=0x100))
+    limiter.shutdown()
+
+    assert (tmp_path / 'test.elf').read_bytes() == e.build()
+    pieces = [args[1] for func, args in jobs if func is _write_piece]
+    writes = [data for data in pieces if not isinstance(data, FileContents)]
+    copies = [data for data in pieces if isinstance(data, FileContents)]
+    assert all(len(data) <= 0x100 for data in writes)
+    # file-backed contents are copied in bounded jobs as well
+    assert len(copies) == 0x3000 // 0x100
+    assert all(len(contents) == 0x100 for contents in copies)
+
+
+def test_limiter_bounds_concurrency():
+    limiter = Limiter(max_concurrency=2)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def work():
+        with lock:
+            running.append(None)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+
+    async def operation():
+        async with limiter:
+            await limiter.run(work)
+
+    async def main():
+        await asyncio.gather(*(operation() for _ in range(8)))
+
+    # the same limiter can be used from several event loops
+    asyncio.run(main())
+    asyncio.run(main())
+    limiter.shutdown()
+    assert len(peak) == 16
+    assert max(peak) == 2
@@ -0,0 +1,146 @@
+import json
+import struct
+
+import pytest
+
+from simpleelf import batch, elf_consts
+from simpleelf.batch import main, parse_many, summarize
+from simpleelf.elf_codecs import get_elf_codecs
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_file import ElfFile
+from simpleelf.exceptions import InvalidElfError
+from tests.elf_helpers import DATA_ADDRESS, DATA_BUFFER, TEXT_ADDRESS, TEXT_BUFFER, build_elf, make_builder, \
+    make_malformed, to_extended_numbering
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    paths = []
+    for i in range(10):
+        path = tmp_path / f'{i}.elf'
+        e = make_builder(ELFCLASS32 if i % 2 else ELFCLASS64, '<>'[i % 3 == 0])
+        e.set_entry(0x1000 * (i + 1))
+        e.write_to(path)
+        paths.append(str(path))
+    junk = tmp_path / 'junk.bin'
+    junk.write_bytes(b'MZ' + b'\x00' * 0x100)
+    paths.append(str(junk))
+    return paths
+
+
+def test_summarize(corpus):
+    summary = summarize(corpus[0])
+    assert summary.elf_class == ELFCLASS64
+    assert summary.endianity == '>'
+    assert summary.header.e_entry == 0x1000
+    assert [(segment.p_vaddr, segment.p_filesz) for segment in summary.segments] == \
+        [(TEXT_ADDRESS, len(TEXT_BUFFER)), (DATA_ADDRESS, len(DATA_BUFFER))]
+    assert summary.section_names == ['', '.text', '.bss', '.strtab']
+    assert summary.sections[1].sh_addr == TEXT_ADDRESS + TEXT_BUFFER.find(b'CODE')
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parse_many(corpus, workers):
+    results = {result.path: result for result in parse_many(corpus, workers=workers, chunksize=3)}
+    assert sorted(results) == sorted(corpus)
+
+    junk = results.pop(corpus[-1])
+    assert junk.summary is None
+    assert 'InvalidElfError' in junk.error
+
+    for i, path in enumerate(corpus[:-1]):
+        assert results[path].error is None
+        assert results[path].summary == summarize(path)
+        assert results[path].summary.header.e_entry == 0x1000 * (i + 1)
+
+
+def test_parse_many_resume(tmp_path, corpus):
+    journal = tmp_path / 'journal'
+    # simulate a run which crashed while writing its journal
+    journal.write_text(json.dumps({'path': corpus[0], 'error': None}) + '\n' + '{"path": "' + corpus[1][:5])
+
+    first = [result.path for result in parse_many(corpus, workers=1, journal=journal)]
+    assert sorted(first) == sorted(corpus[1:])
+    assert list(parse_many(corpus, workers=1, journal=journal)) == []
+
+
+def test_parse_many_resume_after_consumer_crash(tmp_path, corpus):
+    journal = tmp_path / 'journal'
+    with pytest.raises(RuntimeError):
+        for result in parse_many(corpus, workers=1, journal=journal):
+            if result.path == corpus[3]:
+                raise RuntimeError('consumer crashed')
+
+    # the result being handled when the consumer crashed is yielded again
+    assert [result.path for result in parse_many(corpus, workers=1, journal=journal)] == corpus[3:]
+
+
+def test_parse_many_unexpected_error(corpus, monkeypatch):
+    def summarize_failing(path, stats=None):
+        if path == corpus[2]:
+            raise struct.error('unpack requires a buffer of 4 bytes')
+        return summarize(path, stats)
+
+    monkeypatch.setattr(batch, 'summarize', summarize_failing)
+    results = {result.path: result for result in parse_many(corpus, workers=1)}
+    assert results[corpus[2]].summary is None
+    assert results[corpus[2]].error == 'error: unpack requires a buffer of 4 bytes'
+    assert all(results[path].error is None for path in corpus[3:-1])
+
+
+def test_main(tmp_path, corpus, capsys):
+    main([str(tmp_path), '-j', '2', '--chunksize', '4'])
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(lines) == len(corpus)
+    by_path = {line['path']: line for line in lines}
+    assert 'error' in by_path[corpus[-1]]
+    assert by_path[corpus[3]]['header']['e_entry'] == 0x4000
+    assert by_path[corpus[3]]['sections'][1]['name'] == '.text'
+
+
+def test_summarize_extended_numbering(tmp_path):
+    path = tmp_path / 'test.elf'
+    path.write_bytes(build_elf(ELFCLASS64))
+    extended = tmp_path / 'extended.elf'
+    extended.write_bytes(to_extended_numbering(path.read_bytes()))
+
+    expected = summarize(path)
+    summary = summarize(extended)
+    assert summary.header.e_phnum == elf_consts.PN_XNUM
+    assert summary.segments == expected.segments
+    assert summary.sections[1:] == expected.sections[1:]
+    assert summary.section_names == expected.section_names
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parse_many_extended_numbering_malformed(tmp_path, workers):
+    path = tmp_path / 'malformed.elf'
+    path.write_bytes(make_malformed(build_elf(ELFCLASS64)))
+
+    with pytest.raises(InvalidElfError):
+        summarize(path)
+    [result] = parse_many([path], workers=workers)
+    assert result.summary is None
+    assert 'InvalidElfError' in result.error
+
+
+def test_summarize_entry_size(tmp_path):
+    elf_raw = build_elf(ELFCLASS32)
+    codecs = get_elf_codecs(ELFCLASS32)
+    header = codecs.unpack_ehdr(elf_raw)
+    # move both tables to the end of the file, with bigger entries than the standard ones
+    padding = b'\xff' * 8
+    phdrs = b''.join(codecs.pack_phdr(phdr) + padding
+                     for phdr in codecs.iter_phdrs(elf_raw, header.e_phoff, header.e_phnum))
+    shdrs = b''.join(codecs.pack_shdr(shdr) + padding
+                     for shdr in codecs.iter_shdrs(elf_raw, header.e_shoff, header.e_shnum))
+    header = header._replace(e_phoff=len(elf_raw), e_phentsize=codecs.phdr.size + len(padding),
+                             e_shoff=len(elf_raw) + len(phdrs), e_shentsize=codecs.shdr.size + len(padding))
+    path = tmp_path / 'test.elf'
+    path.write_bytes(codecs.pack_ehdr(header) + elf_raw[codecs.ehdr.size:] + phdrs + shdrs)
+
+    summary = summarize(path)
+    with ElfFile(path) as elf:
+        assert summary.segments == list(elf.segments())
+        assert summary.sections == list(elf.sections())
+    assert summary.section_names == ['', '.text', '.bss', '.strtab']
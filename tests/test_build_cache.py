@@ -0,0 +1,103 @@
+import os
+import time
+
+from simpleelf import build_cache, elf_consts
+from simpleelf.build_cache import BuildCache
+from simpleelf.elf_builder import ElfBuilder
+from simpleelf.elf_consts import ELFCLASS64
+
+
+def make_builder(tmp_path, entry: int = 0x1000) -> ElfBuilder:
+    payload = tmp_path / 'payload.bin'
+    if not payload.exists():
+        payload.write_bytes(b'P' * 0x1000)
+
+    e = ElfBuilder(ELFCLASS64)
+    e.set_entry(entry)
+    e.add_segment(0x1000, b'CODE' * 0x40, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment_from_file(0x8000, payload)
+    e.add_code_section(0x1000, 0x100, name='.text')
+    e.add_symbols(['main'], [0x1000])
+    return e
+
+
+def test_fingerprint(tmp_path):
+    fingerprint = make_builder(tmp_path).fingerprint()
+    assert make_builder(tmp_path).fingerprint() == fingerprint
+    assert make_builder(tmp_path, entry=0x1004).fingerprint() != fingerprint
+
+    e = make_builder(tmp_path)
+    e.add_symbols(['other'], [0x1010])
+    assert e.fingerprint() != fingerprint
+
+    (tmp_path / 'payload.bin').write_bytes(b'Q' * 0x1000)
+    assert make_builder(tmp_path).fingerprint() != fingerprint
+
+
+def test_build_cache(tmp_path):
+    cache = BuildCache(tmp_path / 'cache')
+    elf_raw = cache.build(make_builder(tmp_path))
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert elf_raw == make_builder(tmp_path).build()
+
+    e = make_builder(tmp_path)
+    e.build = None
+    assert cache.build(e) == elf_raw
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    output = tmp_path / 'out.elf'
+    cache.write_to(make_builder(tmp_path), output)
+    assert output.read_bytes() == elf_raw
+    entry = cache._path(make_builder(tmp_path).fingerprint())
+    assert os.path.samefile(output, entry)
+
+    copied = tmp_path / 'copied.elf'
+    cache.write_to(make_builder(tmp_path, entry=0x1004), copied, link=False)
+    assert copied.read_bytes() == make_builder(tmp_path, entry=0x1004).build()
+    assert not os.path.samefile(copied, cache._path(make_builder(tmp_path, entry=0x1004).fingerprint()))
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_content_digest_memo(tmp_path, monkeypatch):
+    digested = []
+
+    def content_digest(contents):
+        digested.append(contents)
+        return b'%d' % len(digested)
+
+    monkeypatch.setattr(build_cache, 'content_digest', content_digest)
+    cache = BuildCache(tmp_path / 'cache')
+    e = make_builder(tmp_path)
+    fingerprint = e.fingerprint(cache.content_digest)
+    assert e.fingerprint(cache.content_digest) == fingerprint
+    assert len(digested) == 2
+
+    # a modified file is hashed again
+    path = tmp_path / 'payload.bin'
+    path.write_bytes(b'Q' * 0x1000)
+    os.utime(path, ns=(0, 0))
+    assert e.fingerprint(cache.content_digest) != fingerprint
+    assert len(digested) == 3
+
+
+def test_evict(tmp_path):
+    cache = BuildCache(tmp_path / 'cache')
+    fingerprints = []
+    for i in range(4):
+        e = make_builder(tmp_path, entry=0x1000 + i)
+        cache.build(e)
+        fingerprints.append(e.fingerprint())
+        # mark older entries as less recently used
+        os.utime(cache._path(fingerprints[-1]), (time.time() - 100 + i, time.time() - 100 + i))
+
+    size = os.path.getsize(cache._path(fingerprints[0]))
+    cache.max_size = size * 2
+    cache.evict()
+    assert [os.path.exists(cache._path(fingerprint)) for fingerprint in fingerprints] == [False, False, True, True]
+
+    cache.max_age = 50
+    cache.evict(keep=fingerprints[3])
+    assert [os.path.exists(cache._path(fingerprint)) for fingerprint in fingerprints] == [False, False, False, True]
+
+    cache.clear()
+    assert os.listdir(cache.directory) == []
@@ -1,6 +1,14 @@
-from simpleelf import elf_consts
-from simpleelf.elf_builder import ElfBuilder, ElfStructs
+import hashlib
+import random
+import struct
+
+import pytest
+
+from simpleelf import elf_builder, elf_consts
+from simpleelf.elf_builder import ElfBuilder, ElfStructs, SegmentOverlap, Symbol, np, symbol_info
 from simpleelf.elf_consts import ELFCLASS64
+from simpleelf.exceptions import OverlappingSegmentsError
+from simpleelf.file_contents import FileContents
 
 structs = ElfStructs('<')
 
@@ -79,3 +87,387 @@ def test_build_elf64():
     parsed_raw_elf = structs.Elf64.parse(elf_raw)
 
     assert structs.Elf64.build(parsed_raw_elf) == elf_raw, "rebuilt elf is not the same"
+
+
+def test_find_loaded_data():
+    e = ElfBuilder(ELFCLASS64)
+    e.add_segment(0x2000, b'second segment', elf_consts.PF_R)
+    e.add_segment(0x1000, b'first segment', elf_consts.PF_R)
+
+    elf_raw = e.build()
+
+    offset, data = e.find_loaded_data(0x1006)
+    assert data == b'segment'
+    assert elf_raw[offset:offset + len(data)] == data
+
+    offset, data = e.find_loaded_data(0x2000, 6)
+    assert data == b'second'
+    assert elf_raw[offset:offset + len(data)] == data
+
+    assert e.find_loaded_data(0x1000 + len(b'first segment')) is None
+    assert e.find_loaded_data(0x3000) is None
+
+    assert e.find_loaded_data_many([0x2007, 0x3000, 0x1000], 5) == [
+        e.find_loaded_data(0x2007, 5), None, e.find_loaded_data(0x1000, 5)]
+
+
+def test_interleaved_adds():
+    e = ElfBuilder(ELFCLASS64)
+    index = e._segment_index
+    for i in range(0x10):
+        e.add_segment(0x1000 * (0x10 - i), b'%x' % i * 0x10, elf_consts.PF_R | elf_consts.PF_X)
+        e.add_code_section(0x1000 * (0x10 - i), 0x10)
+        # sections are checked against the index updated in-place, without laying out the segments
+        assert e._segment_index is index
+        assert e._segment_offsets is None
+
+    elf_raw = e.build()
+    offset, data = e.find_loaded_data(0x1000, 2)
+    assert data == b'f' * 2
+    assert elf_raw[offset:offset + 2] == data
+
+
+def test_write_to(tmp_path):
+    e = ElfBuilder(ELFCLASS64)
+    e.set_endianity('>')
+    e.add_segment(0x1000, b'A' * 0x1000, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment(0x4000, memoryview(b'B' * 0x100), elf_consts.PF_R)
+    e.add_code_section(0x1000, 0x1000, name='.text')
+    e.add_empty_data_section(0x8000, 0x100, name='.bss')
+
+    elf_raw = e.build()
+    assert e.build() == elf_raw, "building twice must yield the same result"
+
+    path = tmp_path / 'test.elf'
+    e.write_to(path)
+    assert path.read_bytes() == elf_raw
+
+    with open(tmp_path / 'test2.elf', 'wb') as f:
+        e.write_to(f)
+    assert (tmp_path / 'test2.elf').read_bytes() == elf_raw
+
+    parsed = ElfStructs('>').Elf64.parse(elf_raw)
+    assert parsed.segments[0].data == b'A' * 0x1000
+    assert parsed.segments[1].data == b'B' * 0x100
+    strtab = parsed.sections[parsed.header.e_shstrndx]
+    assert strtab.data[strtab.sh_name:].split(b'\x00')[0] == b'.strtab'
+
+
+def test_zero_fill_segments():
+    e = ElfBuilder(ELFCLASS64)
+    e.add_segment(0x1000, b'A' * 0x100, elf_consts.PF_R | elf_consts.PF_W, memsz=0x10000)
+    with pytest.raises(ValueError):
+        e.add_segment(0x20000, b'B' * 0x100, elf_consts.PF_R, memsz=0x10)
+
+    parsed = ElfStructs().Elf64.parse(e.build())
+    assert parsed.segments[0].p_filesz == 0x100
+    assert parsed.segments[0].p_memsz == 0x10000
+    assert parsed.segments[0].data == b'A' * 0x100
+
+
+def test_trim_zero_tails(tmp_path):
+    ram = tmp_path / 'ram.bin'
+    ram.write_bytes(b'C' * 0x10 + b'\x00' * 0x300000)
+
+    e = ElfBuilder(ELFCLASS64)
+    e.add_segment(0x1000, b'A' * 0x100 + b'\x00' * 0x1000, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment(0x4000, b'\x00' * 0x100, elf_consts.PF_R | elf_consts.PF_W)
+    e.add_segment_from_file(0x80000000, ram, flags=elf_consts.PF_R | elf_consts.PF_W, memsz=0x400000)
+    e.add_code_section(0x1000, 0x200, name='.text')
+    untrimmed = e.build()
+
+    e.set_trim_zero_tails(True)
+    elf_raw = e.build()
+    assert len(elf_raw) < len(untrimmed) - 0x300000
+
+    e.write_to(tmp_path / 'test.elf')
+    assert (tmp_path / 'test.elf').read_bytes() == elf_raw
+
+    parsed = ElfStructs().Elf64.parse(elf_raw)
+    # contents covered by .text are kept in the file
+    assert [(segment.p_filesz, segment.p_memsz) for segment in parsed.segments] == \
+        [(0x200, 0x1100), (0, 0x100), (0x10, 0x400000)]
+    assert parsed.segments[0].data == b'A' * 0x100 + b'\x00' * 0x100
+    assert parsed.segments[2].data == b'C' * 0x10
+    assert parsed.sections[1].sh_offset == parsed.segments[0].p_offset
+
+
+def test_trim_zero_tails_interleaved(monkeypatch):
+    scanned = []
+    nonzero_size = elf_builder._nonzero_size
+
+    def counting_nonzero_size(contents):
+        scanned.append(contents)
+        return nonzero_size(contents)
+
+    monkeypatch.setattr(elf_builder, '_nonzero_size', counting_nonzero_size)
+
+    e = ElfBuilder(ELFCLASS64)
+    e.set_trim_zero_tails(True)
+    for i in range(0x10):
+        e.add_segment(0x1000 * i, b'CODE' + b'\x00' * 0x100, elf_consts.PF_R | elf_consts.PF_X)
+        e.add_code_section(0x1000 * i, 0x10)
+    # the contents are scanned once, when laying out the segments
+    assert scanned == []
+    parsed = structs.Elf64.parse(e.build())
+    assert len(scanned) == 0x10
+    assert [segment.p_filesz for segment in parsed.segments] == [0x10] * 0x10
+
+
+def test_deduplicate_segments(tmp_path):
+    flash = random.Random(0).getrandbits(0x80000).to_bytes(0x10000, 'little')
+    dump = tmp_path / 'dump.bin'
+    dump.write_bytes(flash)
+
+    e = ElfBuilder(ELFCLASS64)
+    e.add_segment(0x8000000, flash, elf_consts.PF_R | elf_consts.PF_X)
+    # same object, an equal copy and a slice of it
+    e.add_segment(0x0, flash, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment(0x10000000, bytearray(flash), elf_consts.PF_R)
+    e.add_segment(0x20000000, memoryview(flash)[0x1234:0x5678], elf_consts.PF_R)
+    e.add_segment(0x30000000, b'unique', elf_consts.PF_R | elf_consts.PF_W)
+    # file regions contained in one another
+    e.add_segment_from_file(0x40000000, dump, flags=elf_consts.PF_R)
+    e.add_segment_from_file(0x50000000, dump, offset=0x100, size=0x200, flags=elf_consts.PF_R)
+    e.add_code_section(0x20000000, 0x100, name='.text')
+    duplicated = e.build()
+
+    e.set_deduplicate_segments(True)
+    elf_raw = e.build()
+    assert len(elf_raw) < len(duplicated) - 2 * len(flash)
+
+    e.write_to(tmp_path / 'test.elf')
+    assert (tmp_path / 'test.elf').read_bytes() == elf_raw
+
+    parsed = ElfStructs().Elf64.parse(elf_raw)
+    offsets = [segment.p_offset for segment in parsed.segments]
+    assert offsets[0] == offsets[1] == offsets[2]
+    assert offsets[3] == offsets[0] + 0x1234
+    assert offsets[6] == offsets[5] + 0x100
+    assert [segment.data for segment in parsed.segments] == \
+        [flash, flash, flash, flash[0x1234:0x5678], b'unique', flash, flash[0x100:0x300]]
+    assert parsed.sections[1].sh_offset == offsets[3]
+    assert e.find_loaded_data(0x50000010, 4) == (offsets[5] + 0x110, flash[0x110:0x114])
+
+
+def test_deduplicate_segments_interleaved(monkeypatch):
+    passes = []
+    find_shared_contents = elf_builder._find_shared_contents
+
+    def counting_find_shared_contents(contents):
+        passes.append(len(contents))
+        return find_shared_contents(contents)
+
+    monkeypatch.setattr(elf_builder, '_find_shared_contents', counting_find_shared_contents)
+
+    e = ElfBuilder(ELFCLASS64)
+    e.set_deduplicate_segments(True)
+    for i in range(0x10):
+        e.add_segment(0x1000 * i, b'CODE' * 0x40, elf_consts.PF_R | elf_consts.PF_X)
+        e.add_code_section(0x1000 * i, 0x10)
+    # the contents are digested once, when laying out the segments
+    assert passes == []
+    parsed = structs.Elf64.parse(e.build())
+    assert passes == [0x10]
+    assert len({segment.p_offset for segment in parsed.segments}) == 1
+
+
+def test_digest_manifest(tmp_path):
+    payload = tmp_path / 'payload.bin'
+    payload.write_bytes(b'P' * 0x3000)
+
+    e = ElfBuilder(ELFCLASS64)
+    e.set_deduplicate_segments(True)
+    code = b'CODE' * 0x100
+    e.add_segment(0x1000, code, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment(0x2000, code, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment_from_file(0x8000, payload)
+    e.add_code_section(0x1100, 0x100, name='.text')
+    e.add_empty_data_section(0x10000, 0x100, name='.bss')
+    e.add_symbols(['main'], [0x1100])
+
+    elf_raw, manifest = e.build_with_manifest(['sha256', 'md5'])
+    assert elf_raw == e.build()
+    assert manifest.size == len(elf_raw)
+    assert manifest.digests == {'sha256': hashlib.sha256(elf_raw).hexdigest(), 'md5': hashlib.md5(elf_raw).hexdigest()}
+
+    parsed = structs.Elf64.parse(elf_raw)
+    assert manifest.header.e_shoff == parsed.header.e_shoff
+    assert [(entry.offset, entry.size) for entry in manifest.segments] == \
+        [(segment.p_offset, segment.p_filesz) for segment in parsed.segments]
+    assert [(entry.offset, entry.size) for entry in manifest.sections] == \
+        [(section.sh_offset, len(section.data or b'')) for section in parsed.sections]
+    for entry in manifest.segments + manifest.sections:
+        assert entry.digests['sha256'] == hashlib.sha256(elf_raw[entry.offset:entry.offset + entry.size]).hexdigest()
+
+    assert e.write_to(tmp_path / 'test.elf') is None
+    assert e.write_to(tmp_path / 'test.elf', digests=['sha256', 'md5']) == manifest
+    assert (tmp_path / 'test.elf').read_bytes() == elf_raw
+
+
+def test_segment_overlaps():
+    e = ElfBuilder()
+    e.add_segment(0x1000, b'\x00' * 0x1000, elf_consts.PF_R)
+    e.add_segment(0x3000, b'\x00' * 0x100, elf_consts.PF_R, memsz=0x2000)
+    e.add_segment(0x2000, b'\x00' * 0x1000, elf_consts.PF_R)
+    e.validate_segments()
+    assert e.find_segment_overlaps() == []
+
+    e.add_segment(0x4000, b'\x00' * 0x10, elf_consts.PF_R)
+    e.add_segment(0x1800, b'\x00' * 0x100, elf_consts.PF_R)
+    assert e.find_segment_overlaps() == [SegmentOverlap(first=0, second=4, start=0x1800, end=0x1900),
+                                         SegmentOverlap(first=1, second=3, start=0x4000, end=0x4010)]
+    with pytest.raises(OverlappingSegmentsError) as e_info:
+        e.validate_segments()
+    assert e_info.value.overlaps == e.find_segment_overlaps()
+
+
+def test_coalesce_segments(tmp_path):
+    dump = random.Random(0).getrandbits(0x40000).to_bytes(0x8000, 'little')
+    dump_path = tmp_path / 'dump.bin'
+    dump_path.write_bytes(dump)
+
+    e = ElfBuilder(ELFCLASS64)
+    # a dump added page by page, in no particular order
+    for page in (3, 0, 2, 1):
+        e.add_segment(0x10000 + page * 0x1000, memoryview(dump)[page * 0x1000:(page + 1) * 0x1000],
+                      elf_consts.PF_R | elf_consts.PF_W)
+    for page in range(4, 8):
+        e.add_segment_from_file(0x10000 + page * 0x1000, dump_path, offset=page * 0x1000, size=0x1000,
+                                flags=elf_consts.PF_R)
+    # different flags, and a zero-filled tail
+    e.add_segment(0x20000, b'CODE', elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment(0x30000, b'A' * 0x10, elf_consts.PF_R, memsz=0x100)
+    e.add_segment(0x30100, b'B' * 0x10, elf_consts.PF_R)
+    e.add_segment(0x30110, b'C' * 0x10, elf_consts.PF_R, memsz=0x20)
+    e.add_code_section(0x20000, 4, name='.text')
+    separate = e.build()
+
+    e.set_coalesce_segments(True)
+    elf_raw = e.build()
+    parsed = ElfStructs().Elf64.parse(elf_raw)
+    assert [(segment.p_vaddr, segment.p_filesz, segment.p_memsz) for segment in parsed.segments] == \
+        [(0x10000, 0x4000, 0x4000), (0x14000, 0x4000, 0x4000), (0x20000, 4, 4), (0x30000, 0x10, 0x100),
+         (0x30100, 0x20, 0x30)]
+    assert parsed.segments[0].data + parsed.segments[1].data == dump
+    assert parsed.segments[4].data == b'B' * 0x10 + b'C' * 0x10
+    assert parsed.sections[1].sh_offset == parsed.segments[2].p_offset
+    assert len(elf_raw) < len(separate)
+
+    # adjacent contents aren't copied
+    coalesced = e._get_segments()
+    assert isinstance(coalesced[1].contents, FileContents)
+    if np is not None:
+        assert coalesced[0].contents.obj is dump
+
+
+def test_strtab_suffix_sharing():
+    def build(suffix_sharing: bool) -> bytes:
+        e = ElfBuilder()
+        e.set_strtab_suffix_sharing(suffix_sharing)
+        e.add_segment(0x1000, b'\x00' * 0x100, elf_consts.PF_R | elf_consts.PF_X)
+        e.add_code_section(0x1000, 0x80, name='.init.text')
+        e.add_code_section(0x1080, 0x80, name='.text')
+        return e.build()
+
+    sizes = []
+    for suffix_sharing in (False, True):
+        parsed = structs.Elf32.parse(build(suffix_sharing))
+        strtab = parsed.sections[parsed.header.e_shstrndx].data
+        names = [strtab[int(section.sh_name):].split(b'\x00')[0] for section in parsed.sections]
+        assert names == [b'', b'.init.text', b'.text', b'.strtab']
+        sizes.append(len(strtab))
+    assert sizes[1] == sizes[0] - len(b'.text\x00')
+
+
+def test_add_symbols():
+    e = ElfBuilder(ELFCLASS64)
+    e.add_segment(0x1000, b'\x00' * 0x100, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_code_section(0x1000, 0x100, name='.text')
+    e.add_symbols(['main', 'helper'], [0x1000, 0x1080], sizes=[0x80, 0x10],
+                  infos=[symbol_info(elf_consts.STB_GLOBAL, elf_consts.STT_FUNC),
+                         symbol_info(elf_consts.STB_LOCAL, elf_consts.STT_FUNC)])
+    e.add_symbols([Symbol('abs', 0x9999), Symbol('.text', 0x1000, shndx=elf_consts.SHN_UNDEF)])
+
+    elf_raw = e.build()
+    parsed = structs.Elf64.parse(elf_raw)
+    assert structs.Elf64.build(parsed) == elf_raw, "rebuilt elf is not the same"
+
+    symtab = parsed.sections[2]
+    assert symtab.sh_type == structs.Elf_SectionType.SHT_SYMTAB
+    assert symtab.sh_link == parsed.header.e_shstrndx
+    assert symtab.sh_info == 2, "sh_info must point at the first non-local symbol"
+    assert symtab.sh_entsize == structs.Elf64_Sym.sizeof()
+    assert symtab.sh_offset % 8 == 0
+
+    strtab = parsed.sections[symtab.sh_link].data
+    symbols = [structs.Elf64_Sym.parse(symtab.data[i:]) for i in range(0, symtab.sh_size, symtab.sh_entsize)]
+    assert [strtab[sym.st_name:].split(b'\x00')[0] for sym in symbols] == [b'', b'helper', b'main', b'abs', b'.text']
+    assert [sym.st_value for sym in symbols] == [0, 0x1080, 0x1000, 0x9999, 0x1000]
+    assert [sym.st_shndx for sym in symbols] == [elf_consts.SHN_UNDEF, 1, 1, elf_consts.SHN_ABS, elf_consts.SHN_UNDEF]
+    assert symbols[1].st_size == 0x10
+    assert symbols[2].st_info == symbol_info(elf_consts.STB_GLOBAL, elf_consts.STT_FUNC)
+
+
+def test_symtab_shndx():
+    e = ElfBuilder(ELFCLASS64)
+    e.add_segment(0x1000, b'\x00' * 0x100, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_code_section(0x1000, 0x100, name='.text')
+    e.add_symbols([Symbol('main', 0x1000), Symbol('far', 0x2000, shndx=0x12345),
+                   Symbol('abs', 0x3000, shndx=elf_consts.SHN_ABS)])
+
+    elf_raw = e.build()
+    parsed = structs.Elf64.parse(elf_raw)
+    assert structs.Elf64.build(parsed) == elf_raw, "rebuilt elf is not the same"
+
+    symtab, symtab_shndx, strtab = parsed.sections[2:]
+    assert symtab.sh_link == 4
+    assert symtab_shndx.sh_type == structs.Elf_SectionType.SHT_SYMTAB_SHNDX
+    assert (symtab_shndx.sh_link, symtab_shndx.sh_entsize) == (2, 4)
+    assert strtab.data[symtab_shndx.sh_name:].split(b'\x00')[0] == b'.symtab_shndx'
+
+    symbols = [structs.Elf64_Sym.parse(symtab.data[i:]) for i in range(0, symtab.sh_size, symtab.sh_entsize)]
+    assert [sym.st_shndx for sym in symbols] == [elf_consts.SHN_UNDEF, 1, elf_consts.SHN_XINDEX, elf_consts.SHN_ABS]
+    assert struct.unpack('<4I', symtab_shndx.data) == (0, 0, 0x12345, 0)
+
+
+@pytest.mark.parametrize('suffix_sharing', [False, True])
+def test_symtab_shndx_rebuild(suffix_sharing):
+    e = ElfBuilder(ELFCLASS64)
+    e.set_strtab_suffix_sharing(suffix_sharing)
+    e.add_segment(0x1000, b'\x00' * 0x100, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_code_section(0x1000, 0x100, name='.text')
+    e.add_symbols([Symbol('main', 0x1000), Symbol('far', 0x2000, shndx=0x12345), Symbol('ndx', 0x3000)])
+
+    fingerprint = e.fingerprint()
+    elf_raw = e.build()
+    assert e.fingerprint() == fingerprint
+    assert e.build() == elf_raw
+
+    parsed = structs.Elf64.parse(elf_raw)
+    symtab, _, strtab = parsed.sections[2:]
+    symbols = [structs.Elf64_Sym.parse(symtab.data[i:]) for i in range(0, symtab.sh_size, symtab.sh_entsize)]
+    assert [strtab.data[sym.st_name:].split(b'\x00')[0] for sym in symbols] == [b'', b'main', b'far', b'ndx']
+
+
+def test_extended_numbering():
+    count = elf_consts.PN_XNUM + 1
+    e = ElfBuilder(ELFCLASS64)
+    for i in range(count):
+        e.add_segment(0x100000 + i * 0x10, b'\xc3', elf_consts.PF_R | elf_consts.PF_X)
+        e.add_code_section(0x100000 + i * 0x10, 1, name=f'.text.{i}')
+    e.add_symbols(['first', 'last'], [0x100000, 0x100000 + (count - 1) * 0x10])
+    elf_raw = e.build()
+
+    # null + code sections + .symtab + .symtab_shndx + .strtab
+    shnum = count + 4
+    header = structs.Elf64_Ehdr.parse(elf_raw)
+    assert (header.e_phnum, header.e_shnum, header.e_shstrndx) == (elf_consts.PN_XNUM, 0, elf_consts.SHN_XINDEX)
+    section0 = structs.Elf64_ShdrEntry.parse(elf_raw[header.e_shoff:])
+    assert (section0.sh_size, section0.sh_link, section0.sh_info) == (shnum, shnum - 1, count)
+
+    last_segment = structs.Elf64_PhdrEntry.parse(elf_raw[header.e_phoff + (count - 1) * header.e_phentsize:])
+    assert last_segment.p_vaddr == 0x100000 + (count - 1) * 0x10
+    symtab_shndx = structs.Elf64_ShdrEntry.parse(elf_raw[header.e_shoff + (count + 2) * header.e_shentsize:])
+    assert symtab_shndx.sh_type == structs.Elf_SectionType.SHT_SYMTAB_SHNDX
+    assert struct.unpack('<3I', elf_raw[symtab_shndx.sh_offset:symtab_shndx.sh_offset + 12]) == (0, 0, count)
@@ -0,0 +1,70 @@
+import random
+import zlib
+
+import pytest
+
+from simpleelf import elf_consts
+from simpleelf.compression import compress, compress_section, decompress_section, open_compressed
+from simpleelf.elf_builder import ElfBuilder
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_file import ElfFile
+from simpleelf.elf_structs import ElfStructs
+from simpleelf.exceptions import InvalidElfError
+from simpleelf.file_contents import FileContents
+
+DATA = random.Random(0).getrandbits(0x40000).to_bytes(0x8000, 'little') + b'log line\n' * 0x8000
+
+
+def test_compress_chunks(tmp_path):
+    compressed = compress(DATA, chunk_size=0x1000, workers=4)
+    assert zlib.decompress(compressed) == DATA
+    assert zlib.decompress(compress(DATA)) == DATA
+
+    path = tmp_path / 'blob.bin'
+    path.write_bytes(DATA)
+    assert compress(FileContents(path), chunk_size=0x1000) == compressed
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+def test_build_compressed_sections(tmp_path, elf_class):
+    path = tmp_path / 'debug.bin'
+    path.write_bytes(DATA)
+
+    e = ElfBuilder(elf_class)
+    e.set_compression(level=9, workers=2)
+    e.add_segment(0x1000, b'CODE' * 0x10, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_code_section(0x1000, 0x40, name='.text')
+    e.add_non_loaded_section('.debug_info', FileContents(path), compress=True)
+    e.add_non_loaded_section('.log', DATA, compress=True, addralign=8)
+    e.add_non_loaded_section('.comment', b'plain')
+    elf_raw = e.build()
+    assert len(elf_raw) < len(DATA)
+
+    with ElfFile.from_buffer(elf_raw) as elf:
+        debug_info = elf.find_section('.debug_info')
+        log = elf.find_section('.log')
+        assert elf.section(debug_info).sh_flags == elf_consts.SHF_COMPRESSED
+        assert elf.section(elf.find_section('.comment')).sh_flags == 0
+
+        with elf.section_data(log) as data:
+            structs = ElfStructs()
+            chdr = (structs.Elf32_Chdr if elf_class == ELFCLASS32 else structs.Elf64_Chdr).parse(data)
+            assert chdr.ch_type == 'ELFCOMPRESS_ZLIB'
+            assert (chdr.ch_size, chdr.ch_addralign) == (len(DATA), 8)
+            assert decompress_section(data, elf_class) == DATA
+
+        with elf.open_section(debug_info) as f:
+            assert f.read(0x10) == DATA[:0x10]
+            assert f.read() == DATA[0x10:]
+        with elf.open_section(elf.find_section('.comment')) as f:
+            assert f.read() == b'plain'
+
+
+def test_open_compressed_invalid():
+    data = compress_section(DATA, ELFCLASS64)
+    with pytest.raises(InvalidElfError):
+        decompress_section(data[:len(data) // 2], ELFCLASS64)
+    with pytest.raises(InvalidElfError):
+        decompress_section(data[:24] + b'\xff' * 0x10, ELFCLASS64)
+    with pytest.raises(InvalidElfError):
+        open_compressed(b'\x02' + data[1:], ELFCLASS64)
@@ -0,0 +1,89 @@
+import pytest
+
+from simpleelf.elf_codecs import ElfCounts, get_elf_codecs
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_structs import get_elf_structs
+from simpleelf.exceptions import InvalidElfError
+from tests.elf_helpers import TEXT_ADDRESS, build_elf, make_malformed, to_extended_numbering
+
+
+def test_get_elf_structs_is_cached():
+    assert get_elf_structs('<') is get_elf_structs('<')
+    assert get_elf_structs('<') is not get_elf_structs('>')
+    assert get_elf_structs('<', compiled=True) is not get_elf_structs('<')
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('endianity', ['<', '>'])
+def test_compiled_structs(elf_class, endianity):
+    elf = build_elf(elf_class, endianity)
+    structs = get_elf_structs(endianity)
+    compiled = get_elf_structs(endianity, compiled=True)
+    name = 'Elf32' if elf_class == ELFCLASS32 else 'Elf64'
+
+    for struct_name in (f'{name}_Ehdr', f'{name}_PhdrEntry', f'{name}_ShdrEntry'):
+        parsed = getattr(structs, struct_name).parse(elf)
+        assert getattr(compiled, struct_name).parse(elf) == parsed
+        assert getattr(compiled, struct_name).build(parsed) == getattr(structs, struct_name).build(parsed)
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('endianity', ['<', '>'])
+def test_codecs(elf_class, endianity):
+    elf = build_elf(elf_class, endianity)
+    parsed = get_elf_structs(endianity).Elf32.parse(elf) if elf_class == ELFCLASS32 else \
+        get_elf_structs(endianity).Elf64.parse(elf)
+    codecs = get_elf_codecs(elf_class, endianity)
+
+    ehdr = codecs.unpack_ehdr(elf)
+    assert ehdr.e_ident == codecs.make_ident()
+    assert ehdr.e_entry == parsed.header.e_entry == TEXT_ADDRESS
+    assert ehdr.e_phnum == parsed.header.e_phnum
+    assert codecs.pack_ehdr(ehdr) == elf[:codecs.ehdr.size]
+
+    phdrs = list(codecs.iter_phdrs(elf, ehdr.e_phoff, ehdr.e_phnum))
+    assert [phdr.p_vaddr for phdr in phdrs] == [segment.p_vaddr for segment in parsed.segments]
+    assert [phdr.p_offset for phdr in phdrs] == [segment.p_offset for segment in parsed.segments]
+    assert codecs.unpack_phdr(elf, ehdr.e_phoff) == phdrs[0]
+    assert codecs.pack_phdr(phdrs[1]) == elf[ehdr.e_phoff + ehdr.e_phentsize:ehdr.e_phoff + 2 * ehdr.e_phentsize]
+
+    shdrs = list(codecs.iter_shdrs(elf, ehdr.e_shoff, ehdr.e_shnum))
+    assert [shdr.sh_addr for shdr in shdrs] == [section.sh_addr for section in parsed.sections]
+    assert codecs.pack_shdr(shdrs[1]) == elf[ehdr.e_shoff + ehdr.e_shentsize:ehdr.e_shoff + 2 * ehdr.e_shentsize]
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('extended', [False, True])
+def test_build_structs_without_section0(elf_class, extended):
+    elf = build_elf(elf_class, '<')
+    if extended:
+        elf = to_extended_numbering(elf)
+
+    structs = get_elf_structs('<')
+    name = 'Elf32' if elf_class == ELFCLASS32 else 'Elf64'
+    for struct_name in (name, f'{name}Headers'):
+        parsed = getattr(structs, struct_name).parse(elf)
+        built = getattr(structs, struct_name).build(
+            dict(header=parsed.header, segments=parsed.segments, sections=parsed.sections))
+        assert getattr(structs, struct_name).parse(built) == parsed
+        if struct_name == name:
+            assert built == elf
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('endianity', ['<', '>'])
+def test_unpack_counts_extended_numbering(elf_class, endianity):
+    elf = build_elf(elf_class, endianity)
+    codecs = get_elf_codecs(elf_class, endianity)
+    counts = codecs.unpack_counts(elf, codecs.unpack_ehdr(elf))
+    assert counts == ElfCounts(2, 4, 3)
+
+    extended = to_extended_numbering(elf)
+    assert codecs.unpack_counts(extended, codecs.unpack_ehdr(extended)) == counts
+
+
+def test_unpack_counts_malformed():
+    elf = make_malformed(build_elf(ELFCLASS64))
+    codecs = get_elf_codecs(ELFCLASS64)
+    with pytest.raises(InvalidElfError):
+        codecs.unpack_counts(elf, codecs.unpack_ehdr(elf))
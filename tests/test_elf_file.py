@@ -0,0 +1,85 @@
+import pytest
+
+from simpleelf import elf_file
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_file import ElfFile
+from simpleelf.exceptions import InvalidElfError
+from tests.elf_helpers import DATA_ADDRESS, DATA_BUFFER, TEXT_ADDRESS, TEXT_BUFFER, build_elf, make_malformed, \
+    to_extended_numbering
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('endianity', ['<', '>'])
+def test_read_elf_file(tmp_path, elf_class, endianity):
+    path = tmp_path / 'test.elf'
+    path.write_bytes(build_elf(elf_class, endianity))
+
+    with ElfFile(path) as elf:
+        assert elf.elf_class == elf_class
+        assert elf.endianity == endianity
+        assert elf.header.e_machine == elf.structs.Elf_Machine.EM_ARM
+        assert elf.header.e_entry == TEXT_ADDRESS
+        assert elf.segment_count == 2
+        assert elf.segment(1).p_vaddr == DATA_ADDRESS
+        assert elf.segment_container(1).p_vaddr == DATA_ADDRESS
+        assert list(elf.segments()) == [elf.segment(0), elf.segment(1)]
+
+        data = elf.segment_data(0)
+        assert isinstance(data, memoryview)
+        assert data == TEXT_BUFFER
+        data.release()
+        assert bytes(elf.segment_data(1)) == DATA_BUFFER
+
+        text = elf.find_section('.text')
+        assert bytes(elf.section_data(text)) == b'CODECODE'
+        bss = elf.find_section('.bss')
+        assert elf.section(bss).sh_size == 0x200
+        assert elf.section_container(bss).sh_type == elf.structs.Elf_SectionType.SHT_NOBITS
+        assert len(elf.section_data(bss)) == 0
+        assert elf.find_section('.missing') is None
+
+
+def test_read_elf_buffer():
+    elf = ElfFile.from_buffer(build_elf(ELFCLASS64, '<'))
+    assert [bytes(elf.segment_data(i)) for i in range(elf.segment_count)] == [TEXT_BUFFER, DATA_BUFFER]
+    assert [segment.p_vaddr for segment in elf.segments()] == [TEXT_ADDRESS, DATA_ADDRESS]
+
+
+def test_read_invalid_elf():
+    with pytest.raises(InvalidElfError):
+        ElfFile.from_buffer(b'\x7fELG' + b'\x00' * 60)
+
+    elf = ElfFile.from_buffer(build_elf(ELFCLASS32, '<')[:0x40])
+    with pytest.raises(InvalidElfError):
+        elf.segment_data(0)
+
+
+def test_read_invalid_elf_file_closed(tmp_path, monkeypatch):
+    opened = []
+
+    def recording_open(*args, **kwargs):
+        f = open(*args, **kwargs)
+        opened.append(f)
+        return f
+
+    monkeypatch.setattr(elf_file, 'open', recording_open, raising=False)
+    path = tmp_path / 'test.elf'
+    path.write_bytes(b'\x7fELF\x05' + b'\x00' * 0x40)
+    with pytest.raises(InvalidElfError):
+        ElfFile(path)
+    assert len(opened) == 1
+    assert opened[0].closed
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+def test_read_extended_numbering(elf_class):
+    with ElfFile.from_buffer(to_extended_numbering(build_elf(elf_class))) as elf:
+        assert (elf.segment_count, elf.section_count) == (2, 4)
+        assert elf.segment(1).p_vaddr == DATA_ADDRESS
+        assert elf.find_section('.bss') == 2
+        assert elf.section_name(3) == '.strtab'
+
+
+def test_read_extended_numbering_malformed():
+    with pytest.raises(InvalidElfError):
+        ElfFile.from_buffer(make_malformed(build_elf(ELFCLASS64)))
@@ -0,0 +1,66 @@
+import pytest
+
+from simpleelf import elf_consts
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_file import ElfFile
+from simpleelf.elf_image import ElfImage
+from simpleelf.elf_structs import ElfStructs
+from tests.elf_helpers import make_builder
+
+
+def build_image(elf_class: int, endianity: str) -> bytes:
+    e = make_builder(elf_class, endianity)
+    e.add_segment(0x101000, bytes(range(256)) * 0x20, elf_consts.PF_R | elf_consts.PF_X)
+    # adjacent segment, zero-filled past its contents
+    e.add_segment(0x103000, b'\x11\x22\x33\x44\x55\x66\x77\x88', elf_consts.PF_R | elf_consts.PF_W, memsz=0x2000)
+    e.add_segment(0x110000, b'far', elf_consts.PF_R)
+    return e.build()
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('endianity', ['<', '>'])
+def test_read(elf_class, endianity):
+    elf_raw = build_image(elf_class, endianity)
+    parsed = getattr(ElfStructs(endianity), 'Elf32' if elf_class == ELFCLASS32 else 'Elf64').parse(elf_raw)
+    elf = ElfFile.from_buffer(elf_raw)
+
+    for image in (ElfImage.from_elf_file(elf), ElfImage.from_parsed(parsed), ElfImage.from_elf_file(elf, page_size=7)):
+        assert image.read(0x101010, 4) == b'\x10\x11\x12\x13'
+        # crossing into the next segment
+        assert image.read(0x102ffe, 4) == b'\xfe\xff\x11\x22'
+        assert image.read(0x103006, 4) == b'\x77\x88\x00\x00'
+        assert image.read(0x104ffc, 4) == b'\x00' * 4
+        assert image.read(0x110000, 3) == b'far'
+
+        expected = 0x88776655 if endianity == '<' else 0x55667788
+        assert image.read_u32(0x103004) == expected
+        assert image.read_u64(0x103000) & 0xffffffff == (expected if endianity == '>' else 0x44332211)
+        assert image.read_u16(0x101000) == (0x100 if endianity == '<' else 0x1)
+
+        buffer = bytearray(0x2008)
+        assert image.readinto(0x102ff8, memoryview(buffer)) == 0x2008
+        assert buffer == bytes(range(0xf8, 0x100)) + b'\x11\x22\x33\x44\x55\x66\x77\x88' + b'\x00' * 0x1ff8
+
+        assert image.is_mapped(0x104fff)
+        assert not image.is_mapped(0x105000)
+        with pytest.raises(ValueError):
+            image.read(0x104ffc, 8)
+        with pytest.raises(ValueError):
+            image.read(0x108000, 1)
+
+    elf.close()
+
+
+def test_page_cache():
+    image = ElfImage.from_elf_file(ElfFile.from_buffer(build_image(ELFCLASS64, '<')), page_size=0x100, cache_size=4)
+    image.read(0x101000, 0x10)
+    image.read(0x101010, 0x10)
+    assert image.cache_info() == (1, 1, 4, 1)
+
+    image.read(0x101000, 0x800)
+    info = image.cache_info()
+    assert info.currsize == 4
+    assert info.misses == 8
+
+    image.cache_clear()
+    assert image.cache_info() == (0, 0, 4, 0)
@@ -0,0 +1,111 @@
+import pytest
+
+from simpleelf import elf_consts
+from simpleelf.elf_builder import ElfBuilder
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_file import ElfFile
+from simpleelf.elf_patcher import ElfPatcher
+from simpleelf.exceptions import InvalidElfError
+from tests.elf_helpers import build_elf, make_malformed, to_extended_numbering
+
+
+@pytest.fixture(params=[(ELFCLASS32, '<'), (ELFCLASS64, '>')])
+def elf_path(request, tmp_path):
+    elf_class, endianity = request.param
+    e = ElfBuilder(elf_class)
+    e.set_endianity(endianity)
+    e.set_entry(0x1000)
+    e.add_segment(0x1000, b'CODE' * 0x40, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment(0x8000, b'DATA' * 0x10, elf_consts.PF_R | elf_consts.PF_W, memsz=0x1000)
+    e.add_code_section(0x1000, 0x100, name='.text')
+    path = tmp_path / 'test.elf'
+    e.write_to(path)
+    return path
+
+
+def test_patch_fields(elf_path):
+    original = elf_path.read_bytes()
+    with ElfPatcher(elf_path) as patcher:
+        patcher.set_entry(0x1010)
+        patcher.set_segment(1, p_flags=elf_consts.PF_R)
+        patcher.set_section(1, sh_addr=0x1004)
+        with pytest.raises(IndexError):
+            patcher.set_segment(2, p_flags=0)
+
+    patched = elf_path.read_bytes()
+    assert len(patched) == len(original)
+    with ElfFile(elf_path) as elf:
+        assert elf.header.e_entry == 0x1010
+        assert elf.segment(1).p_flags == elf_consts.PF_R
+        assert elf.section(1).sh_addr == 0x1004
+        # nothing but the headers changed
+        headers_end = elf.header.e_phoff + elf.segment_count * elf.header.e_phentsize
+        assert patched[headers_end:elf.header.e_shoff] == original[headers_end:elf.header.e_shoff]
+
+
+def test_patch_data(elf_path):
+    size = elf_path.stat().st_size
+    with ElfPatcher(elf_path) as patcher:
+        patcher.write(0x1004, b'PTCH')
+        assert patcher.read(0x1000, 8) == b'CODEPTCH'
+        assert patcher.read(0x8030, 0x20) == b'DATA' * 4 + b'\x00' * 0x10
+        assert patcher.find_offset(0x8100) is None
+        with pytest.raises(ValueError):
+            patcher.write(0x8ffe, b'1234')
+        with pytest.raises(ValueError):
+            patcher.write(0x5000, b'1234')
+    assert elf_path.stat().st_size == size
+
+    with ElfFile(elf_path) as elf:
+        assert bytes(elf.segment_data(0)[:8]) == b'CODEPTCH'
+
+
+def test_patch_relayout(elf_path):
+    with ElfPatcher(elf_path) as patcher:
+        # growing into the zero-filled part of the segment
+        patcher.write(0x8100, b'GROW')
+        # growing past the end of the segment's memory
+        patcher.replace_segment_data(0, b'NEW!' * 0x80)
+        strtab = patcher.section(2)
+        with ElfFile(elf_path) as elf:
+            names = bytes(elf.section_data(2))
+        patcher.replace_section_data(2, names + b'.more\x00')
+        assert patcher.section(2).sh_offset > strtab.sh_offset
+        assert patcher.read(0x8100, 4) == b'GROW'
+
+    with ElfFile(elf_path) as elf:
+        text = elf.segment(0)
+        assert text.p_offset % text.p_align == text.p_vaddr % text.p_align
+        assert (text.p_filesz, text.p_memsz) == (0x200, 0x200)
+        assert bytes(elf.segment_data(0)) == b'NEW!' * 0x80
+        # the section inside the segment follows it
+        assert elf.section(1).sh_offset == text.p_offset
+        assert bytes(elf.section_data(1)[:4]) == b'NEW!'
+
+        data = elf.segment(1)
+        assert (data.p_filesz, data.p_memsz) == (0x104, 0x1000)
+        assert bytes(elf.segment_data(1)) == b'DATA' * 0x10 + b'\x00' * 0xc0 + b'GROW'
+        assert elf.section_name(1) == '.text'
+        assert bytes(elf.section_data(2)).endswith(b'.more\x00')
+
+
+def test_patch_extended_numbering(tmp_path):
+    path = tmp_path / 'test.elf'
+    path.write_bytes(to_extended_numbering(build_elf(ELFCLASS64)))
+
+    with ElfPatcher(path) as patcher:
+        assert (patcher.segment_count, patcher.section_count) == (2, 4)
+        assert patcher.section(3).sh_type == elf_consts.SHT_STRTAB
+        patcher.set_section(2, sh_size=0x400)
+    with ElfFile(path) as elf:
+        assert elf.section_name(2) == '.bss'
+        assert elf.section(2).sh_size == 0x400
+
+
+def test_patch_extended_numbering_malformed(tmp_path):
+    path = tmp_path / 'malformed.elf'
+    path.write_bytes(make_malformed(build_elf(ELFCLASS64)))
+
+    with ElfPatcher(path) as patcher:
+        with pytest.raises(InvalidElfError):
+            patcher.section(0)
@@ -0,0 +1,82 @@
+import struct
+
+import pytest
+
+from simpleelf import elf_consts, elf_relocations
+from simpleelf.elf_builder import ElfBuilder
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_file import ElfFile
+from simpleelf.elf_patcher import ElfPatcher
+from simpleelf.elf_relocations import Relocation, Relocations, iter_relocations, relocation_info
+from simpleelf.exceptions import InvalidElfError
+
+R_X86_64_64 = 1
+R_X86_64_RELATIVE = 8
+
+
+@pytest.fixture(params=[True, False], ids=['numpy', 'array'])
+def numpy(request, monkeypatch):
+    if not request.param:
+        monkeypatch.setattr(elf_relocations, 'np', None)
+    elif elf_relocations.np is None:
+        pytest.skip('numpy is not installed')
+    return request.param
+
+
+def pack_relocations(relocations, elf_class: int, endianity: str, rela: bool) -> bytes:
+    word = 'I' if elf_class == ELFCLASS32 else 'Q'
+    signed = word.lower()
+    entry = struct.Struct(endianity + (word + word + signed if rela else word + word))
+    return b''.join(entry.pack(offset, relocation_info(symbol, type_, elf_class), *([addend] if rela else []))
+                    for offset, type_, symbol, addend in relocations)
+
+
+def make_relocations(count: int):
+    return [Relocation(offset=0x1000 + i * 8, type=R_X86_64_64 if i % 3 else R_X86_64_RELATIVE, symbol=i % 5,
+                       addend=-i if i % 2 else i) for i in range(count)]
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('endianity', ['<', '>'])
+@pytest.mark.parametrize('rela', [True, False])
+def test_decode(numpy, elf_class, endianity, rela):
+    expected = make_relocations(100)
+    if not rela:
+        expected = [relocation._replace(addend=None) for relocation in expected]
+
+    relocations = Relocations.decode(pack_relocations(expected, elf_class, endianity, rela), elf_class, endianity,
+                                     rela=rela)
+    assert len(relocations) == 100
+    assert list(relocations) == expected
+    assert relocations[7] == expected[7]
+    assert list(relocations.types[:3]) == [R_X86_64_RELATIVE, R_X86_64_64, R_X86_64_64]
+    assert list(relocations.symbols[:6]) == [0, 1, 2, 3, 4, 0]
+
+    filtered = relocations.filter(types=[R_X86_64_RELATIVE], symbols=[0, 1])
+    assert list(filtered) == [relocation for relocation in expected
+                              if relocation.type == R_X86_64_RELATIVE and relocation.symbol in (0, 1)]
+    assert len(relocations.filter(symbols=[4])) == 20
+    assert len(relocations.filter()) == 100
+
+    with pytest.raises(InvalidElfError):
+        Relocations.decode(b'\x00' * 5, elf_class, endianity, rela=rela)
+
+
+def test_from_section(numpy, tmp_path):
+    expected = make_relocations(10)
+    path = tmp_path / 'test.elf'
+    e = ElfBuilder(ELFCLASS64)
+    e.add_segment(0x1000, b'\x00' * 0x100, elf_consts.PF_R | elf_consts.PF_W)
+    e.add_empty_data_section(0x2000, 0x10, name='.rela.dyn')
+    e.write_to(path)
+
+    with ElfPatcher(path) as patcher:
+        patcher.set_section(1, sh_type=elf_consts.SHT_RELA, sh_entsize=24, sh_flags=elf_consts.SHF_ALLOC)
+        patcher.replace_section_data(1, pack_relocations(expected, ELFCLASS64, '<', rela=True))
+
+    with ElfFile(path) as elf:
+        tables = list(iter_relocations(elf))
+        assert [index for index, _ in tables] == [1]
+        assert list(tables[0][1]) == expected
+        with pytest.raises(ValueError):
+            Relocations.from_section(elf, 2)
@@ -0,0 +1,67 @@
+import pytest
+
+from simpleelf import elf_consts, elf_symbols
+from simpleelf.elf_builder import symbol_info
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_file import ElfFile
+from simpleelf.elf_structs import get_elf_structs
+from simpleelf.elf_symbols import Symbol, SymbolIndex, get_symbol_index
+from tests.elf_helpers import make_builder
+
+FUNC = symbol_info(elf_consts.STB_GLOBAL, elf_consts.STT_FUNC)
+LOCAL_FUNC = symbol_info(elf_consts.STB_LOCAL, elf_consts.STT_FUNC)
+
+
+def check_index(index: SymbolIndex):
+    assert index.symbolize(0x100000)[0].name == 'outer'
+    assert index.symbolize(0x100018) == (index.lookup('inner'), 8)
+    assert index.symbolize(0x100020) == (index.lookup('outer'), 0x20)
+    assert index.symbolize(0x100234) == (index.lookup('label'), 0x34)
+    assert index.symbolize(0x100310)[0].value == 0x100300
+    assert index.symbolize(0x100330) is None, 'a sized symbol ending before the address is closer than the label'
+    assert index.symbolize(0xfffff) is None
+    assert index.lookup('helper').value == 0x100400, 'global symbols are preferred over local ones'
+    assert index.lookup('missing') is None
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('endianity', ['<', '>'])
+def test_symbol_index(tmp_path, elf_class, endianity):
+    e = make_builder(elf_class, endianity)
+    e.add_segment(0x100000, b'\x00' * 0x1000, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_code_section(0x100000, 0x1000, name='.text.symbols')
+    e.add_symbols(['outer', 'inner', 'label', 'helper', 'helper'], [0x100000, 0x100010, 0x100200, 0x100300, 0x100400],
+                  sizes=[0x100, 0x10, 0, 0x20, 0x20], infos=[FUNC, FUNC, FUNC, LOCAL_FUNC, FUNC])
+    elf = e.build()
+
+    path = tmp_path / 'test.elf'
+    path.write_bytes(elf)
+    with ElfFile(path) as elf_file:
+        index = elf_file.symbol_index()
+        assert elf_file.symbol_index() is index
+        assert get_symbol_index(elf_file) is index
+        check_index(index)
+        del index
+
+    structs = get_elf_structs(endianity)
+    parsed = structs.Elf32.parse(elf) if elf_class == ELFCLASS32 else structs.Elf64.parse(elf)
+    index = get_symbol_index(parsed)
+    assert get_symbol_index(parsed) is index
+    check_index(index)
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_symbolize_many(monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(elf_symbols, 'np', None)
+    elif elf_symbols.np is None:
+        pytest.skip('numpy is not installed')
+
+    symbols = [Symbol(f'func{i}', 0x10000 + i * 0x10, 0x10, FUNC, shndx=1) for i in range(1000)]
+    symbols.append(Symbol('big', 0x10000, 0x100000, FUNC, shndx=1))
+    index = SymbolIndex(symbols)
+
+    addresses = list(range(0xf000, 0x20000, 0x7))
+    assert index.symbolize_many(addresses) == [index.symbolize(address) for address in addresses]
+    assert index.symbolize_many([0x10005])[0] == (symbols[0], 5)
+    assert index.symbolize(0x20000) == (symbols[-1], 0x10000)
@@ -0,0 +1,49 @@
+import pytest
+
+from simpleelf import elf_consts
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_file import ElfFile
+from tests.elf_helpers import BSS_SIZE, DATA_ADDRESS, TEXT_ADDRESS, make_builder
+
+np = pytest.importorskip('numpy')
+
+from simpleelf.elf_tables import table_dtype, to_numpy, to_records  # noqa: E402
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('endianity', ['<', '>'])
+def test_to_numpy(tmp_path, elf_class, endianity):
+    e = make_builder(elf_class, endianity)
+    for i in range(98):
+        e.add_segment(0x10000 * (i + 1), b'\x00' * (i + 1), elf_consts.PF_R | (i % 2) * elf_consts.PF_X)
+    elf_raw = e.build()
+    path = tmp_path / 'test.elf'
+    path.write_bytes(elf_raw)
+
+    with ElfFile(path) as elf:
+        segments = elf.to_numpy()
+        sections = elf.to_records('sections')
+        expected_segments = [tuple(getattr(entry, field) for field in segments.dtype.names) for entry in elf.segments()]
+        expected_sections = [tuple(getattr(entry, field) for field in sections.dtype.names) for entry in elf.sections()]
+
+    assert segments.dtype['p_vaddr'] == np.dtype(endianity + ('u4' if elf_class == ELFCLASS32 else 'u8'))
+    assert len(segments) == 100
+    assert segments.tolist() == expected_segments
+    assert sections.tolist() == expected_sections
+    assert list(segments['p_vaddr'][:3]) == [TEXT_ADDRESS, DATA_ADDRESS, 0x10000]
+    assert (segments['p_flags'] & elf_consts.PF_X).sum() == 50
+    assert sections.sh_size[2] == BSS_SIZE
+
+    assert to_numpy(elf_raw).tolist() == expected_segments
+    assert to_records(elf_raw, 'sections').sh_type.tolist() == [entry[1] for entry in expected_sections]
+
+
+def test_table_dtype():
+    dtype = table_dtype(ELFCLASS64, '>', 'segments')
+    assert dtype.names == ('p_type', 'p_flags', 'p_offset', 'p_vaddr', 'p_paddr', 'p_filesz', 'p_memsz', 'p_align')
+    assert dtype.itemsize == 0x38
+    assert dtype['p_vaddr'] == np.dtype('>u8')
+    # bigger entries than the standard ones are skipped over
+    assert table_dtype(ELFCLASS32, '<', 'sections', entry_size=0x40).itemsize == 0x40
+    with pytest.raises(ValueError):
+        table_dtype(ELFCLASS32, '<', 'symbols')
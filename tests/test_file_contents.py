@@ -0,0 +1,96 @@
+import mmap
+import os
+from io import BytesIO
+
+import pytest
+
+from simpleelf import elf_consts, file_contents
+from simpleelf.elf_builder import ElfBuilder
+from simpleelf.elf_consts import ELFCLASS64
+from simpleelf.file_contents import FileContents
+
+DUMP = bytes(range(256)) * 0x40
+
+
+@pytest.fixture
+def dump_path(tmp_path):
+    path = tmp_path / 'dump.bin'
+    path.write_bytes(DUMP)
+    return path
+
+
+def test_file_contents(dump_path):
+    contents = FileContents(dump_path, 0x100, 0x200)
+    assert len(contents) == 0x200
+    assert bytes(contents) == DUMP[0x100:0x300]
+    assert contents[0x10:0x20] == DUMP[0x110:0x120]
+    assert contents[0x1f0:0x1000] == DUMP[0x2f0:0x300]
+    assert contents[5] == DUMP[0x105]
+    assert contents[-1] == DUMP[0x2ff]
+    assert b''.join(contents.iter_chunks(0x10, chunk_size=0x30)) == DUMP[0x110:0x300]
+
+    assert len(FileContents(dump_path, 0x1000)) == len(DUMP) - 0x1000
+
+    with pytest.raises(ValueError):
+        FileContents(dump_path, 0x100, len(DUMP))
+
+
+def test_file_contents_write_to(dump_path, tmp_path, monkeypatch):
+    contents = FileContents(dump_path, 0x10, 0x1000)
+
+    buf = BytesIO()
+    buf.write(b'header')
+    contents.write_to(buf)
+    assert buf.getvalue() == b'header' + DUMP[0x10:0x1010]
+
+    def unsupported(*args):
+        raise OSError('unsupported')
+
+    for patched in (None, '_copy_file_range', 'both'):
+        if patched == '_copy_file_range':
+            monkeypatch.setattr(file_contents, '_copy_file_range', unsupported)
+        elif patched == 'both':
+            monkeypatch.setattr(file_contents, '_sendfile', unsupported)
+
+        path = tmp_path / 'out.bin'
+        with open(path, 'wb') as f:
+            f.write(b'header')
+            contents.write_to(f)
+            f.write(b'footer')
+        assert path.read_bytes() == b'header' + DUMP[0x10:0x1010] + b'footer'
+
+
+def test_build_with_file_backed_segments(dump_path, tmp_path):
+    def build(first, second):
+        e = ElfBuilder(ELFCLASS64)
+        e.add_segment(0x10000, first, elf_consts.PF_R | elf_consts.PF_X)
+        e.add_segment(0x20000, second, elf_consts.PF_R | elf_consts.PF_W)
+        e.add_code_section(0x10100, 0x100, name='.text')
+        return e
+
+    expected = build(DUMP, DUMP[0x1000:0x1800]).build()
+
+    e = build(FileContents(dump_path), FileContents(dump_path, 0x1000, 0x800))
+    assert e.build() == expected
+    e.write_to(tmp_path / 'out.elf')
+    assert (tmp_path / 'out.elf').read_bytes() == expected
+
+    e = ElfBuilder(ELFCLASS64)
+    e.add_segment_from_file(0x10000, dump_path, flags=elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment_from_file(0x20000, dump_path, 0x1000, 0x800, elf_consts.PF_R | elf_consts.PF_W)
+    e.add_code_section(0x10100, 0x100, name='.text')
+    assert e.build() == expected
+
+    offset, data = e.find_loaded_data(0x20010, 0x10)
+    assert data == DUMP[0x1010:0x1020]
+    assert expected[offset:offset + 0x10] == data
+
+    with open(dump_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        assert build(mapped, memoryview(mapped)[0x1000:0x1800]).build() == expected
+
+
+def test_file_contents_is_lazy(dump_path):
+    contents = FileContents(dump_path)
+    os.truncate(dump_path, 0x100)
+    with pytest.raises(EOFError):
+        b''.join(contents.iter_chunks())
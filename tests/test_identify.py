@@ -0,0 +1,61 @@
+import pytest
+
+from simpleelf import elf_consts
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_structs import ElfIdentity, identify, identify_many
+from simpleelf.exceptions import InvalidElfError
+from tests.elf_helpers import TEXT_ADDRESS, build_elf
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('endianity', ['<', '>'])
+def test_identify(tmp_path, elf_class, endianity):
+    elf = build_elf(elf_class, endianity)
+    expected = ElfIdentity(elf_class=elf_class, endianity=endianity, machine=elf_consts.EM_ARM,
+                           type=elf_consts.ET_EXEC, entry=TEXT_ADDRESS)
+
+    assert identify(elf) == expected
+
+    path = tmp_path / 'test.elf'
+    path.write_bytes(elf)
+    assert identify(path) == expected
+
+
+def test_identify_invalid():
+    with pytest.raises(InvalidElfError):
+        identify(b'MZ\x90\x00')
+    with pytest.raises(InvalidElfError):
+        identify(build_elf(ELFCLASS64, '<')[:20])
+
+
+def test_identify_many(tmp_path):
+    paths = []
+    for i, (elf_class, endianity) in enumerate([(ELFCLASS32, '<'), (ELFCLASS64, '>')]):
+        path = tmp_path / f'{i}.elf'
+        path.write_bytes(build_elf(elf_class, endianity))
+        paths.append(path)
+    not_elf = tmp_path / 'not_elf'
+    not_elf.write_bytes(b'hello')
+    paths.append(not_elf)
+
+    results = list(identify_many(paths))
+    assert [path for path, _ in results] == paths
+    assert results[0][1].elf_class == ELFCLASS32
+    assert results[1][1].endianity == '>'
+    assert results[2][1] is None
+
+
+def test_identify_many_unreadable(tmp_path):
+    elf = tmp_path / 'test.elf'
+    elf.write_bytes(build_elf(ELFCLASS64, '<'))
+    unreadable = tmp_path / 'unreadable'
+    unreadable.write_bytes(b'\x7fELF')
+    unreadable.chmod(0)
+    directory = tmp_path / 'directory'
+    directory.mkdir()
+    paths = [directory, unreadable, tmp_path / 'missing', elf]
+
+    results = list(identify_many(paths))
+    assert [path for path, _ in results] == paths
+    assert [identity for _, identity in results[:3]] == [None, None, None]
+    assert results[3][1].elf_class == ELFCLASS64
@@ -0,0 +1,40 @@
+from simpleelf.interval_index import IntervalIndex
+
+
+def test_find():
+    index = IntervalIndex([(0x3000, 0x3100, 'c'), (0x1000, 0x1100, 'a'), (0x2000, 0x2001, 'b')])
+    assert len(index) == 3
+    assert [value for _, _, value in index] == ['a', 'b', 'c']
+    assert index.find(0x1000) == (0x1000, 0x1100, 'a')
+    assert index.find(0x10ff) == (0x1000, 0x1100, 'a')
+    assert index.find(0x1100) is None
+    assert index.find(0xfff) is None
+    assert index.find(0x2000)[2] == 'b'
+    assert index.find(0x4000) is None
+    assert IntervalIndex([]).find(0) is None
+
+
+def test_find_overlapping():
+    index = IntervalIndex([(0x1000, 0x5000, 'outer'), (0x2000, 0x2100, 'inner'), (0x3000, 0x3100, 'other')])
+    assert index.find(0x2050)[2] == 'inner'
+    assert index.find(0x2100)[2] == 'outer'
+    assert index.find(0x3200)[2] == 'outer'
+    assert index.find(0x5000) is None
+
+
+def test_find_many():
+    index = IntervalIndex([(0x1000, 0x1100, 'a'), (0x2000, 0x2100, 'b')])
+    assert [None if found is None else found[2] for found in index.find_many([0x2000, 0x0, 0x1050])] == \
+        ['b', None, 'a']
+
+
+def test_insert():
+    intervals = [(0x3000, 0x3100, 'c'), (0x1000, 0x5000, 'outer'), (0x2000, 0x2100, 'b'), (0x1000, 0x1100, 'a'),
+                 (0x6000, 0x6100, 'd')]
+    index = IntervalIndex([])
+    for interval in intervals:
+        index.insert(*interval)
+    expected = IntervalIndex(intervals)
+    assert list(index) == list(expected)
+    for address in range(0, 0x7000, 0x80):
+        assert index.find(address) == expected.find(address)
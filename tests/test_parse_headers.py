@@ -0,0 +1,73 @@
+import io
+
+import pytest
+
+from simpleelf import elf_consts
+from simpleelf.elf_consts import ELFCLASS32, ELFCLASS64
+from simpleelf.elf_structs import parse_headers, read_entry_data
+from simpleelf.exceptions import InvalidElfError
+from tests.elf_helpers import TEXT_ADDRESS, build_elf, make_builder, to_extended_numbering
+
+
+class CountingReader(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def build_big_elf(elf_class: int, endianity: str) -> bytes:
+    e = make_builder(elf_class, endianity)
+    e.add_segment(0x100000, b'\xcc' * 0x100000, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_code_section(0x100000, 0x100000, name='.big')
+    return e.build()
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+@pytest.mark.parametrize('endianity', ['<', '>'])
+def test_parse_headers(elf_class, endianity):
+    elf_raw = build_big_elf(elf_class, endianity)
+    stream = CountingReader(elf_raw)
+    headers = parse_headers(stream)
+
+    assert stream.bytes_read < 0x1000
+    assert 'data' not in headers.segments[2]
+    assert headers.segments[2].p_vaddr == 0x100000
+    assert [section.name for section in headers.sections] == ['', '.text', '.bss', '.big', '.strtab']
+
+    assert read_entry_data(stream, headers.segments[2]) == b'\xcc' * 0x100000
+    assert read_entry_data(stream, headers.sections[3]) == b'\xcc' * 0x100000
+    assert read_entry_data(stream, headers.sections[1]) == b'CODECODE'
+    assert read_entry_data(stream, headers.sections[2]) == b''
+
+    assert parse_headers(elf_raw) == headers
+
+
+def test_parse_headers_file(tmp_path):
+    path = tmp_path / 'test.elf'
+    path.write_bytes(build_big_elf(ELFCLASS64, '<'))
+    with open(path, 'rb') as f:
+        headers = parse_headers(f)
+        assert read_entry_data(f, headers.sections[3])[:4] == b'\xcc' * 4
+
+
+def test_parse_headers_truncated():
+    elf_raw = build_big_elf(ELFCLASS64, '<')
+    with pytest.raises(InvalidElfError):
+        parse_headers(elf_raw[:0x100])
+    headers = parse_headers(elf_raw)
+    with pytest.raises(InvalidElfError):
+        read_entry_data(io.BytesIO(elf_raw[:0x1000]), headers.segments[2])
+
+
+@pytest.mark.parametrize('elf_class', [ELFCLASS32, ELFCLASS64])
+def test_parse_headers_extended_numbering(elf_class):
+    parsed = parse_headers(to_extended_numbering(build_elf(elf_class)))
+    assert parsed.header.e_phnum == elf_consts.PN_XNUM
+    assert parsed.sections[0].sh_info == 2
+    assert parsed.segments[0].p_vaddr == TEXT_ADDRESS
+    assert [section.name for section in parsed.sections] == ['', '.text', '.bss', '.strtab']
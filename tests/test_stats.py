@@ -0,0 +1,89 @@
+import asyncio
+
+from simpleelf import elf_consts
+from simpleelf.aio import Limiter, parse_async
+from simpleelf.batch import summarize
+from simpleelf.elf_builder import ElfBuilder
+from simpleelf.elf_consts import ELFCLASS64
+from simpleelf.elf_file import ElfFile
+from simpleelf.elf_structs import parse_headers
+from simpleelf.stats import Stats
+
+
+def make_builder(tmp_path) -> ElfBuilder:
+    payload = tmp_path / 'payload.bin'
+    payload.write_bytes(b'P' * 0x1000)
+
+    e = ElfBuilder(ELFCLASS64)
+    e.add_segment(0x1000, b'CODE' * 0x40, elf_consts.PF_R | elf_consts.PF_X)
+    e.add_segment_from_file(0x8000, payload)
+    e.add_code_section(0x1000, 0x100, name='.text')
+    e.add_empty_data_section(0x10000, 0x100, name='.bss')
+    e.add_symbols(['main', 'payload'], [0x1000, 0x8000])
+    return e
+
+
+def test_build_stats(tmp_path):
+    e = make_builder(tmp_path)
+    reported = []
+    stats = Stats(callback=reported.append)
+    elf_raw = e.build(stats=stats)
+
+    assert elf_raw == e.build()
+    assert reported == [stats]
+    assert set(stats.timings) == {'layout', 'symtab', 'strtab', 'program_headers', 'section_headers', 'pack',
+                                  'write'}
+    assert stats.counters == {'segments': 2, 'sections': 5, 'symbols': 2, 'address_lookups': 3,
+                              'bytes_written': len(elf_raw), 'bytes_kernel_copied': 0}
+
+    stats = Stats()
+    e.write_to(tmp_path / 'test.elf', stats=stats)
+    assert stats.counters['bytes_written'] + stats.counters['bytes_kernel_copied'] == len(elf_raw)
+
+
+def test_parse_stats(tmp_path):
+    path = tmp_path / 'test.elf'
+    make_builder(tmp_path).write_to(path)
+
+    reported = []
+    stats = Stats(callback=reported.append)
+    with ElfFile(path, stats=stats) as elf:
+        list(elf.sections())
+        elf.segment(0)
+        elf.segment(0)
+        elf.symbol_index()
+    assert reported == [stats]
+    assert {'map', 'header', 'program_headers', 'section_headers', 'symbols'} <= set(stats.timings)
+    assert stats.counters == {'segments': 1, 'sections': 5}
+
+    stats = Stats()
+    summarize(path, stats=stats)
+    assert set(stats.timings) == {'header', 'program_headers', 'section_headers', 'section_names'}
+    assert stats.as_dict()['counters'] == {'segments': 2, 'sections': 5}
+
+
+def test_parse_headers_stats(tmp_path):
+    path = tmp_path / 'test.elf'
+    make_builder(tmp_path).write_to(path)
+
+    reported = []
+    stats = Stats(callback=reported.append)
+    with open(path, 'rb') as f:
+        parse_headers(f, stats=stats)
+    assert reported == [stats]
+    assert set(stats.timings) == {'parse', 'section_names'}
+    assert stats.counters == {'segments': 2, 'sections': 5}
+
+
+def test_parse_async_stats(tmp_path):
+    path = tmp_path / 'test.elf'
+    make_builder(tmp_path).write_to(path)
+
+    reported = []
+    stats = Stats(callback=reported.append)
+    limiter = Limiter()
+    asyncio.run(parse_async(path, limiter=limiter, stats=stats))
+    limiter.shutdown()
+    assert reported == [stats]
+    assert set(stats.timings) == {'parse'}
+    assert stats.counters == {'segments': 2, 'sections': 5}
@@ -0,0 +1,44 @@
+from simpleelf.string_table import StringTable
+
+
+def get_string(table: StringTable, offset: int) -> bytes:
+    data = bytes(table)
+    return data[offset:data.index(b'\x00', offset)]
+
+
+def test_string_table():
+    table = StringTable()
+    for name in ('.text', '.data', '.text', b'.bss', ''):
+        table.add(name)
+
+    assert bytes(table) == b'\x00.text\x00.data\x00.bss\x00'
+    assert len(table) == len(bytes(table))
+    assert table.offset('') == 0
+    assert table.offset('.text') == 1
+    assert table.offset(b'.data') == 7
+    assert '.bss' in table
+    assert '.rodata' not in table
+    assert list(table) == [b'.text', b'.data', b'.bss']
+
+
+def test_string_table_suffix_sharing():
+    names = ['.text', '.init.text', 'text', '.data', '.rel.data', '.init.data', '.bss']
+    table = StringTable(suffix_sharing=True)
+    for name in names:
+        table.add(name)
+
+    assert len(table) == len(b'\x00.init.text\x00.init.data\x00.rel.data\x00.bss\x00')
+    for name in names:
+        assert get_string(table, table.offset(name)) == name.encode()
+    assert table.offset('.text') == table.offset('.init.text') + len('.init')
+
+    # adding after the table was finalized
+    table.add('.exit.text')
+    table.add('.rodata')
+    for name in names + ['.exit.text', '.rodata']:
+        assert get_string(table, table.offset(name)) == name.encode()
+
+    table.suffix_sharing = False
+    assert len(table) == sum(len(name) + 1 for name in names + ['.exit.text', '.rodata']) + 1
+    for name in names + ['.exit.text', '.rodata']:
+        assert get_string(table, table.offset(name)) == name.encode()